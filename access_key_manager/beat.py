@@ -0,0 +1,68 @@
+import logging
+from django.conf import settings
+from django_celery_beat.schedulers import DatabaseScheduler
+from access_key_manager import metrics
+from access_key_manager.locks import Lease
+
+
+"""
+A beat scheduler that only sends tasks while it holds the beat leader lease.
+
+Every beat process runs `LeaderScheduler`, but only the one holding the `celery-beat-leader`
+lease sends due tasks; the others keep trying to acquire it. The leader renews the lease on
+every tick, at least every third of BEAT_LEADER_TTL, so a beat that dies or hangs is replaced
+within BEAT_LEADER_TTL seconds. Overlapping deploys therefore never run two active beats.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderScheduler(DatabaseScheduler):
+    """
+    The django-celery-beat `DatabaseScheduler`, active only while it holds the leader lease.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.lease = Lease('celery-beat-leader', settings.BEAT_LEADER_TTL)
+        self.is_leader = False
+        super().__init__(*args, **kwargs)
+
+    def hold_lease(self):
+        """
+        Renews the leader lease, or tries to acquire it if this beat is not the leader.
+
+        Returns:
+            bool: Whether this beat is the leader.
+        """
+        try:
+            leader = self.lease.renew() if self.is_leader else self.lease.acquire()
+        except Exception as e:
+            logger.error(f"Could not reach the beat leader lease: {str(e)}")
+            leader = False
+
+        if leader and not self.is_leader:
+            logger.info(f"This beat is now the leader (token {self.lease.token}).")
+            metrics.inc('beat_leader_changes_total', outcome='elected')
+            # Reload the last run times the previous leader saved
+            self._initial_read = True
+            self._heap = None
+        elif self.is_leader and not leader:
+            logger.warning('This beat lost the leader lease and stops sending tasks.')
+            metrics.inc('beat_leader_changes_total', outcome='lost')
+        self.is_leader = leader
+        return leader
+
+    def tick(self, *args, **kwargs):
+        renew_interval = settings.BEAT_LEADER_TTL / 3
+        if not self.hold_lease():
+            return renew_interval
+        return min(super().tick(*args, **kwargs), renew_interval)
+
+    def close(self):
+        super().close()
+        if self.is_leader:
+            try:
+                self.lease.release()
+            except Exception as e:
+                logger.error(f"Could not release the beat leader lease: {str(e)}")
+            self.is_leader = False
@@ -1,10 +1,15 @@
 from __future__ import absolute_import, unicode_literals
 import os
+import time
 from celery import Celery
+from celery.signals import before_task_publish, task_postrun, task_prerun
 from django.conf import settings
+from django.utils.dateparse import parse_datetime
 # from celery.schedules import schedule
 from datetime import timedelta
 from celery.schedules import crontab
+from kombu import Queue
+from kombu.exceptions import ChannelError
 
 
 
@@ -14,17 +19,151 @@ app = Celery('access_key_manager')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
 
-app.conf.beat_scheduler = 'django_celery_beat.schedulers:DatabaseScheduler'
+# Each workload has its own queue, consumed by its own worker pool (see Supervisord.conf, which
+# passes each pool the concurrency and prefetch multiplier below), so a long expiry sweep or
+# archive run never delays payment issuance or email. Every pool process holds its own database
+# connection, so the concurrencies count towards DB_MAX_CONNECTIONS. Tasks of the latency-sensitive queues are
+# acknowledged after they run, and redelivered if their worker dies, which is safe because they
+# are idempotent.
+QUEUES = {
+    'payments': {'concurrency': 4, 'prefetch_multiplier': 1, 'acks_late': True, 'soft_time_limit': 60, 'time_limit': 90},
+    'expiry': {'concurrency': 2, 'prefetch_multiplier': 1, 'acks_late': True, 'soft_time_limit': 600, 'time_limit': 660},
+    'email': {'concurrency': 2, 'prefetch_multiplier': 4, 'acks_late': True, 'soft_time_limit': 120, 'time_limit': 150},
+    'maintenance': {'concurrency': 1, 'prefetch_multiplier': 1, 'acks_late': False, 'soft_time_limit': 3600, 'time_limit': 3660},
+}
+
+TASK_QUEUES = {
+    'access_keys.tasks.issue_key_for_payment': 'payments',
+    'access_keys.tasks.expire_access_key': 'expiry',
+    'access_keys.tasks.update_key_statuses': 'expiry',
+    'users.tasks.send_outbox_emails': 'email',
+    'access_keys.tasks.rebuild_key_statistics': 'maintenance',
+    'access_keys.tasks.archive_old_key_logs': 'maintenance',
+    'access_keys.tasks.top_up_access_key_pool': 'maintenance',
+}
+
+app.conf.task_queues = [Queue(name) for name in QUEUES]
+app.conf.task_default_queue = 'maintenance'
+app.conf.task_routes = {task: {'queue': queue} for task, queue in TASK_QUEUES.items()}
+app.conf.task_annotations = {
+    task: {
+        'acks_late': QUEUES[queue]['acks_late'],
+        'reject_on_worker_lost': QUEUES[queue]['acks_late'],
+        'soft_time_limit': QUEUES[queue]['soft_time_limit'],
+        'time_limit': QUEUES[queue]['time_limit'],
+    }
+    for task, queue in TASK_QUEUES.items()
+}
+
+# Only the beat holding the leader lease sends tasks (see access_key_manager/beat.py)
+app.conf.beat_scheduler = 'access_key_manager.beat:LeaderScheduler'
 
 app.conf.beat_schedule = {
     'update_key_statuses': {
         'task': 'access_keys.tasks.update_key_statuses',
-        'schedule': crontab(),  # Run every minute
-        # 'schedule': crontab(minute=0, hour=0),  # Run every day at midnight
+        # Keys are expired by per-key timers; this sweep is only a safety net
+        'schedule': timedelta(minutes=settings.ACCESS_KEY_EXPIRY_SWEEP_MINUTES),
+    },
+    'rebuild_key_statistics': {
+        'task': 'access_keys.tasks.rebuild_key_statistics',
+        'schedule': crontab(minute=30, hour=2),  # Run every day at 02:30
+    },
+    'archive_old_key_logs': {
+        'task': 'access_keys.tasks.archive_old_key_logs',
+        'schedule': crontab(minute=0, hour=3),  # Run every day at 03:00
+    },
+    'top_up_access_key_pool': {
+        'task': 'access_keys.tasks.top_up_access_key_pool',
+        'schedule': timedelta(minutes=5),
+    },
+    'send_outbox_emails': {
+        'task': 'users.tasks.send_outbox_emails',
+        # Emails are normally sent as soon as they are queued; this picks up retries
+        'schedule': timedelta(minutes=1),
     },
 }
 
+def queue_lengths():
+    """
+    Returns the number of messages waiting in each queue. ETA tasks already prefetched by a
+    worker are not counted.
+
+    Raises:
+        Exception: If the broker cannot be reached after one retry.
+    """
+    lengths = {}
+    with app.connection_for_read() as connection:
+        connection.ensure_connection(max_retries=1)
+        channel = connection.default_channel
+        for name in QUEUES:
+            try:
+                lengths[name] = channel.queue_declare(queue=name, passive=True).message_count
+            except ChannelError:
+                lengths[name] = 0  # The broker drops empty queues
+    return lengths
+
+
+@before_task_publish.connect
+def stamp_published_at(headers=None, **kwargs):
+    # Lets the worker measure how long the task waited in its queue
+    headers['published_at'] = time.time()
+
+
+@task_prerun.connect
+def pin_task_to_primary(task=None, **kwargs):
+    # Tasks read what they or the request that queued them just wrote
+    from access_key_manager.db_router import pin_to_primary
+
+    task.request.primary_token = pin_to_primary()
+
+
+@task_postrun.connect
+def unpin_task(task=None, **kwargs):
+    from access_key_manager.db_router import unpin
+
+    token = getattr(task.request, 'primary_token', None)
+    if token is not None:
+        unpin(token)
+        task.request.primary_token = None
+
+
+@task_prerun.connect
+def record_queue_wait(task=None, **kwargs):
+    """
+    Records how long a task waited in its queue, counted from its ETA for scheduled tasks.
+    """
+    from access_key_manager import metrics
+
+    request = task.request
+    published_at = getattr(request, 'published_at', None)
+    if published_at is None:
+        return
+    ready_at = published_at
+    if request.eta:
+        eta = parse_datetime(request.eta) if isinstance(request.eta, str) else request.eta
+        if eta is not None:
+            ready_at = max(ready_at, eta.timestamp())
+    request.started_at = time.time()
+    queue = (request.delivery_info or {}).get('routing_key', 'unknown')
+    metrics.observe('celery_task_queue_wait_seconds', max(0.0, request.started_at - ready_at), queue=queue, task=task.name)
+
+
+@task_postrun.connect
+def record_task_duration(task=None, state=None, **kwargs):
+    """
+    Records how long a task ran, per queue, task and final state.
+    """
+    from access_key_manager import metrics
+
+    request = task.request
+    started_at = getattr(request, 'started_at', None)
+    if started_at is None:
+        return
+    queue = (request.delivery_info or {}).get('routing_key', 'unknown')
+    metrics.observe('celery_task_duration_seconds', time.time() - started_at, queue=queue, task=task.name, state=state or 'unknown')
+
+
 @app.task(bind=True)
 def debug_task(self):
     print('Request: {0!r}'.format(self.request))
-    
+
@@ -0,0 +1,128 @@
+import threading
+from celery.signals import task_failure, task_postrun, task_prerun
+from django.conf import settings
+from django.core import checks
+from django.core.signals import request_finished, request_started
+from django.db import DatabaseError, InterfaceError, OperationalError, close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from access_key_manager import metrics
+
+
+"""
+Persistent database connection management for gunicorn and Celery processes.
+
+Each gunicorn thread and Celery pool process keeps its connection for DB_CONN_MAX_AGE seconds,
+and Django checks it with a cheap query before reusing it after an error or between requests.
+Celery tasks get the same treatment: stale or broken connections are closed before each task,
+and every connection is dropped after a task fails on a connection error, so the next task
+reconnects. Each request and task is counted as a checkout on a 'new' or a 'reused' connection.
+"""
+
+_state = threading.local()
+
+
+def begin_unit(kind):
+    """
+    Starts counting the connections a request or task checks out.
+
+    Args:
+        kind (str): 'web' or 'celery'.
+    """
+    _state.kind = kind
+    _state.opened = set()
+    _state.reused = {conn.alias for conn in connections.all(initialized_only=True) if conn.connection is not None}
+
+
+def end_unit():
+    """
+    Records, per alias, whether the request or task reused a connection or opened a new one.
+    """
+    opened = getattr(_state, 'opened', None)
+    if opened is None:
+        return
+    for alias in opened:
+        metrics.inc('db_connection_checkouts_total', alias=alias, kind=_state.kind, outcome='new')
+    for alias in _state.reused - opened:
+        metrics.inc('db_connection_checkouts_total', alias=alias, kind=_state.kind, outcome='reused')
+    _state.opened = None
+
+
+def recycle_connections():
+    """
+    Closes every open connection of this thread, so the next query reconnects.
+    """
+    for conn in connections.all(initialized_only=True):
+        if conn.connection is None:
+            continue
+        try:
+            conn.close()
+        except DatabaseError:
+            pass  # Already broken
+        metrics.inc('db_connections_recycled_total', alias=conn.alias)
+
+
+def connection_budget():
+    """
+    Returns the number of connections the web and worker processes may hold per database.
+
+    Every gunicorn thread and Celery pool process holds up to one connection, and so does beat.
+    """
+    from access_key_manager.celery import QUEUES
+
+    web = settings.WEB_CONCURRENCY * settings.GUNICORN_THREADS
+    return web + sum(queue['concurrency'] for queue in QUEUES.values()) + 1
+
+
+@checks.register()
+def check_connection_budget(app_configs, **kwargs):
+    limit = settings.DB_MAX_CONNECTIONS
+    budget = connection_budget()
+    if limit and budget > limit:
+        return [checks.Warning(
+            f'The web and worker processes may hold {budget} database connections, more than DB_MAX_CONNECTIONS ({limit}).',
+            hint='Lower WEB_CONCURRENCY, GUNICORN_THREADS or the Celery queue concurrencies, or connect through a pooler.',
+            id='access_key_manager.W001',
+        )]
+    return []
+
+
+@receiver(connection_created)
+def count_new_connection(sender, connection, **kwargs):
+    metrics.inc('db_connections_opened_total', alias=connection.alias)
+    opened = getattr(_state, 'opened', None)
+    if opened is not None:
+        opened.add(connection.alias)
+
+
+@receiver(request_started)
+def begin_request(**kwargs):
+    begin_unit('web')
+
+
+@receiver(request_finished)
+def end_request(**kwargs):
+    end_unit()
+
+
+@task_prerun.connect
+def begin_task(task=None, **kwargs):
+    # Eager tasks run inside the caller's request or transaction, which owns the connection
+    if getattr(task.request, 'is_eager', False):
+        return
+    close_old_connections()
+    begin_unit('celery')
+
+
+@task_postrun.connect
+def end_task(task=None, **kwargs):
+    if not getattr(task.request, 'is_eager', False):
+        end_unit()
+
+
+@task_failure.connect
+def recycle_after_connection_error(sender=None, exception=None, **kwargs):
+    if getattr(sender.request, 'is_eager', False):
+        return
+    if isinstance(exception, (OperationalError, InterfaceError)):
+        recycle_connections()
@@ -0,0 +1,104 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+"""
+Routes read-only ORM queries to the DATABASE_REPLICAS, and everything else to the primary.
+
+Reads stay on the primary when they must see the latest writes:
+
+- inside a transaction on the primary,
+- for the rest of a request, Celery task or `use_primary` block once it has written,
+- for REPLICA_STICKY_SECONDS after a client's request wrote, through the cookie
+  `PrimaryStickinessMiddleware` sets, so a purchase or a revoke shows up on the next page,
+- in Celery tasks, which are pinned to the primary,
+- for the apps in REPLICA_PRIMARY_APPS, such as sessions.
+"""
+
+_use_primary = ContextVar('use_primary', default=False)
+_wrote = ContextVar('wrote', default=False)
+
+
+def pin_to_primary(pinned=True):
+    """
+    Pins the reads of the current context to the primary, or unpins them.
+
+    Returns:
+        Token: The token that restores the previous state with `unpin`.
+    """
+    return _use_primary.set(pinned)
+
+
+def unpin(token):
+    _use_primary.reset(token)
+
+
+def start_tracking_writes():
+    """
+    Starts recording whether the current context writes, for `has_written`.
+
+    Returns:
+        Token: The token that restores the previous state with `stop_tracking_writes`.
+    """
+    return _wrote.set(False)
+
+
+def stop_tracking_writes(token):
+    _wrote.reset(token)
+
+
+def has_written():
+    """
+    Returns whether the current context has written to the primary since it started tracking writes.
+    """
+    return _wrote.get()
+
+
+@contextmanager
+def use_primary():
+    """
+    Reads from the primary within the block.
+    """
+    token = pin_to_primary()
+    try:
+        yield
+    finally:
+        unpin(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads to a random replica unless they must see the latest writes, and writes and
+    migrations to the primary. Without replicas, every query goes to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas:
+            return None
+        if (
+            _use_primary.get()
+            or _wrote.get()
+            or model._meta.app_label in settings.REPLICA_PRIMARY_APPS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # Session and beat schedule writes are read from the primary anyway
+        if model._meta.app_label not in settings.REPLICA_PRIMARY_APPS:
+            _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
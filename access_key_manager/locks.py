@@ -0,0 +1,205 @@
+import logging
+import time
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.redis import RedisCache
+from access_key_manager import metrics
+
+
+"""
+Leases on named locks, held in the default cache (Redis in production), with fencing tokens.
+
+A lease is a key set with `add` (SET NX) and a TTL, so a holder that dies releases it when the
+TTL runs out. Every acquisition takes a new token from a per-lock counter, and the lease stores
+the token of its holder. A holder that stalls past its TTL and resumes sees another token in the
+lease, so `check_lease` stops it before it writes. `single_run` uses a lease to keep a Celery
+task from running concurrently with itself, and `access_key_manager.beat.LeaderScheduler` uses
+one to elect a single beat. The code run by `single_run` tasks (the key expiry sweep, the counter
+rebuild, the key log archiving and the key pool top-up) calls `check_lease` before it writes.
+"""
+
+logger = logging.getLogger(__name__)
+
+# Compare-and-set scripts, so a holder never renews or releases a lease taken over by another
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+LOCK_WAIT_BUCKETS = (0.001, 0.01, 0.1, 1.0, 5.0, 30.0, 60.0, 300.0, float('inf'))
+
+_current_lease = ContextVar('current_lease', default=None)
+
+
+class LeaseLost(Exception):
+    """
+    Raised when a lease has expired and been acquired by another holder.
+    """
+
+
+class Lease:
+    """
+    A lease on the lock `name`, valid for `ttl` seconds unless renewed.
+
+    Args:
+        name (str): The lock name.
+        ttl (float): The seconds the lease is valid after it is acquired or renewed.
+
+    Attributes:
+        token (int): The fencing token of the held lease, or None.
+    """
+
+    def __init__(self, name, ttl):
+        self.name = name
+        self.ttl = ttl
+        self.key = f'lease:{name}'
+        self.fence_key = f'lease:{name}:fence'
+        self.token = None
+
+    def _redis(self):
+        # The raw client, for the compare-and-set scripts; other backends fall back to get/set
+        if isinstance(cache, RedisCache):
+            return cache._cache.get_client(write=True)
+        return None
+
+    def _try_acquire(self):
+        # The lease is taken with the next token, and only then is the token issued from the
+        # counter, so polls that find the lease held do not use tokens up
+        cache.add(self.fence_key, 0, timeout=None)
+        token = (cache.get(self.fence_key) or 0) + 1
+        if not cache.add(self.key, token, timeout=self.ttl):
+            return None
+        issued = cache.incr(self.fence_key)
+        if issued != token:
+            # The counter moved on, e.g. it was evicted and re-created; hold the issued token
+            cache.set(self.key, issued, timeout=self.ttl)
+        return issued
+
+    def acquire(self, wait=0, poll_interval=0.1):
+        """
+        Acquires the lease, polling for up to `wait` seconds while another holder has it.
+
+        Returns:
+            bool: True if the lease was acquired.
+        """
+        deadline = time.monotonic() + wait
+        while True:
+            token = self._try_acquire()
+            if token is not None:
+                self.token = token
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_interval)
+
+    def holder(self):
+        """
+        Returns the fencing token of the current holder, or None.
+        """
+        return cache.get(self.key)
+
+    def is_held(self):
+        """
+        Returns whether this lease still holds the lock.
+        """
+        return self.token is not None and self.holder() == self.token
+
+    def renew(self):
+        """
+        Extends the held lease by its TTL.
+
+        Returns:
+            bool: False if the lease was lost in the meantime.
+        """
+        if self.token is None:
+            return False
+        client = self._redis()
+        if client is not None:
+            renewed = client.eval(RENEW_SCRIPT, 1, cache.make_key(self.key), self.token, int(self.ttl * 1000))
+        else:
+            renewed = self.is_held() and cache.touch(self.key, timeout=self.ttl)
+        if not renewed:
+            self.token = None
+        return bool(renewed)
+
+    def release(self):
+        """
+        Releases the lease if this lease still holds the lock.
+        """
+        if self.token is None:
+            return
+        client = self._redis()
+        if client is not None:
+            client.eval(RELEASE_SCRIPT, 1, cache.make_key(self.key), self.token)
+        elif self.is_held():
+            cache.delete(self.key)
+        self.token = None
+
+
+def check_lease():
+    """
+    Checks that the lease of the running `single_run` task is still held. Call it before each
+    batch of writes. Outside a `single_run` task it does nothing.
+
+    Raises:
+        LeaseLost: If the lease has expired and another run has acquired it.
+    """
+    lease = _current_lease.get()
+    if lease is not None and not lease.is_held():
+        raise LeaseLost(f"Lost the lease on {lease.name} (token {lease.token}, now held by {lease.holder()}).")
+
+
+def single_run(name=None, ttl=None, wait=0):
+    """
+    Keeps a task from running concurrently with itself, whatever the number of workers and beats.
+
+    A run that cannot acquire the lease within `wait` seconds is skipped and returns None. The
+    lease outlives the task's hard time limit, after which the worker kills the task, so a
+    worker that dies mid-run blocks the task for at most that long. Apply the decorator under
+    `shared_task`.
+
+    Args:
+        name (str, optional): The lock name. Defaults to the task's module and function name.
+        ttl (float, optional): The lease TTL. Defaults to the task's time limit plus a minute,
+            or TASK_LOCK_TTL.
+        wait (float): The seconds to wait for a running run to finish.
+    """
+    def decorator(func):
+        lock_name = name or f'{func.__module__}.{func.__name__}'
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            from celery import current_task
+
+            time_limit = getattr(current_task, 'time_limit', None)
+            lease = Lease(lock_name, ttl or (time_limit + 60 if time_limit else settings.TASK_LOCK_TTL))
+
+            started = time.monotonic()
+            acquired = lease.acquire(wait=wait)
+            metrics.observe('task_lock_wait_seconds', time.monotonic() - started, buckets=LOCK_WAIT_BUCKETS, lock=lock_name)
+            metrics.inc('task_lock_attempts_total', lock=lock_name, outcome='acquired' if acquired else 'skipped')
+            if not acquired:
+                logger.warning(f"{lock_name} is already running (lease held by token {lease.holder()}). Skipping this run.")
+                return None
+
+            context_token = _current_lease.set(lease)
+            try:
+                return func(*args, **kwargs)
+            except LeaseLost:
+                metrics.inc('task_lock_attempts_total', lock=lock_name, outcome='lost')
+                raise
+            finally:
+                _current_lease.reset(context_token)
+                lease.release()
+        return wrapper
+    return decorator
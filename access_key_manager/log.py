@@ -0,0 +1,191 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+"""
+Logging building blocks used by `settings.LOGGING`.
+
+Records are handed to a bounded in-memory queue by `NonBlockingHandler` and written by a
+background listener thread, so request threads and task workers never wait on disk I/O.
+"""
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of the records logged with `extra={'sample': True}`.
+
+    High-volume INFO and DEBUG lines, such as one line per expired key, opt in to sampling this
+    way. WARNING and above are always kept.
+
+    Args:
+        rate (float): The fraction of sampled records to keep, between 0 and 1.
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        if not getattr(record, 'sample', False) or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < self.rate
+
+
+class SizedTimedRotatingFileHandler(RotatingFileHandler):
+    """
+    A file handler that rotates when the file reaches `maxBytes` or when it is `interval`
+    seconds old, whichever comes first. Backups are numbered like RotatingFileHandler's.
+
+    Rotation is not coordinated between processes, so each process should log to its own file.
+    With `per_process`, the process id is added to the file name (debug.log becomes
+    debug.1234.log), and forked children switch to their own file in `after_fork`.
+    """
+
+    def __init__(self, filename, maxBytes=0, interval=0, backupCount=0, encoding=None, delay=False, per_process=False):
+        self.base_filename = os.fspath(filename)
+        self.per_process = per_process
+        super().__init__(self._process_filename(), maxBytes=maxBytes, backupCount=backupCount, encoding=encoding, delay=delay)
+        self.interval = interval
+        self.rollover_at = time.time() + interval if interval else None
+
+    def _process_filename(self):
+        if not self.per_process:
+            return self.base_filename
+        root, extension = os.path.splitext(self.base_filename)
+        return f'{root}.{os.getpid()}{extension}'
+
+    def after_fork(self):
+        """
+        Moves a per-process handler inherited by a forked child to the child's own file.
+        """
+        if not self.per_process:
+            return
+        if self.stream is not None:
+            self.stream.close()  # The parent's copy of the file stays open
+            self.stream = None
+        self.baseFilename = os.path.abspath(self._process_filename())
+        if self.interval:
+            self.rollover_at = time.time() + self.interval
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        if self.interval:
+            self.rollover_at = time.time() + self.interval
+
+
+class NonBlockingHandler(QueueHandler):
+    """
+    Hands records to a bounded queue that a background thread drains into the target handler.
+
+    The caller only merges the message arguments and enqueues the record; tracebacks are left to
+    the target handler's formatter. If the queue is full, e.g. because the disk is slow, the
+    record is dropped rather than blocking the caller; drops are counted in `dropped`. The
+    listener is restarted in forked children (Celery prefork and preloaded web workers) and
+    flushed at exit.
+
+    Args:
+        target (dict): The configuration of the target handler: 'class' is a dotted path and the
+            other items are passed to it.
+        target_formatter (str, optional): The dotted path of the target handler's formatter class.
+        target_level (str, optional): The level of the target handler.
+        queue_size (int, optional): The maximum number of queued records.
+    """
+
+    def __init__(self, target, target_formatter=None, target_level=None, queue_size=10000):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.queue_size = queue_size
+        self.dropped = 0
+        self.target = _build_handler(target, target_formatter, target_level)
+        self.listener = None
+        self.closed = False
+        self._start()
+        atexit.register(self._stop)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._restart_in_child)
+
+    def prepare(self, record):
+        # Unlike QueueHandler.prepare, leaves exc_info on the record, so the target's formatter
+        # renders the traceback in its own field instead of folding it into the message
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        self.listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+
+    def _stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        self.target.flush()
+
+    def _restart_in_child(self):
+        # The listener thread does not survive a fork
+        if self.closed:
+            return
+        if hasattr(self.target, 'after_fork'):
+            self.target.after_fork()
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.listener = None
+        self._start()
+
+    def close(self):
+        self.closed = True
+        self._stop()
+        self.target.close()
+        super().close()
+
+
+def _build_handler(config, formatter=None, level=None):
+    options = dict(config)
+    module_name, class_name = options.pop('class').rsplit('.', 1)
+    handler_class = getattr(__import__(module_name, fromlist=[class_name]), class_name)
+    handler = handler_class(**options)
+    if formatter:
+        module_name, class_name = formatter.rsplit('.', 1)
+        handler.setFormatter(getattr(__import__(module_name, fromlist=[class_name]), class_name)())
+    if level:
+        handler.setLevel(level)
+    return handler
@@ -0,0 +1,237 @@
+import atexit
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+from django.conf import settings
+import redis
+
+
+"""
+Process-wide metrics, aggregated across processes in a Redis hash and exposed in the Prometheus
+text format.
+
+Each process accumulates counter and histogram increments in memory, and a background thread adds
+them to the shared hash with one pipelined round trip every METRICS_FLUSH_INTERVAL seconds, so
+recording a value never waits on Redis, even while it is down, and the totals stay correct
+however many gunicorn workers or Celery processes contribute. Histogram buckets are stored per bucket and made cumulative when rendered.
+"""
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, float('inf'))
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, float('inf'))
+
+HISTOGRAM_SUFFIXES = ('_bucket', '_sum', '_count')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+@lru_cache(maxsize=4096)
+def _series(name, labels, le=''):
+    label_text = ','.join(f'{key}="{_escape(value)}"' for key, value in sorted(labels))
+    return f'{name}\t{label_text}\t{le}'
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms buffered in memory and flushed to a Redis hash.
+
+    The flushing thread is started by the first recorded value of each process, so forked
+    children (gunicorn and Celery prefork workers) start their own, with an empty buffer.
+
+    Args:
+        redis_url (str): The Redis instance holding the aggregated metrics.
+        key (str): The Redis hash holding the aggregated metrics.
+        flush_interval (float): The minimum number of seconds between flushes.
+    """
+
+    def __init__(self, redis_url, key, flush_interval):
+        self.redis_url = redis_url
+        self.key = key
+        self.flush_interval = flush_interval
+        self._pending = defaultdict(float)
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._client = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_in_child)
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        return self._client
+
+    def inc(self, name, value=1, **labels):
+        """
+        Adds `value` to the counter `name`, which should end in '_total'.
+        """
+        series = _series(name, tuple(labels.items()))
+        with self._lock:
+            self._pending[series] += value
+        self._start_flusher()
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        """
+        Records one observation of the histogram `name`.
+
+        Args:
+            name (str): The histogram name, e.g. 'http_request_duration_seconds'.
+            value (float): The observed value.
+            buckets (tuple): The ascending bucket bounds, ending with infinity.
+            **labels: The label values of the series.
+        """
+        bound = buckets[min(bisect.bisect_left(buckets, value), len(buckets) - 1)]
+        labels = tuple(labels.items())
+        # Series names are cached, so recording a value costs a few dict updates
+        bucket = _series(f'{name}_bucket', labels, _format_bound(bound))
+        total = _series(f'{name}_sum', labels)
+        count = _series(f'{name}_count', labels)
+        with self._lock:
+            self._pending[bucket] += 1
+            self._pending[total] += value
+            self._pending[count] += 1
+        self._start_flusher()
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_periodically, name='metrics-flusher', daemon=True)
+        self._flusher.start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Metrics flush failed: {str(e)}")
+
+    def _reset_in_child(self):
+        # The flushing thread does not survive a fork, and the parent flushes its own increments
+        self._pending = defaultdict(float)
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._client = None
+
+    def flush(self):
+        """
+        Adds the buffered increments to the shared hash. If Redis cannot be reached, the
+        increments stay buffered until the next flush.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(float)
+        if not pending:
+            return
+
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            for series, value in pending.items():
+                pipeline.hincrbyfloat(self.key, series, value)
+            pipeline.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not flush {len(pending)} metric series: {str(e)}")
+            with self._lock:
+                for series, value in pending.items():
+                    self._pending[series] += value
+
+    def collect(self):
+        """
+        Flushes this process's increments and returns the aggregated values of every series.
+
+        Returns:
+            dict: The value per series.
+        """
+        self.flush()
+        return {series.decode(): float(value) for series, value in self.client.hgetall(self.key).items()}
+
+
+def render_metrics(values):
+    """
+    Renders aggregated metric values in the Prometheus text exposition format.
+
+    Args:
+        values (dict): The value per series, as returned by `MetricsRegistry.collect`.
+
+    Returns:
+        str: The exposition text.
+    """
+    families = defaultdict(list)
+    for series, value in values.items():
+        name, labels, le = series.split('\t')
+        family = name
+        for suffix in HISTOGRAM_SUFFIXES:
+            if name.endswith(suffix):
+                family = name[:-len(suffix)]
+                break
+        families[family].append((name, labels, le, value))
+
+    lines = []
+    for family in sorted(families):
+        samples = families[family]
+        is_histogram = any(name.endswith('_bucket') for name, _, _, _ in samples)
+        lines.append(f'# TYPE {family} {"histogram" if is_histogram else "counter"}')
+
+        buckets = defaultdict(dict)
+        for name, labels, le, value in sorted(samples):
+            if name.endswith('_bucket'):
+                buckets[labels][float(le)] = value
+            else:
+                lines.append(f'{name}{{{labels}}} {_format_value(value)}' if labels else f'{name} {_format_value(value)}')
+
+        # Buckets are stored per bucket; Prometheus expects cumulative counts ending with +Inf
+        for labels, counts in sorted(buckets.items()):
+            counts.setdefault(float('inf'), 0)
+            cumulative = 0
+            for bound in sorted(counts):
+                cumulative += counts[bound]
+                label_text = f'{labels},le="{_format_bound(bound)}"' if labels else f'le="{_format_bound(bound)}"'
+                lines.append(f'{family}_bucket{{{label_text}}} {_format_value(cumulative)}')
+    return '\n'.join(lines) + '\n'
+
+
+def render_gauge(name, samples):
+    """
+    Renders a gauge read at scrape time, such as a queue length, in the Prometheus text format.
+
+    Args:
+        name (str): The gauge name.
+        samples (list): (labels, value) pairs, the labels being a dict.
+
+    Returns:
+        str: The exposition text.
+    """
+    lines = [f'# TYPE {name} gauge']
+    for labels, value in samples:
+        label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in sorted(labels.items()))
+        lines.append(f'{name}{{{label_text}}} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry(
+    redis_url=settings.METRICS_REDIS_URL,
+    key=settings.METRICS_REDIS_KEY,
+    flush_interval=settings.METRICS_FLUSH_INTERVAL,
+)
+atexit.register(registry.flush)
+
+inc = registry.inc
+observe = registry.observe
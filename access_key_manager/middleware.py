@@ -0,0 +1,89 @@
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from access_key_manager import db_router, metrics
+
+
+class QueryCounter:
+    """
+    A database execute wrapper that counts queries and the time spent running them.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class RequestMetricsMiddleware:
+    """
+    Records the latency, database query count and time, and response size of every request,
+    labelled by the resolved URL name (e.g. 'access_keys:key_status') and method.
+
+    Requests that match no URL are labelled 'unmatched'. The latency of a streaming response
+    covers the view up to its first chunk, and its size is not recorded. Disabled when
+    METRICS_ENABLED is False.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(queries))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        labels = {'view': match.view_name if match else 'unmatched', 'method': request.method}
+        metrics.observe('http_request_duration_seconds', elapsed, **labels)
+        metrics.observe('http_request_db_queries', queries.count, metrics.QUERY_COUNT_BUCKETS, **labels)
+        metrics.observe('http_request_db_seconds', queries.seconds, **labels)
+        if not response.streaming:
+            metrics.observe('http_response_size_bytes', len(response.content), metrics.SIZE_BUCKETS, **labels)
+        metrics.inc('http_requests_total', status=response.status_code, **labels)
+        return response
+
+
+class PrimaryStickinessMiddleware:
+    """
+    Keeps a client's reads on the primary database for REPLICA_STICKY_SECONDS after one of its
+    requests writes, so it reads its own writes despite replication lag.
+
+    A request that writes sets the REPLICA_STICKY_COOKIE cookie, and requests carrying it read
+    from the primary. Disabled when there are no DATABASE_REPLICAS.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned = db_router.pin_to_primary(settings.REPLICA_STICKY_COOKIE in request.COOKIES)
+        tracking = db_router.start_tracking_writes()
+        try:
+            response = self.get_response(request)
+            if db_router.has_written():
+                response.set_cookie(
+                    settings.REPLICA_STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                    secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax',
+                )
+        finally:
+            db_router.stop_tracking_writes(tracking)
+            db_router.unpin(pinned)
+        return response
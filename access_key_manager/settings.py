@@ -12,7 +12,9 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 import dj_database_url
 from decouple import config, Csv
+import json
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -54,6 +56,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so that the recorded latency and queries include the other middleware
+    'access_key_manager.middleware.RequestMetricsMiddleware',
+    # Before anything that queries, so that a client that just wrote reads from the primary
+    'access_key_manager.middleware.PrimaryStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -101,6 +107,42 @@ DATABASE_URL = config('DATABASE_URL', default=None)
 if DATABASE_URL:
     DATABASES['default'] = dj_database_url.config(default=DATABASE_URL)
 
+# Read-only replicas of the default database, as comma-separated URLs (e.g. streaming replicas,
+# or locally a copy of db.sqlite3). Reads are spread over them, except in Celery tasks, in
+# transactions, for the REPLICA_PRIMARY_APPS, and for REPLICA_STICKY_SECONDS after a client wrote.
+DATABASE_REPLICA_URLS = config('DATABASE_REPLICA_URLS', default='', cast=Csv())
+DATABASE_REPLICAS = []
+for index, replica_url in enumerate(DATABASE_REPLICA_URLS, start=1):
+    DATABASES[f'replica_{index}'] = {**dj_database_url.parse(replica_url), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+# Each gunicorn thread and Celery pool process keeps its connection for DB_CONN_MAX_AGE seconds
+# (0 closes it after every request) and checks it before reusing it. Behind a
+# transaction-mode pooler such as PgBouncer, set DB_POOLER_TRANSACTION_MODE: server-side cursors
+# do not survive from one pooled transaction to the next.
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)
+DB_CONN_HEALTH_CHECKS = config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool)
+DB_POOLER_TRANSACTION_MODE = config('DB_POOLER_TRANSACTION_MODE', default=False, cast=bool)
+for database in DATABASES.values():
+    database.update({
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+        'DISABLE_SERVER_SIDE_CURSORS': DB_POOLER_TRANSACTION_MODE,
+    })
+
+# Connection budget: every gunicorn thread (WEB_CONCURRENCY workers of GUNICORN_THREADS threads,
+# see gunicorn.conf.py), every Celery pool process (see QUEUES in celery.py) and beat may hold
+# a connection to each database. A system check warns when they add up to more than
+# DB_MAX_CONNECTIONS, the server's (or pooler's) limit; 0 disables the check.
+WEB_CONCURRENCY = config('WEB_CONCURRENCY', default=1, cast=int)
+GUNICORN_THREADS = config('GUNICORN_THREADS', default=1, cast=int)
+DB_MAX_CONNECTIONS = config('DB_MAX_CONNECTIONS', default=0, cast=int)
+
+DATABASE_ROUTERS = ['access_key_manager.db_router.PrimaryReplicaRouter']
+REPLICA_PRIMARY_APPS = ['sessions', 'django_celery_beat']
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=15, cast=int)
+REPLICA_STICKY_COOKIE = 'use_primary'
+
 
 
 # Password validation
@@ -146,9 +188,18 @@ STATICFILES_DIRS = [
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 
-# Static files storage settings
-if not DEBUG:
-    STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Storage settings; the key log archive storage is added with the key log retention settings below
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
 
 
 # Default primary key field type
@@ -163,6 +214,18 @@ AUTH_USER_MODEL = 'users.User'
 # Price of access key
 ACCESS_KEY_PRICE = 100.00
 
+# Maximum number of emails accepted by the batch access key status API
+ACCESS_KEY_STATUS_BATCH_LIMIT = config('ACCESS_KEY_STATUS_BATCH_LIMIT', default=5000, cast=int)
+
+# Batches larger than this are resolved in chunks of this size and streamed
+ACCESS_KEY_STATUS_BATCH_CHUNK_SIZE = config('ACCESS_KEY_STATUS_BATCH_CHUNK_SIZE', default=500, cast=int)
+
+# Maximum number of schools in one bulk provisioning request
+ACCESS_KEY_PROVISION_LIMIT = config('ACCESS_KEY_PROVISION_LIMIT', default=10000, cast=int)
+
+# Number of access keys and key logs per admin dashboard page
+ADMIN_DASHBOARD_PAGE_SIZE = config('ADMIN_DASHBOARD_PAGE_SIZE', default=50, cast=int)
+
 # URL to redirect to after login
 LOGIN_REDIRECT_URL = 'home'
 
@@ -172,10 +235,16 @@ LOGOUT_REDIRECT_URL = 'home'
 # Site ID for Django's sites framework
 SITE_ID = 1
 
-# Authentication backends
+# Authentication backends. The model backend, with the logged-in user and their permissions cached
+# for AUTH_USER_CACHE_TIMEOUT seconds (see users/backends.py)
 AUTHENTICATION_BACKENDS = (
-    'django.contrib.auth.backends.ModelBackend',
+    'users.backends.CachedModelBackend',
 )
+AUTH_USER_CACHE_TIMEOUT = config('AUTH_USER_CACHE_TIMEOUT', default=300, cast=int)
+
+# Seconds a process trusts its role permissions before checking the shared version for changes
+# to the role groups (see users/permissions.py)
+ROLE_PERMISSIONS_CHECK_INTERVAL = config('ROLE_PERMISSIONS_CHECK_INTERVAL', default=5, cast=float)
 
 # Authentication method: username and email
 ACCOUNT_AUTHENTICATION_METHOD = 'username_email'
@@ -201,16 +270,34 @@ EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='webmaster@localhost')
+# Seconds before a blocking SMTP operation gives up
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=10, cast=int)
+
+# Outgoing emails are queued in the EmailOutbox and delivered by a worker in batches
+# over one SMTP connection. Failed sends are retried with exponential backoff.
+EMAIL_OUTBOX_BATCH_SIZE = config('EMAIL_OUTBOX_BATCH_SIZE', default=50, cast=int)
+EMAIL_OUTBOX_MAX_ATTEMPTS = config('EMAIL_OUTBOX_MAX_ATTEMPTS', default=5, cast=int)
+EMAIL_OUTBOX_RETRY_DELAY = config('EMAIL_OUTBOX_RETRY_DELAY', default=60, cast=int)  # seconds, doubled per attempt
+# Seconds a worker holds the batch it is sending; a batch still held after that, e.g. by a worker
+# that died, is sent again. Must exceed the time to send a batch.
+EMAIL_OUTBOX_CLAIM_TIMEOUT = config('EMAIL_OUTBOX_CLAIM_TIMEOUT', default=900, cast=int)
 
 # Paystack API keys
 PAYSTACK_SETTINGS = {
     'PUBLIC_KEY': config('PAYSTACK_PUBLIC_KEY'),
     'SECRET_KEY': config('PAYSTACK_SECRET_KEY'),
-    'BASE_URL': 'https://api.paystack.co',
+    'BASE_URL': config('PAYSTACK_BASE_URL', default='https://api.paystack.co'),
     'CURRENCY': 'GHS',
     'BUTTON_ID': 'paystack-button',  
     'BUTTON_CLASS': 'btn btn-primary',
     'CALLBACK_URL': config('CALLBACK_URL'),
+    # Client timeouts (seconds), retries for verify calls, connection pool and circuit breaker
+    'CONNECT_TIMEOUT': config('PAYSTACK_CONNECT_TIMEOUT', default=3.05, cast=float),
+    'READ_TIMEOUT': config('PAYSTACK_READ_TIMEOUT', default=10.0, cast=float),
+    'MAX_RETRIES': config('PAYSTACK_MAX_RETRIES', default=2, cast=int),
+    'POOL_SIZE': config('PAYSTACK_POOL_SIZE', default=10, cast=int),
+    'BREAKER_FAILURE_THRESHOLD': config('PAYSTACK_BREAKER_FAILURE_THRESHOLD', default=5, cast=int),
+    'BREAKER_RESET_TIMEOUT': config('PAYSTACK_BREAKER_RESET_TIMEOUT', default=30.0, cast=float),
 }
     
 # Redirect URLs after email confirmation
@@ -224,6 +311,23 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 # Celery settings
 REDIS_URL = config('REDIS_URL', default = 'redis://localhost:6379/0')
 
+# Cache settings. The in-memory default is per process and suits development and tests;
+# deployments set CACHE_BACKEND to django.core.cache.backends.redis.RedisCache, which uses REDIS_URL
+CACHE_BACKEND = config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': config('CACHE_LOCATION', default=REDIS_URL if CACHE_BACKEND.endswith('RedisCache') else ''),
+    }
+}
+
+# Sessions live only in the cache, so the Redis instance should not evict keys (maxmemory-policy
+# volatile-lru or noeviction) to keep users logged in under memory pressure
+SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
+
+# Upper bound (in seconds) on how long an access key status API payload is cached
+ACCESS_KEY_STATUS_CACHE_TTL = config('ACCESS_KEY_STATUS_CACHE_TTL', default=300, cast=int)
+
 CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['json']
@@ -233,6 +337,76 @@ CELERY_TIMEZONE = 'UTC'
 
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 
+# Expiry timers are ETA tasks held by the worker until they fire, so the Redis
+# visibility timeout must outlive the longest timer or the message is redelivered.
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'visibility_timeout': config('CELERY_VISIBILITY_TIMEOUT', default=60 * 60 * 48, cast=int),
+}
+
+# Interval (in minutes) of the reconciliation sweep that expires any key whose timer was lost
+ACCESS_KEY_EXPIRY_SWEEP_MINUTES = config('ACCESS_KEY_EXPIRY_SWEEP_MINUTES', default=60, cast=int)
+
+# Number of keys expired per UPDATE/bulk_create round trip
+ACCESS_KEY_EXPIRY_CHUNK_SIZE = config('ACCESS_KEY_EXPIRY_CHUNK_SIZE', default=1000, cast=int)
+
+# Number of pre-generated keys kept in the access key pool, and keys inserted per round trip
+ACCESS_KEY_POOL_SIZE = config('ACCESS_KEY_POOL_SIZE', default=5000, cast=int)
+ACCESS_KEY_POOL_BATCH_SIZE = config('ACCESS_KEY_POOL_BATCH_SIZE', default=1000, cast=int)
+
+# Key logs older than this many days are moved, a month at a time, to gzip-compressed
+# JSON Lines files in the 'key_log_archives' storage, streaming KEYLOG_ARCHIVE_CHUNK_SIZE rows at a time
+KEYLOG_RETENTION_DAYS = config('KEYLOG_RETENTION_DAYS', default=90, cast=int)
+KEYLOG_ARCHIVE_CHUNK_SIZE = config('KEYLOG_ARCHIVE_CHUNK_SIZE', default=2000, cast=int)
+
+# Archived key logs are deleted from the database, so in production the archive storage must be
+# durable, e.g. an object store backend such as 'storages.backends.s3.S3Storage' with its options
+# as JSON. The local KEYLOG_ARCHIVE_DIR is only suitable for development: on hosts with an
+# ephemeral disk, every deploy would lose the archives.
+KEYLOG_ARCHIVE_DIR = config('KEYLOG_ARCHIVE_DIR', default=os.path.join(BASE_DIR, 'archives', 'key_logs'))
+KEYLOG_ARCHIVE_STORAGE_BACKEND = config('KEYLOG_ARCHIVE_STORAGE_BACKEND', default='django.core.files.storage.FileSystemStorage')
+KEYLOG_ARCHIVE_STORAGE_OPTIONS = config(
+    'KEYLOG_ARCHIVE_STORAGE_OPTIONS', default=json.dumps({'location': KEYLOG_ARCHIVE_DIR}), cast=json.loads,
+)
+STORAGES['key_log_archives'] = {
+    'BACKEND': KEYLOG_ARCHIVE_STORAGE_BACKEND,
+    'OPTIONS': KEYLOG_ARCHIVE_STORAGE_OPTIONS,
+}
+
+
+# Scheduled tasks run under a lease so they never overlap. The lease outlives the task's time
+# limit; TASK_LOCK_TTL (in seconds) applies to tasks without one. Only the beat holding the leader
+# lease sends tasks, and a dead leader is replaced within BEAT_LEADER_TTL seconds.
+TASK_LOCK_TTL = config('TASK_LOCK_TTL', default=3600, cast=int)
+BEAT_LEADER_TTL = config('BEAT_LEADER_TTL', default=30, cast=int)
+
+# Per-view request metrics, buffered per process and added to the METRICS_REDIS_KEY hash every
+# METRICS_FLUSH_INTERVAL seconds. Served at /metrics/ to admins, or to scrapers sending
+# 'Authorization: Bearer <METRICS_TOKEN>'.
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_REDIS_URL = config('METRICS_REDIS_URL', default=REDIS_URL)
+METRICS_REDIS_KEY = config('METRICS_REDIS_KEY', default='metrics')
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=10, cast=float)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Records are written as JSON lines by a background thread, to stdout by default: supervisord
+# passes every program's output on, and rotation is left to the platform. LOG_FILE logs to a file
+# instead, rotated when it reaches LOG_MAX_BYTES or is LOG_ROTATE_SECONDS old, keeping
+# LOG_BACKUP_COUNT rotated files. Rotation is not coordinated between processes, so each process
+# gets its own file, named after LOG_FILE with the process id added (e.g. debug.1234.log).
+LOG_FILE = config('LOG_FILE', default='')
+LOG_MAX_BYTES = config('LOG_MAX_BYTES', default=50 * 1024 * 1024, cast=int)
+LOG_ROTATE_SECONDS = config('LOG_ROTATE_SECONDS', default=24 * 60 * 60, cast=int)
+LOG_BACKUP_COUNT = config('LOG_BACKUP_COUNT', default=7, cast=int)
+
+# Maximum number of records waiting to be written; records logged while the queue is full are dropped
+LOG_QUEUE_SIZE = config('LOG_QUEUE_SIZE', default=10000, cast=int)
+
+# Log levels of the application and of Django. DEBUG-level Django logging includes every SQL query.
+LOG_LEVEL = config('LOG_LEVEL', default='DEBUG' if DEBUG else 'INFO')
+DJANGO_LOG_LEVEL = config('DJANGO_LOG_LEVEL', default='INFO')
+
+# Fraction of high-volume INFO lines (e.g. one per expired key) that are kept
+LOG_SAMPLE_RATE = config('LOG_SAMPLE_RATE', default=1.0 if DEBUG else 0.1, cast=float)
 
 LOGGING = {
     'version': 1,
@@ -247,19 +421,55 @@ LOGGING = {
             'style': '{',
         },
     },
+    'filters': {
+        'sampling': {
+            '()': 'access_key_manager.log.SamplingFilter',
+            'rate': LOG_SAMPLE_RATE,
+        },
+    },
     'handlers': {
-        'file': {
-            'level': 'DEBUG',
-            'class': 'logging.FileHandler',
-            'filename': 'debug.log',
-            'formatter': 'verbose',
+        'app': {
+            '()': 'access_key_manager.log.NonBlockingHandler',
+            'filters': ['sampling'],
+            'queue_size': LOG_QUEUE_SIZE,
+            'target_formatter': 'access_key_manager.log.JSONFormatter',
+            'target': {
+                'class': 'access_key_manager.log.SizedTimedRotatingFileHandler',
+                'filename': LOG_FILE,
+                'per_process': True,
+                'maxBytes': LOG_MAX_BYTES,
+                'interval': LOG_ROTATE_SECONDS,
+                'backupCount': LOG_BACKUP_COUNT,
+                'encoding': 'utf-8',
+                'delay': True,
+            } if LOG_FILE else {
+                'class': 'logging.StreamHandler',
+                'stream': sys.stdout,
+            },
         },
     },
     'loggers': {
         'django': {
-            'handlers': ['file'],
-            'level': 'DEBUG',
+            'handlers': ['app'],
+            'level': DJANGO_LOG_LEVEL,
             'propagate': True,
         },
+        'access_keys': {
+            'handlers': ['app'],
+            'level': LOG_LEVEL,
+        },
+        'users': {
+            'handlers': ['app'],
+            'level': LOG_LEVEL,
+        },
+        'access_key_manager': {
+            'handlers': ['app'],
+            'level': LOG_LEVEL,
+        },
+        # Task loggers (celery.utils.log.get_task_logger) are children of 'celery.task'
+        'celery': {
+            'handlers': ['app'],
+            'level': LOG_LEVEL,
+        },
     },
 }
@@ -17,12 +17,14 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 from users import views as users_views 
+from access_key_manager import views as project_views
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),  # Admin site URL
     path('accounts/', include('users.urls')),  # User-related URLs
     path('access-keys/', include('access_keys.urls', namespace="access_keys")),  # Access key-related URLs
+    path('metrics/', project_views.metrics_view, name='metrics'),  # Prometheus metrics
     path('', include('users.urls')),  # Root URL, pointing to user-related views
 ]
 
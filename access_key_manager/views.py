@@ -0,0 +1,58 @@
+import hmac
+import logging
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+import redis
+from access_key_manager import metrics
+from access_key_manager.celery import queue_lengths
+from users.helpers import is_admin
+
+
+logger = logging.getLogger(__name__)
+
+
+def _has_metrics_token(request):
+    token = settings.METRICS_TOKEN
+    return bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+
+@require_GET
+def metrics_view(request):
+    """
+    This view exposes the aggregated request, task, Paystack and email outbox metrics, and the
+    current length of each Celery queue.
+
+    Parameters:
+        - request (HttpRequest): The HTTP request object, from a logged-in admin or carrying
+          'Authorization: Bearer <METRICS_TOKEN>' for a Prometheus scraper.
+
+    Returns:
+        - HttpResponse: The metrics in the Prometheus text format, or a 503 response if the
+          metrics store cannot be reached.
+
+    Raises:
+        - PermissionDenied: If a logged-in user who is not an admin requests the metrics.
+    """
+    if not _has_metrics_token(request):
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        if not is_admin(request.user):
+            raise PermissionDenied("You don't have permission to access this page.")
+
+    try:
+        values = metrics.registry.collect()
+    except redis.RedisError as e:
+        logger.error(f"Could not read metrics: {str(e)}")
+        return HttpResponse('Metrics are unavailable.', status=503, content_type='text/plain')
+    text = metrics.render_metrics(values)
+
+    try:
+        lengths = queue_lengths()
+    except Exception as e:
+        logger.error(f"Could not read Celery queue lengths: {str(e)}")
+    else:
+        text += metrics.render_gauge('celery_queue_length', [({'queue': name}, length) for name, length in lengths.items()])
+    return HttpResponse(text, content_type='text/plain; version=0.0.4; charset=utf-8')
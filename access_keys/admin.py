@@ -1,8 +1,11 @@
 from django.contrib import admin
-from .models import AccessKey, School, KeyLog
+from .models import AccessKey, School, KeyLog, KeyLogArchive, KeyStats, Payment, PooledKey
 
 # Register your models here.
 admin.site.register(AccessKey)
 admin.site.register(School)
 admin.site.register(KeyLog)
-
+admin.site.register(KeyLogArchive)
+admin.site.register(KeyStats)
+admin.site.register(Payment)
+admin.site.register(PooledKey)
@@ -1,10 +1,23 @@
+import json
 import logging
+from decimal import Decimal
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
 from users.helpers import is_admin, user_passes_test_with_403
+from access_key_manager.db_router import use_primary
 from users.models import User
-from .serializers import AccessKeySerializer
+from .archive import query_key_logs
+from .cache import cache_key_status, get_cached_key_status
+from .models import AccessKey
+from .serializers import AccessKeySerializer, BulkProvisionSerializer
+from .services import provision_access_keys
 
 
 logger = logging.getLogger(__name__)
@@ -16,6 +29,10 @@ def check_access_key_status_view(request, email):
     """
     This view checks the status of an active access key for a user associated with a school.
 
+    Found and not-found key payloads are served from a read-through cache that purchases,
+    revocations and expiries invalidate. Cache misses are read from the primary, so a lagging
+    replica never puts a stale status back into the cache after an invalidation.
+
     Parameters:
         - request (Request): The HTTP request object.
         - email (str): The email address of the user to check the access key status for.
@@ -33,24 +50,196 @@ def check_access_key_status_view(request, email):
         logger.error('Email parameter is required.')
         return Response({'error': 'Email parameter is required.'}, status=400)
 
+    cached = get_cached_key_status(email)
+    if cached is not None:
+        data, status = cached
+        logger.info(f'Serving cached access key status for email {email}.')
+        return Response(data, status=status)
+
     try:
-        user = User.objects.get(email=email)
-        school = user.school
+        with use_primary():
+            user = User.objects.get(email=email)
+            school = user.school
+            active_key = school.access_keys.filter(status='active').first() if school else None
         if not school:
             logger.warning(f'User with email {email} is not associated with any school.')
             return Response({'error': 'User is not associated with any school.'}, status=404)
 
-        active_key = school.access_keys.filter(status='active').first()
         if active_key:
             serializer = AccessKeySerializer(active_key)
+            cache_key_status(email, serializer.data, 200, expiry_date=active_key.expiry_date)
             logger.info(f'Active access key found for email {email}.')
             return Response(serializer.data, status=200)
         else:
+            data = {'error': 'No active access key found.'}
+            cache_key_status(email, data, 404)
             logger.info(f'No active access key found for email {email}.')
-            return Response({'error': 'No active access key found.'}, status=404)
+            return Response(data, status=404)
     except User.DoesNotExist:
         logger.error(f'User with email {email} not found.')
         return Response({'error': 'User not found.'}, status=404)
     except Exception as e:
         logger.exception(f'Error checking access key status for email {email}: {str(e)}')
         return Response({'error': str(e)}, status=500)
+
+
+def _resolve_key_statuses(emails):
+    """
+    Resolves the active access key status of each email.
+
+    Users, then active keys, are fetched from the primary with one query each per chunk of
+    ACCESS_KEY_STATUS_BATCH_CHUNK_SIZE emails, so a status never lags a revoke or a purchase.
+
+    Args:
+        emails (list): Distinct email addresses to resolve.
+
+    Yields:
+        tuple: The email and its result entry.
+    """
+    chunk_size = settings.ACCESS_KEY_STATUS_BATCH_CHUNK_SIZE
+    for start in range(0, len(emails), chunk_size):
+        chunk = emails[start:start + chunk_size]
+        active_keys = {}
+        with use_primary():
+            school_ids = dict(User.objects.filter(email__in=chunk).values_list('email', 'school_id'))
+            for key in AccessKey.objects.filter(
+                school_id__in={school_id for school_id in school_ids.values() if school_id},
+                status='active',
+            ).order_by('pk'):
+                active_keys.setdefault(key.school_id, key)
+
+        for email in chunk:
+            if email not in school_ids:
+                yield email, {'found': False, 'error': 'User not found.'}
+            elif not school_ids[email]:
+                yield email, {'found': False, 'error': 'User is not associated with any school.'}
+            elif school_ids[email] not in active_keys:
+                yield email, {'found': False, 'error': 'No active access key found.'}
+            else:
+                yield email, {'found': True, 'access_key': AccessKeySerializer(active_keys[school_ids[email]]).data}
+
+
+def _stream_key_statuses(emails):
+    """
+    Streams the batch results as one JSON document, a chunk of emails at a time.
+    """
+    yield '{"results": {'
+    separator = ''
+    for email, result in _resolve_key_statuses(emails):
+        yield f'{separator}{json.dumps(email)}: {json.dumps(result, cls=DjangoJSONEncoder)}'
+        separator = ', '
+    yield '}}'
+
+
+@login_required
+@user_passes_test_with_403(is_admin)
+@api_view(['POST'])
+def check_access_key_status_batch_view(request):
+    """
+    This view checks the status of the active access keys of many users at once.
+
+    Parameters:
+        - request (Request): The HTTP request object, with a JSON body of the form {"emails": [...]}.
+
+    Returns:
+        - Response: A JSON object mapping each email to its result. Found entries carry the
+          serialized active access key; entries for unknown users, users without a school and
+          schools without an active key carry an error message. Batches larger than
+          ACCESS_KEY_STATUS_BATCH_CHUNK_SIZE are streamed.
+    """
+    emails = request.data.get('emails') if isinstance(request.data, dict) else None
+
+    if not emails or not isinstance(emails, list) or not all(isinstance(email, str) for email in emails):
+        logger.error('A list of emails is required.')
+        return Response({'error': 'A list of emails is required.'}, status=400)
+
+    limit = settings.ACCESS_KEY_STATUS_BATCH_LIMIT
+    if len(emails) > limit:
+        logger.error(f'Batch of {len(emails)} emails exceeds the limit of {limit}.')
+        return Response({'error': f'At most {limit} emails can be checked at once.'}, status=400)
+
+    emails = list(dict.fromkeys(emails))
+    logger.info(f"Checking access key status for {len(emails)} emails.")
+
+    if len(emails) > settings.ACCESS_KEY_STATUS_BATCH_CHUNK_SIZE:
+        return StreamingHttpResponse(_stream_key_statuses(emails), content_type='application/json')
+    return Response({'results': dict(_resolve_key_statuses(emails))}, status=200)
+
+
+@login_required
+@user_passes_test_with_403(is_admin)
+@api_view(['POST'])
+def provision_access_keys_view(request):
+    """
+    This view issues an active access key to each of many schools at once.
+
+    Parameters:
+        - request (Request): The HTTP request object, with a JSON body of the form
+          {"schools": [ids], "expiry_date": "...", "price": "..."}; the price is optional.
+
+    Returns:
+        - Response: A JSON object mapping each school id to its result, 'issued' with the new key,
+          'already_active' or 'not_found', and the number of keys issued. Invalid requests get a
+          400 response with the validation errors. If the batch keeps conflicting with concurrent
+          purchases, nothing is provisioned and a 409 response lists the schools.
+    """
+    serializer = BulkProvisionSerializer(data=request.data)
+    if not serializer.is_valid():
+        logger.error(f'Invalid bulk provisioning request: {serializer.errors}')
+        return Response(serializer.errors, status=400)
+
+    data = serializer.validated_data
+    try:
+        results = provision_access_keys(
+            data['schools'],
+            data['expiry_date'],
+            data.get('price', Decimal(str(settings.ACCESS_KEY_PRICE))),
+            request.user,
+        )
+    except IntegrityError as e:
+        # The batch is provisioned in one transaction, so none of the schools got a key
+        logger.error(f'Bulk provisioning by {request.user.username} gave up: {str(e)}')
+        return Response({
+            'error': 'The access keys could not be provisioned. Please try again.',
+            'not_provisioned': list(dict.fromkeys(data['schools'])),
+        }, status=409)
+    issued = sum(result['status'] == 'issued' for result in results.values())
+    logger.info(f"{request.user.username} provisioned {issued} access keys.")
+    return Response({'issued': issued, 'results': results}, status=200)
+
+
+@login_required
+@user_passes_test_with_403(is_admin)
+@api_view(['GET'])
+def key_logs_view(request):
+    """
+    This view streams key log entries, whether still in the KeyLog table or archived.
+
+    Parameters:
+        - request (Request): The HTTP request object. The optional query parameters 'start' and
+          'end' (ISO datetimes) bound the range; 'event_type' filters by event type, and
+          'access_key' and 'school' by id.
+
+    Returns:
+        - StreamingHttpResponse: The matching entries as JSON Lines, oldest first, or a 400
+          response if a parameter is invalid.
+    """
+    filters = {}
+    try:
+        for name in ('start', 'end'):
+            if request.query_params.get(name):
+                value = parse_datetime(request.query_params[name])
+                if value is None:
+                    raise ValueError(name)
+                filters[name] = value if timezone.is_aware(value) else timezone.make_aware(value)
+        if request.query_params.get('event_type'):
+            filters['event_type'] = request.query_params['event_type']
+        for name, argument in (('access_key', 'access_key_id'), ('school', 'school_id')):
+            if request.query_params.get(name):
+                filters[argument] = int(request.query_params[name])
+    except ValueError:
+        logger.error(f'Invalid key log query: {request.query_params.dict()}')
+        return Response({'error': 'Invalid query parameters.'}, status=400)
+
+    lines = (json.dumps(entry, cls=DjangoJSONEncoder) + '\n' for entry in query_key_logs(**filters))
+    return StreamingHttpResponse(lines, content_type='application/x-ndjson')
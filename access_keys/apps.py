@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AccessKeysConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'access_keys'
+
+    def ready(self):
+        # Connection reuse metrics, Celery connection hooks and the connection budget check
+        import access_key_manager.db_connections
@@ -0,0 +1,256 @@
+import gzip
+import json
+import logging
+import tempfile
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import storages
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from access_key_manager.locks import check_lease
+from access_keys.models import KeyLog, KeyLogArchive, render_key_log_message
+
+
+"""
+Retention for the KeyLog table.
+
+Only recent key logs stay in the KeyLog table. Whole months older than KEYLOG_RETENTION_DAYS are
+streamed to gzip-compressed JSON Lines files, one per month, saved to the 'key_log_archives'
+storage, and deleted from the table once the file is confirmed there, so the table and its
+indexes stay small. `query_key_logs` reads across the archives and the table.
+"""
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FIELDS = (
+    'id', 'timestamp', 'event_type', 'payload', 'action', 'user_id', 'user__username',
+    'access_key_id', 'school_id', 'school__name',
+)
+
+
+def _month_start(moment):
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(month_start):
+    return _month_start(month_start + timedelta(days=32))
+
+
+class ArchiveWriteError(Exception):
+    """
+    Raised when an archive file cannot be confirmed in the archive storage.
+    """
+
+
+def archive_storage():
+    return storages['key_log_archives']
+
+
+def _serialize(row):
+    return {
+        'id': row['id'],
+        'timestamp': row['timestamp'],
+        'event_type': row['event_type'],
+        'message': render_key_log_message(row['event_type'], row['payload'], row['school__name'] or '', row['action']),
+        'payload': row['payload'],
+        'user_id': row['user_id'],
+        'username': row['user__username'],
+        'access_key_id': row['access_key_id'],
+        'school_id': row['school_id'],
+        'school_name': row['school__name'],
+    }
+
+
+def export_key_logs(queryset, path, chunk_size=None):
+    """
+    Streams key logs to a gzip-compressed JSON Lines file in the archive storage.
+
+    Rows are read with `iterator()`, so only one chunk of rows is held in memory. The file is
+    written to a local temporary file, then saved to the storage, replacing any earlier file of
+    the same name, and read back to confirm it is complete.
+
+    Args:
+        queryset (QuerySet): The key logs to export.
+        path (str): The destination name in the archive storage.
+        chunk_size (int, optional): Rows fetched per round trip. Defaults to KEYLOG_ARCHIVE_CHUNK_SIZE.
+
+    Returns:
+        int: The number of exported rows.
+
+    Raises:
+        ArchiveWriteError: If the saved file is missing or incomplete.
+    """
+    chunk_size = chunk_size or settings.KEYLOG_ARCHIVE_CHUNK_SIZE
+    storage = archive_storage()
+
+    count = 0
+    with tempfile.TemporaryFile() as temporary_file:
+        with gzip.open(temporary_file, 'wt', encoding='utf-8') as f:
+            for row in queryset.order_by('timestamp', 'pk').values(*ARCHIVE_FIELDS).iterator(chunk_size=chunk_size):
+                f.write(json.dumps(_serialize(row), cls=DjangoJSONEncoder))
+                f.write('\n')
+                count += 1
+        size = temporary_file.tell()
+        temporary_file.seek(0)
+
+        if storage.exists(path):
+            storage.delete(path)
+        saved_path = storage.save(path, File(temporary_file, name=path))
+
+    if saved_path != path or not storage.exists(path) or storage.size(path) != size:
+        raise ArchiveWriteError(f"Archive {path} was not saved completely to the archive storage.")
+    if sum(1 for _ in read_archive_file(path)) != count:
+        raise ArchiveWriteError(f"Archive {path} does not contain the {count} exported key logs.")
+    return count
+
+
+def archive_key_logs(now=None, chunk_size=None):
+    """
+    Archives every whole month of key logs older than KEYLOG_RETENTION_DAYS, oldest first.
+
+    Each month is exported to its own file in the archive storage and recorded as a KeyLogArchive
+    before its rows are deleted from the table, in chunks. A month whose file cannot be confirmed
+    in the storage keeps its rows, and stops the run. From the moment the archive is recorded, queries read the
+    month from the file, so a run interrupted mid-delete never shows a log twice; the next run
+    finishes the delete.
+
+    Args:
+        now (datetime, optional): The current time. Defaults to timezone.now().
+        chunk_size (int, optional): Rows per export fetch and per delete. Defaults to KEYLOG_ARCHIVE_CHUNK_SIZE.
+
+    Returns:
+        dict: The number of archived months and of archived log entries.
+    """
+    now = now or timezone.now()
+    chunk_size = chunk_size or settings.KEYLOG_ARCHIVE_CHUNK_SIZE
+    cutoff = _month_start(timezone.localtime(now - timedelta(days=settings.KEYLOG_RETENTION_DAYS)))
+    result = {'months': 0, 'archived': 0}
+
+    # Finish deleting months whose archive was recorded by an interrupted run
+    last_archive = KeyLogArchive.objects.order_by('-month_start').first()
+    if last_archive:
+        _delete_key_logs(KeyLog.objects.filter(timestamp__lt=last_archive.month_end), chunk_size)
+
+    oldest = KeyLog.objects.filter(timestamp__lt=cutoff).order_by('timestamp').values_list('timestamp', flat=True).first()
+    if oldest is None:
+        return result
+
+    month_start = _month_start(timezone.localtime(oldest))
+    while month_start < cutoff:
+        month_end = _next_month(month_start)
+        month_logs = KeyLog.objects.filter(timestamp__gte=month_start, timestamp__lt=month_end)
+        path = f'key_logs-{month_start:%Y-%m}.jsonl.gz'
+
+        check_lease()
+        row_count = export_key_logs(month_logs, path, chunk_size)
+        KeyLogArchive.objects.update_or_create(
+            month_start=month_start,
+            defaults={'month_end': month_end, 'path': path, 'row_count': row_count},
+        )
+        _delete_key_logs(month_logs, chunk_size)
+
+        logger.info(f"Archived {row_count} key logs for {month_start:%Y-%m} to {path}.")
+        result['months'] += 1
+        result['archived'] += row_count
+        month_start = month_end
+    return result
+
+
+def _delete_key_logs(queryset, chunk_size):
+    while True:
+        with transaction.atomic():
+            pks = list(queryset.values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                return
+            check_lease()
+            KeyLog.objects.filter(pk__in=pks).delete()
+
+
+def read_archive_file(path):
+    """
+    Yields the log entries of an archive file, oldest first, with parsed timestamps.
+
+    Args:
+        path (str): The name of the file in the archive storage.
+
+    Raises:
+        FileNotFoundError: If the file is not in the archive storage.
+    """
+    with archive_storage().open(path, 'rb') as raw, gzip.open(raw, 'rt', encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            entry['timestamp'] = parse_datetime(entry['timestamp'])
+            yield entry
+
+
+def read_archive(archive):
+    """
+    Yields the log entries of an archive, oldest first, with parsed timestamps.
+
+    A missing file is logged and skipped, so queries still return the rest of the log.
+
+    Args:
+        archive (KeyLogArchive): The archived month.
+    """
+    if not archive_storage().exists(archive.path):
+        logger.error(f"Key log archive {archive.path} for {archive.month_start:%Y-%m} is missing; skipping {archive.row_count} logs.")
+        return
+    yield from read_archive_file(archive.path)
+
+
+def query_key_logs(start=None, end=None, event_type=None, access_key_id=None, school_id=None):
+    """
+    Yields key log entries in a time range, oldest first, from the archives and the KeyLog table.
+
+    Archived months are read from their files and the remaining range from the table, so callers
+    see one continuous log whatever has been archived. Entries are dicts with the keys 'id',
+    'timestamp', 'event_type', 'message', 'payload', 'user_id', 'username', 'access_key_id',
+    'school_id' and 'school_name'.
+
+    Args:
+        start (datetime, optional): The inclusive start of the range.
+        end (datetime, optional): The exclusive end of the range.
+        event_type (str, optional): Only entries of this event type.
+        access_key_id (int, optional): Only entries for this access key.
+        school_id (int, optional): Only entries for keys of this school.
+
+    Yields:
+        dict: The matching log entries.
+    """
+    def matches(entry):
+        return (
+            (start is None or entry['timestamp'] >= start)
+            and (end is None or entry['timestamp'] < end)
+            and (event_type is None or entry['event_type'] == event_type)
+            and (access_key_id is None or entry['access_key_id'] == access_key_id)
+            and (school_id is None or entry['school_id'] == school_id)
+        )
+
+    archives = KeyLogArchive.objects.order_by('month_start')
+    archived_until = None
+    for archive in archives:
+        archived_until = archive.month_end
+        if (start is not None and archive.month_end <= start) or (end is not None and archive.month_start >= end):
+            continue
+        yield from filter(matches, read_archive(archive))
+
+    hot_logs = KeyLog.objects.all()
+    if archived_until is not None:
+        hot_logs = hot_logs.filter(timestamp__gte=archived_until)
+    if start is not None:
+        hot_logs = hot_logs.filter(timestamp__gte=start)
+    if end is not None:
+        hot_logs = hot_logs.filter(timestamp__lt=end)
+    if event_type is not None:
+        hot_logs = hot_logs.filter(event_type=event_type)
+    if access_key_id is not None:
+        hot_logs = hot_logs.filter(access_key_id=access_key_id)
+    if school_id is not None:
+        hot_logs = hot_logs.filter(school_id=school_id)
+
+    rows = hot_logs.order_by('timestamp', 'pk').values(*ARCHIVE_FIELDS).iterator(chunk_size=settings.KEYLOG_ARCHIVE_CHUNK_SIZE)
+    for row in rows:
+        yield _serialize(row)
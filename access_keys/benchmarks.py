@@ -0,0 +1,340 @@
+import itertools
+import platform
+import random
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from unittest.mock import patch
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from access_key_manager.middleware import QueryCounter
+from access_keys.counters import rebuild_key_stats
+from access_keys.models import AccessKey, KeyLog
+from access_keys.services import process_payment
+from access_keys.tasks import update_key_statuses
+from access_keys.utils import generate_access_key
+from users.models import School, User
+
+
+"""
+Reproducible benchmarks of the hot paths, run by `manage.py run_benchmarks`.
+
+`seed_data` fills an empty database with deterministic volumes of schools, users, keys and key
+logs, and `run_scenarios` times each scenario in this process with Paystack and the Celery
+broker stubbed out, so the suite runs offline. Results are plain dicts that can be saved as JSON
+and compared with `compare_results`.
+"""
+
+SEED_PASSWORD = 'benchmark'
+
+SCENARIOS = (
+    'admin_dashboard', 'school_dashboard', 'home', 'key_status', 'key_status_cached',
+    'update_key_statuses', 'generate_access_key', 'paystack_callback', 'process_payment',
+)
+
+COMPARED_METRICS = ('p50_ms', 'p99_ms', 'queries', 'peak_memory_kb')
+
+
+def seed_data(schools=200, users_per_school=2, keys_per_school=5, logs=5000, expiring=100, buyers=0, seed=0):
+    """
+    Bulk-creates a deterministic data set.
+
+    Every school gets `users_per_school` users and `keys_per_school` keys, the newest of which is
+    active. The active keys of the first `expiring` schools are the ones `update_key_statuses`
+    expires on every iteration. `buyers` extra schools, each with one user and no key, are left
+    for the payment scenarios to issue keys to.
+
+    Args:
+        schools (int): The number of schools with keys.
+        users_per_school (int): The number of users per school.
+        keys_per_school (int): The number of keys per school.
+        logs (int): The number of key log entries, spread over the keys.
+        expiring (int): The number of active keys to expire per sweep.
+        buyers (int): The number of schools without keys.
+        seed (int): The random seed.
+
+    Returns:
+        dict: The seeded 'admin' and 'school_user', the 'buyers', the 'emails' of school users
+            and the 'expiring' key ids.
+    """
+    rng = random.Random(seed)
+    password = make_password(SEED_PASSWORD)
+    now = timezone.now()
+
+    admin = User.objects.create(
+        username='bench_admin', email='bench_admin@example.com', password=password,
+        first_name='Bench', last_name='Admin', staff_id='BENCH-1', is_admin=True, is_superuser=True,
+    )
+    school_rows = School.objects.bulk_create(
+        [School(name=f'Bench School {i}') for i in range(schools + buyers)], batch_size=1000
+    )
+    school_rows, buyer_schools = school_rows[:schools], school_rows[schools:]
+
+    users = User.objects.bulk_create([
+        User(
+            username=f'bench_user_{school.pk}_{n}', email=f'bench_user_{school.pk}_{n}@example.com',
+            password=password, first_name='Bench', last_name='User', is_school_personnel=True, school=school,
+        )
+        for school in school_rows for n in range(users_per_school)
+    ], batch_size=1000)
+    buyer_users = User.objects.bulk_create([
+        User(
+            username=f'bench_buyer_{school.pk}', email=f'bench_buyer_{school.pk}@example.com',
+            password=password, first_name='Bench', last_name='Buyer', is_school_personnel=True, school=school,
+        )
+        for school in buyer_schools
+    ], batch_size=1000)
+
+    assignees = {user.school_id: user for user in users}
+    keys = []
+    for school in school_rows:
+        for n in range(keys_per_school):
+            active = n == keys_per_school - 1
+            keys.append(AccessKey(
+                key=generate_access_key(),
+                school=school,
+                status='active' if active else rng.choice(['expired', 'revoked']),
+                assigned_to=assignees.get(school.pk, admin),
+                expiry_date=now + timedelta(days=30) if active else now - timedelta(days=rng.randint(1, 365)),
+                price=settings.ACCESS_KEY_PRICE,
+            ))
+    keys = AccessKey.objects.bulk_create(keys, batch_size=1000)
+
+    event_types = {'active': KeyLog.PURCHASED, 'expired': KeyLog.EXPIRED, 'revoked': KeyLog.REVOKED}
+    if keys:
+        log_keys = [rng.choice(keys) for _ in range(logs)]
+        KeyLog.objects.bulk_create([
+            KeyLog(
+                access_key=key, school_id=key.school_id, event_type=event_types[key.status],
+                payload={'key': key.key}, user=admin,
+            )
+            for key in log_keys
+        ], batch_size=1000)
+    rebuild_key_stats()
+
+    active_keys = [key for key in keys if key.status == 'active']
+    return {
+        'admin': admin,
+        'school_user': users[0] if users else None,
+        'buyers': buyer_users,
+        'emails': [user.email for user in users],
+        'expiring': [key.pk for key in active_keys[:expiring]],
+    }
+
+
+class StubPaystackClient:
+    """
+    Answers verify calls with a successful transaction for the email registered per reference.
+    """
+
+    def __init__(self):
+        self.emails = {}
+
+    def verify_transaction(self, reference):
+        return {
+            'status': True,
+            'data': {
+                'status': 'success',
+                'amount': int(settings.ACCESS_KEY_PRICE * 100),
+                'currency': 'GHS',
+                'customer': {'email': self.emails.get(reference)},
+            },
+        }
+
+
+@contextmanager
+def offline():
+    """
+    Stubs out Paystack and the Celery broker, and uses a local memory cache without metrics or
+    DEBUG query logging, for the duration of a benchmark run.
+
+    Yields:
+        StubPaystackClient: The Paystack client the payment scenarios verify against.
+    """
+    paystack = StubPaystackClient()
+    with ExitStack() as stack:
+        stack.enter_context(override_settings(
+            DEBUG=False,
+            METRICS_ENABLED=False,
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmarks'}},
+        ))
+        stack.enter_context(patch('celery.app.task.Task.apply_async', return_value=None))
+        stack.enter_context(patch('access_keys.services.get_paystack_client', return_value=paystack))
+        yield paystack
+
+
+def _percentile(ordered, percent):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def measure(run, setup=None, iterations=50, warmup=5):
+    """
+    Times a scenario.
+
+    `setup` runs before every iteration, outside the timing and the query count. One more
+    iteration runs under tracemalloc to find the peak memory allocated by the scenario.
+
+    Args:
+        run (callable): The code to time.
+        setup (callable, optional): Prepares the next iteration.
+        iterations (int): The number of timed iterations.
+        warmup (int): The number of untimed iterations run first.
+
+    Returns:
+        dict: The latency percentiles in milliseconds, the mean number of queries per
+            iteration and the peak memory in KiB.
+    """
+    def iteration(queries=None):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        if queries is None:
+            run()
+        else:
+            with connection.execute_wrapper(queries):
+                run()
+        return time.perf_counter() - started
+
+    for _ in range(warmup):
+        iteration()
+
+    queries = QueryCounter()
+    timings = sorted(iteration(queries) * 1000 for _ in range(iterations))
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'iterations': iterations,
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'p50_ms': round(_percentile(timings, 50), 3),
+        'p90_ms': round(_percentile(timings, 90), 3),
+        'p99_ms': round(_percentile(timings, 99), 3),
+        'max_ms': round(timings[-1], 3),
+        'queries': round(queries.count / iterations, 2),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def _get(client, url, data=None):
+    response = client.get(url, data)
+    if response.status_code != 200:
+        raise RuntimeError(f'GET {url} returned {response.status_code}; the benchmark would not measure the view.')
+    return response
+
+
+def build_scenarios(data, paystack):
+    """
+    Returns the (run, setup) pair of every scenario for a seeded data set.
+
+    Args:
+        data (dict): The result of `seed_data`.
+        paystack (StubPaystackClient): The stubbed Paystack client.
+    """
+    admin_client = Client()
+    admin_client.force_login(data['admin'])
+    school_client = Client()
+    if data['school_user']:
+        school_client.force_login(data['school_user'])
+
+    emails = itertools.cycle(data['emails'] or [data['admin'].email])
+    cached_email = next(emails)
+    references = itertools.count()
+    buyers = iter(data['buyers'])
+    current = {}
+
+    def expire_setup():
+        AccessKey.objects.filter(pk__in=data['expiring']).update(
+            status='active', expiry_date=timezone.now() - timedelta(minutes=1)
+        )
+
+    def key_status_setup():
+        # Sessions live in the cache too, so log back in after clearing it
+        cache.clear()
+        admin_client.force_login(data['admin'])
+
+    def key_status():
+        _get(admin_client, reverse('access_keys:key_status', args=[next(emails)]))
+
+    def key_status_cached():
+        _get(admin_client, reverse('access_keys:key_status', args=[cached_email]))
+
+    def callback():
+        _get(school_client, reverse('access_keys:paystack_callback'), {'reference': f'bench-callback-{next(references)}'})
+
+    def payment_setup():
+        buyer = next(buyers)
+        current['reference'] = f'bench-payment-{buyer.pk}'
+        paystack.emails[current['reference']] = buyer.email
+
+    return {
+        'admin_dashboard': (lambda: _get(admin_client, reverse('admin_dashboard')), None),
+        'school_dashboard': (lambda: _get(school_client, reverse('school_dashboard')), None),
+        'home': (lambda: _get(school_client, reverse('home')), None),
+        'key_status': (key_status, key_status_setup),
+        'key_status_cached': (key_status_cached, None),
+        'update_key_statuses': (update_key_statuses, expire_setup),
+        'generate_access_key': (generate_access_key, None),
+        'paystack_callback': (callback, None),
+        'process_payment': (lambda: process_payment(current['reference']), payment_setup),
+    }
+
+
+def run_scenarios(data, paystack, names=SCENARIOS, iterations=50, warmup=5):
+    """
+    Measures the named scenarios. See `measure`.
+
+    Returns:
+        dict: The measurements per scenario name.
+    """
+    scenarios = build_scenarios(data, paystack)
+    return {name: measure(*scenarios[name], iterations=iterations, warmup=warmup) for name in names}
+
+
+def environment():
+    """
+    Describes the database and interpreter a run was measured on.
+    """
+    return {
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'machine': platform.machine(),
+    }
+
+
+def compare_results(previous, current):
+    """
+    Compares two saved runs.
+
+    Args:
+        previous (dict): The earlier run.
+        current (dict): The new run.
+
+    Returns:
+        list: (scenario, metric, before, after, change in percent) for every scenario and metric
+            present in both runs; the change is None when `before` is zero.
+    """
+    rows = []
+    for name, result in current['scenarios'].items():
+        before = previous.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        for metric in COMPARED_METRICS:
+            if metric in before and metric in result:
+                change = (result[metric] - before[metric]) / before[metric] * 100 if before[metric] else None
+                rows.append((name, metric, before[metric], result[metric], change))
+    return rows
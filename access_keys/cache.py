@@ -0,0 +1,95 @@
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from users.models import User
+
+
+"""
+Read-through cache of the access key status API payloads, keyed by email.
+"""
+
+logger = logging.getLogger(__name__)
+
+KEY_STATUS_CACHE_PREFIX = 'key_status'
+
+
+def key_status_cache_key(email):
+    """
+    Returns the cache key holding the status payload for the given email.
+    """
+    return f'{KEY_STATUS_CACHE_PREFIX}:{email}'
+
+
+def get_cached_key_status(email):
+    """
+    Returns the cached status payload for the given email.
+
+    Args:
+        email (str): The email address of the user.
+
+    Returns:
+        tuple: The response data and HTTP status, or None on a cache miss or cache error.
+    """
+    try:
+        cached = cache.get(key_status_cache_key(email))
+    except Exception as e:
+        logger.warning(f"Key status cache read failed for {email}: {str(e)}")
+        return None
+    if cached is None:
+        return None
+    return cached['data'], cached['status']
+
+
+def cache_key_status(email, data, status, expiry_date=None):
+    """
+    Caches a status payload for the given email.
+
+    The TTL is ACCESS_KEY_STATUS_CACHE_TTL, capped at the key's expiry date so that a cached
+    active key can never outlive the key itself.
+
+    Args:
+        email (str): The email address of the user.
+        data (dict): The response data.
+        status (int): The HTTP status of the response.
+        expiry_date (datetime, optional): The expiry date of the active key in the payload.
+    """
+    timeout = settings.ACCESS_KEY_STATUS_CACHE_TTL
+    if expiry_date is not None:
+        timeout = min(timeout, int((expiry_date - timezone.now()).total_seconds()))
+        if timeout <= 0:
+            return
+    try:
+        cache.set(key_status_cache_key(email), {'data': data, 'status': status}, timeout)
+    except Exception as e:
+        logger.warning(f"Key status cache write failed for {email}: {str(e)}")
+
+
+def _delete_key_statuses(cache_keys):
+    try:
+        cache.delete_many(cache_keys)
+    except Exception as e:
+        logger.warning(f"Key status cache invalidation failed: {str(e)}")
+
+
+def invalidate_key_status(school_ids):
+    """
+    Drops the cached status payloads of every user of the given schools.
+
+    Inside a transaction the payloads are dropped immediately and again on commit, so a
+    concurrent request cannot re-cache the pre-commit state.
+
+    Args:
+        school_ids (iterable): The ids of the schools whose access keys changed.
+    """
+    school_ids = set(school_ids)
+    if not school_ids:
+        return
+    emails = User.objects.filter(school_id__in=school_ids).values_list('email', flat=True)
+    cache_keys = [key_status_cache_key(email) for email in emails]
+    if not cache_keys:
+        return
+    if transaction.get_connection().in_atomic_block:
+        _delete_key_statuses(cache_keys)
+    transaction.on_commit(lambda: _delete_key_statuses(cache_keys))
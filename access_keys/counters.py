@@ -0,0 +1,168 @@
+import logging
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from access_key_manager.locks import check_lease
+from access_keys.models import AccessKey, KeyStats
+from users.models import User
+
+
+"""
+Materialized access key counters backing `users.contexts.common_context_data`.
+"""
+
+logger = logging.getLogger(__name__)
+
+STATUS_FIELDS = {
+    'active': 'active_count',
+    'expired': 'expired_count',
+    'revoked': 'revoked_count',
+}
+
+
+def _count_keys_by_status(queryset):
+    """
+    Counts the keys of the given queryset per status with a single aggregate query.
+    """
+    return queryset.aggregate(**{
+        field: Count('pk', filter=Q(status=status)) for status, field in STATUS_FIELDS.items()
+    })
+
+
+def _deltas(old_status, new_status, count):
+    deltas = {'updated_at': timezone.now()}
+    if old_status in STATUS_FIELDS:
+        deltas[STATUS_FIELDS[old_status]] = F(STATUS_FIELDS[old_status]) - count
+    if new_status in STATUS_FIELDS:
+        deltas[STATUS_FIELDS[new_status]] = F(STATUS_FIELDS[new_status]) + count
+    return deltas
+
+
+def record_key_changes(school_counts, old_status=None, new_status=None):
+    """
+    Moves keys from one status counter to another for the given schools and globally.
+
+    Must be called in the same transaction as the change to the keys themselves.
+
+    Args:
+        school_counts (dict): The number of changed keys per school id.
+        old_status (str, optional): The status the keys left, or None for new keys.
+        new_status (str, optional): The status the keys entered, or None for deleted keys.
+    """
+    school_counts = {school_id: count for school_id, count in school_counts.items() if count}
+    if not school_counts or old_status == new_status:
+        return
+
+    existing = set(KeyStats.objects.filter(school_id__in=school_counts).values_list('school_id', flat=True))
+    missing = [school_id for school_id in school_counts if school_id not in existing]
+    if missing:
+        # Seed from the keys themselves, less this change, which the update below then applies.
+        # A concurrent first change may seed the same school; its row is kept and updated instead
+        seeded = {school_id: dict.fromkeys(STATUS_FIELDS.values(), 0) for school_id in missing}
+        rows = AccessKey.objects.filter(school_id__in=missing).values('school_id', 'status').annotate(total=Count('pk')).order_by()
+        for row in rows:
+            if row['status'] in STATUS_FIELDS:
+                seeded[row['school_id']][STATUS_FIELDS[row['status']]] = row['total']
+        for school_id, counts in seeded.items():
+            if old_status in STATUS_FIELDS:
+                counts[STATUS_FIELDS[old_status]] += school_counts[school_id]
+            if new_status in STATUS_FIELDS:
+                counts[STATUS_FIELDS[new_status]] -= school_counts[school_id]
+        KeyStats.objects.bulk_create(
+            [KeyStats(school_id=school_id, **counts) for school_id, counts in seeded.items()],
+            ignore_conflicts=True,
+        )
+
+    schools_by_count = defaultdict(list)
+    for school_id, count in school_counts.items():
+        schools_by_count[count].append(school_id)
+    for count, school_ids in schools_by_count.items():
+        KeyStats.objects.filter(school_id__in=school_ids).update(**_deltas(old_status, new_status, count))
+
+    KeyStats.objects.filter(school__isnull=True).update(**_deltas(old_status, new_status, sum(school_counts.values())))
+
+
+def record_key_change(school_id, old_status=None, new_status=None):
+    """
+    Moves a single key of the given school from one status counter to another.
+    """
+    record_key_changes({school_id: 1}, old_status, new_status)
+
+
+def refresh_registered_schools():
+    """
+    Recounts the schools with at least one user into the global row.
+    """
+    registered_schools = User.objects.filter(school__isnull=False).values('school').distinct().count()
+    KeyStats.objects.filter(school__isnull=True).update(registered_schools=registered_schools)
+
+
+def get_key_stats(school_id=None):
+    """
+    Returns the global counters and, optionally, the counters of one school, in one query.
+
+    Rows that do not exist yet are computed from the keys directly.
+
+    Args:
+        school_id (int, optional): The school whose counters to return as well.
+
+    Returns:
+        tuple: The global counters and the school counters (None if no school was given), as dicts.
+    """
+    scope = Q(school__isnull=True)
+    if school_id:
+        scope |= Q(school_id=school_id)
+    rows = {
+        row['school_id']: row
+        for row in KeyStats.objects.filter(scope).values('school_id', 'registered_schools', *STATUS_FIELDS.values())
+    }
+
+    global_stats = rows.get(None)
+    if global_stats is None:
+        logger.warning("Global key stats row missing. Counting keys directly.")
+        global_stats = _count_keys_by_status(AccessKey.objects.all())
+        global_stats['registered_schools'] = User.objects.filter(school__isnull=False).values('school').distinct().count()
+
+    school_stats = None
+    if school_id:
+        school_stats = rows.get(school_id) or _count_keys_by_status(AccessKey.objects.filter(school_id=school_id))
+    return global_stats, school_stats
+
+
+@transaction.atomic
+def rebuild_key_stats():
+    """
+    Recomputes every counter from the access keys and users, correcting any drift.
+
+    Returns:
+        int: The number of per-school rows written.
+    """
+    per_school = defaultdict(lambda: dict.fromkeys(STATUS_FIELDS.values(), 0))
+    for row in AccessKey.objects.values('school_id', 'status').annotate(total=Count('pk')).order_by():
+        if row['status'] in STATUS_FIELDS:
+            per_school[row['school_id']][STATUS_FIELDS[row['status']]] = row['total']
+
+    check_lease()
+    KeyStats.objects.filter(school__isnull=False).exclude(school_id__in=per_school).delete()
+    existing = {stats.school_id: stats for stats in KeyStats.objects.filter(school_id__in=per_school)}
+    now = timezone.now()
+    to_create, to_update = [], []
+    for school_id, counts in per_school.items():
+        stats = existing.get(school_id) or KeyStats(school_id=school_id)
+        for field, value in counts.items():
+            setattr(stats, field, value)
+        stats.updated_at = now
+        (to_update if stats.pk else to_create).append(stats)
+    KeyStats.objects.bulk_create(to_create, batch_size=1000)
+    KeyStats.objects.bulk_update(to_update, [*STATUS_FIELDS.values(), 'updated_at'], batch_size=1000)
+
+    global_counts = {field: sum(counts[field] for counts in per_school.values()) for field in STATUS_FIELDS.values()}
+    global_counts['updated_at'] = now
+    global_counts['registered_schools'] = User.objects.filter(school__isnull=False).values('school').distinct().count()
+    updated = KeyStats.objects.filter(school__isnull=True).update(**global_counts)
+    if not updated:
+        KeyStats.objects.create(school=None, **global_counts)
+
+    logger.info(f"Rebuilt key stats for {len(per_school)} schools.")
+    return len(per_school)
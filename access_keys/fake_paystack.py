@@ -0,0 +1,198 @@
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode
+
+
+"""
+A local stand-in for the Paystack transaction API, for tests and load tests.
+
+Point PAYSTACK_SETTINGS['BASE_URL'] (PAYSTACK_BASE_URL) at a running `FakePaystackServer` and the
+purchase flow runs end to end without api.paystack.co: `/transaction/initialize` records a
+transaction and returns an authorization URL on the fake server, `/pay/<reference>` stands in
+for the checkout page and redirects to the callback URL, and `/transaction/verify/<reference>`
+reports the transaction. Latency, server errors and hanging requests can be injected.
+"""
+
+
+class FakePaystackHandler(BaseHTTPRequestHandler):
+    """
+    Serves the fake Paystack API of its `FakePaystackServer`.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client timed out
+
+    def respond(self, payload, status=200):
+        """
+        Answers an API call, after the latency and with the faults the server injects.
+        """
+        self.server.calls.append((self.command, self.path))
+        fault_status, delay = self.server.plan_response()
+        time.sleep(delay)
+        if fault_status != 200:
+            self.send_json(fault_status, {'status': False, 'message': 'Server error'})
+        else:
+            self.send_json(status, payload)
+
+    def do_GET(self):
+        if self.path.startswith('/pay/'):
+            return self.checkout(self.path[len('/pay/'):])
+        if not self.path.startswith('/transaction/verify/'):
+            return self.send_json(404, {'status': False, 'message': 'Not found'})
+
+        reference = self.path.rsplit('/', 1)[-1]
+        transaction = self.server.transactions.get(reference)
+        if transaction is None:
+            return self.respond({'status': False, 'message': 'Transaction reference not found'}, status=400)
+        self.respond({
+            'status': True,
+            'message': 'Verification successful',
+            'data': {
+                'reference': reference,
+                'status': transaction['status'],
+                'amount': transaction['amount'],
+                'currency': transaction['currency'],
+                'customer': {'email': transaction['email']},
+            },
+        })
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path != '/transaction/initialize':
+            return self.send_json(404, {'status': False, 'message': 'Not found'})
+        try:
+            data = json.loads(body or b'{}')
+        except ValueError:
+            return self.send_json(400, {'status': False, 'message': 'Invalid JSON'})
+
+        reference = self.server.add_transaction(
+            email=data.get('email'),
+            amount=data.get('amount'),
+            currency=data.get('currency', 'GHS'),
+            callback_url=data.get('callback_url', ''),
+        )
+        self.respond({
+            'status': True,
+            'message': 'Authorization URL created',
+            'data': {
+                'authorization_url': f'{self.server.base_url}/pay/{reference}',
+                'access_code': reference,
+                'reference': reference,
+            },
+        })
+
+    def checkout(self, reference):
+        """
+        Stands in for the customer paying on the checkout page: redirects to the callback URL.
+        """
+        transaction = self.server.transactions.get(reference)
+        if transaction is None or not transaction['callback_url']:
+            return self.send_json(404, {'status': False, 'message': 'Not found'})
+        query = urlencode({'trxref': reference, 'reference': reference})
+        separator = '&' if '?' in transaction['callback_url'] else '?'
+        self.send_json(302, {}, headers={'Location': f"{transaction['callback_url']}{separator}{query}"})
+
+
+class FakePaystackServer(ThreadingHTTPServer):
+    """
+    A threaded fake Paystack API server.
+
+    API calls are answered after `latency` seconds, give or take `jitter`. A fraction
+    `error_rate` of them fail with a 500 response, a fraction `timeout_rate` hang for `hang`
+    seconds first, and a fraction `failure_rate` of the initialized transactions verify as
+    'failed'. Responses queued in `script`, as (status, delay) pairs, take precedence.
+
+    Attributes:
+        transactions (dict): The transactions per reference.
+        calls (list): The (method, path) of every API call.
+        script (list): Scripted (status, delay) responses, consumed one per API call.
+    """
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, jitter=0.0, error_rate=0.0, timeout_rate=0.0,
+                 hang=30.0, failure_rate=0.0, seed=None):
+        super().__init__(address, FakePaystackHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+        self.failure_rate = failure_rate
+        self.transactions = {}
+        self.calls = []
+        self.script = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        """
+        Serves requests in a background thread.
+
+        Returns:
+            FakePaystackServer: The server itself.
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def add_transaction(self, email, amount, currency='GHS', callback_url='', reference=None, status=None):
+        """
+        Records a transaction, as `/transaction/initialize` does.
+
+        Returns:
+            str: The transaction reference.
+        """
+        with self._lock:
+            if status is None:
+                status = 'failed' if self._random.random() < self.failure_rate else 'success'
+            reference = reference or uuid.uuid4().hex[:16]
+            self.transactions[reference] = {
+                'email': email,
+                'amount': amount,
+                'currency': currency,
+                'callback_url': callback_url,
+                'status': status,
+            }
+        return reference
+
+    def plan_response(self):
+        """
+        Returns the status and delay of the next API response.
+        """
+        with self._lock:
+            if self.script:
+                return self.script.pop(0)
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            roll = self._random.random()
+        if roll < self.timeout_rate:
+            return 200, self.hang
+        if roll < self.timeout_rate + self.error_rate:
+            return 500, delay
+        return 200, delay
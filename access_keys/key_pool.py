@@ -0,0 +1,144 @@
+import logging
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from access_key_manager.locks import check_lease
+from access_keys.models import AccessKey, PooledKey
+from access_keys.utils import generate_access_key
+
+
+"""
+Pool of pre-generated access keys.
+
+Keys are generated and checked for uniqueness in bulk, off the issuance path, by the
+`top_up_access_key_pool` task. Issuance claims keys from the pool inside its own transaction, so a
+rolled back issuance returns the claimed keys to the pool.
+"""
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_ATTEMPTS = 5
+
+
+def generate_unique_keys(count):
+    """
+    Generates keys that are used neither by an access key nor by the pool.
+
+    Candidates are checked against both tables with one query each, whatever the count.
+
+    Args:
+        count (int): The number of keys to generate.
+
+    Returns:
+        list: Up to `count` distinct keys; a candidate that collides is dropped, not replaced.
+    """
+    candidates = {generate_access_key() for _ in range(count)}
+    taken = set(AccessKey.objects.filter(key__in=candidates).values_list('key', flat=True))
+    taken.update(PooledKey.objects.filter(key__in=candidates).values_list('key', flat=True))
+    return list(candidates - taken)
+
+
+def top_up_key_pool(target=None, batch_size=None):
+    """
+    Fills the key pool up to `target` keys, inserting `batch_size` keys per round trip.
+
+    Args:
+        target (int, optional): The pool size to reach. Defaults to ACCESS_KEY_POOL_SIZE.
+        batch_size (int, optional): Keys per insert. Defaults to ACCESS_KEY_POOL_BATCH_SIZE.
+
+    Returns:
+        int: The number of keys added to the pool.
+    """
+    target = settings.ACCESS_KEY_POOL_SIZE if target is None else target
+    batch_size = batch_size or settings.ACCESS_KEY_POOL_BATCH_SIZE
+
+    before = PooledKey.objects.count()
+    missing = target - before
+    while missing > 0:
+        keys = generate_unique_keys(min(missing, batch_size))
+        check_lease()
+        # A key a concurrent top-up inserted first is skipped; the next top-up makes up for it
+        PooledKey.objects.bulk_create([PooledKey(key=key) for key in keys], ignore_conflicts=True)
+        missing -= len(keys)
+
+    added = PooledKey.objects.count() - before
+    logger.info(f"Added {added} keys to the access key pool.")
+    return added
+
+
+def claim_keys(count):
+    """
+    Takes `count` keys out of the pool, generating any the pool cannot supply.
+
+    Pooled keys are locked with SKIP LOCKED, so concurrent claims never wait on or receive the
+    same key. Call this inside the transaction that uses the keys. Generated fallback keys are
+    not checked for uniqueness; the caller must retry on IntegrityError.
+
+    Args:
+        count (int): The number of keys to claim.
+
+    Returns:
+        list: The claimed keys.
+    """
+    with transaction.atomic():
+        rows = list(
+            PooledKey.objects.select_for_update(skip_locked=True)
+            .order_by('pk')
+            .values_list('pk', 'key')[:count]
+        )
+        if rows:
+            PooledKey.objects.filter(pk__in=[pk for pk, _ in rows]).delete()
+
+    keys = [key for _, key in rows]
+    if len(keys) < count:
+        logger.warning(f"Access key pool is short by {count - len(keys)} keys. Generating them inline.")
+        keys.extend(generate_access_key() for _ in range(count - len(keys)))
+        transaction.on_commit(_request_top_up)
+    return keys
+
+
+def claim_key():
+    """
+    Takes one key out of the pool. See `claim_keys`.
+
+    Returns:
+        str: The claimed key.
+    """
+    return claim_keys(1)[0]
+
+
+def create_access_key(**fields):
+    """
+    Creates an access key with a key claimed from the pool.
+
+    No query checks the key beforehand. If the insert collides on the unique key column, the
+    access key is retried with a freshly generated key; any other IntegrityError is raised.
+
+    Args:
+        **fields: The AccessKey fields other than `key`.
+
+    Returns:
+        AccessKey: The created access key.
+
+    Raises:
+        IntegrityError: If the insert violates a constraint other than the key's uniqueness.
+    """
+    key = claim_key()
+    for attempt in range(MAX_KEY_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return AccessKey.objects.create(key=key, **fields)
+        except IntegrityError:
+            if attempt == MAX_KEY_ATTEMPTS - 1 or not AccessKey.objects.filter(key=key).exists():
+                raise
+            logger.warning(f"Access key {key} is already taken. Retrying with a new key.")
+            key = generate_access_key()
+
+
+def _request_top_up():
+    from access_keys.tasks import top_up_access_key_pool
+
+    try:
+        top_up_access_key_pool.delay()
+    except Exception as e:
+        # The periodic top-up will still refill the pool
+        logger.error(f"Could not enqueue key pool top-up: {str(e)}")
@@ -0,0 +1,228 @@
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.hashers import make_password
+from django.db.models import Count
+import requests
+from access_keys.counters import refresh_registered_schools
+from access_keys.models import AccessKey, Payment
+from users.models import School, User
+
+
+"""
+End-to-end load test of the purchase flow against a running server.
+
+Virtual school personnel log in, submit the billing form, initialize a payment, pay on the
+checkout page and poll the payment status, each in its own `requests.Session`. The server should
+have PAYSTACK_BASE_URL pointing at a `FakePaystackServer` and CALLBACK_URL pointing at its own
+callback view. `check_integrity` then looks for duplicate or conflicting keys in the database.
+"""
+
+STEPS = ('login', 'purchase_page', 'billing', 'initialize', 'checkout', 'callback', 'processing')
+
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+def create_load_test_users(schools, users_per_school, password, prefix):
+    """
+    Creates schools whose personnel may purchase access keys, in bulk.
+
+    Args:
+        schools (int): The number of schools.
+        users_per_school (int): The number of users per school. More than one makes users of
+            the same school race to buy its key.
+        password (str): The password of every user.
+        prefix (str): A prefix making the school names and usernames unique to this run.
+
+    Returns:
+        list: The usernames, interleaved so that the users of a school are adjacent.
+    """
+    password_hash = make_password(password)
+    school_rows = School.objects.bulk_create([School(name=f'{prefix} school {i}') for i in range(schools)])
+    users = User.objects.bulk_create([
+        User(
+            username=f'{prefix}_{school.pk}_{n}', email=f'{prefix}_{school.pk}_{n}@example.com', password=password_hash,
+            first_name='Load', last_name='Test', is_school_personnel=True, school=school,
+        )
+        for school in school_rows for n in range(users_per_school)
+    ])
+    refresh_registered_schools()
+    return [user.username for user in users]
+
+
+class PurchaseDriver:
+    """
+    Takes one virtual user through login, purchase, checkout and callback.
+
+    Args:
+        base_url (str): The root URL of the server under test.
+        password (str): The password of the virtual users.
+        poll_interval (float): The seconds between payment status polls.
+        poll_timeout (float): The seconds to wait for the payment to be processed.
+        timeout (float): The timeout of each HTTP request.
+    """
+
+    def __init__(self, base_url, password, poll_interval=0.2, poll_timeout=60.0, timeout=30.0):
+        self.base_url = base_url.rstrip('/')
+        self.password = password
+        self.poll_interval = poll_interval
+        self.poll_timeout = poll_timeout
+        self.timeout = timeout
+
+    def purchase(self, username):
+        """
+        Runs the purchase flow for one user.
+
+        Returns:
+            dict: The 'outcome' ('succeeded', 'failed', 'already_active' or 'error'), the payment
+                'reference', the seconds per step in 'steps', the 'total' seconds and, on error,
+                the 'error'.
+        """
+        result = {'username': username, 'reference': None, 'outcome': 'error', 'steps': {}, 'total': 0.0, 'error': ''}
+        session = requests.Session()
+        started = time.perf_counter()
+        try:
+            result['outcome'] = self._purchase(session, username, result)
+        except (requests.RequestException, RuntimeError) as e:
+            result['error'] = str(e)
+        finally:
+            result['total'] = time.perf_counter() - started
+            session.close()
+        return result
+
+    def _step(self, steps, name, method, url, session, **kwargs):
+        started = time.perf_counter()
+        response = session.request(method, url, timeout=self.timeout, allow_redirects=False, **kwargs)
+        steps[name] = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise RuntimeError(f'{name}: HTTP {response.status_code}')
+        return response
+
+    def _form(self, session, steps, name, path, data):
+        """
+        Posts a form with the CSRF token of the page it is on.
+        """
+        url = f'{self.base_url}{path}'
+        page = self._step(steps, f'{name}_page', 'GET', url, session)
+        if page.status_code == 302:
+            return page
+        match = CSRF_INPUT.search(page.text)
+        token = match.group(1) if match else session.cookies.get('csrftoken', '')
+        return self._step(steps, name, 'POST', url, session, data={**data, 'csrfmiddlewaretoken': token},
+                          headers={'Referer': url})
+
+    def _purchase(self, session, username, result):
+        steps = result['steps']
+        login = self._form(session, steps, 'login', '/login/', {'username': username, 'password': self.password})
+        if login.status_code != 302:
+            raise RuntimeError('login: rejected')
+        steps.pop('login_page', None)
+
+        billing = self._form(session, steps, 'billing', '/access-keys/purchase-access-key/', {
+            'email': f'{username}@example.com',
+            'payment_method': 'mtn_momo',
+            'mobile_money_number': '0241234567',
+            'confirm_purchase': 'on',
+        })
+        steps['purchase_page'] = steps.pop('billing_page')
+        if 'initialize-payment' not in billing.headers.get('Location', ''):
+            # The school already has an active key, bought by a colleague
+            return 'already_active'
+
+        initialize = self._step(steps, 'initialize', 'POST', f'{self.base_url}/access-keys/initialize-payment/', session,
+                                data={'csrfmiddlewaretoken': session.cookies.get('csrftoken', '')},
+                                headers={'Referer': f'{self.base_url}/access-keys/purchase-access-key/'})
+        authorization_url = initialize.headers.get('Location', '')
+        if not authorization_url.startswith('http'):
+            raise RuntimeError('initialize: payment was not initialized')
+
+        checkout = self._step(steps, 'checkout', 'GET', authorization_url, session)
+        callback_url = checkout.headers['Location']
+        reference = result['reference'] = re.search(r'reference=([^&]+)', callback_url).group(1)
+        self._step(steps, 'callback', 'GET', callback_url, session)
+
+        started = time.perf_counter()
+        status_url = f'{self.base_url}/access-keys/payment-status/{reference}/'
+        while time.perf_counter() - started < self.poll_timeout:
+            status = session.get(status_url, timeout=self.timeout).json().get('status')
+            if status != Payment.PENDING:
+                steps['processing'] = time.perf_counter() - started
+                return status
+            time.sleep(self.poll_interval)
+        raise RuntimeError(f'processing: payment {reference} still pending after {self.poll_timeout}s')
+
+
+def run_load_test(driver, usernames, concurrency):
+    """
+    Runs the purchase flow for every user, `concurrency` users at a time.
+
+    Returns:
+        tuple: The per-user results and the elapsed seconds.
+    """
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(driver.purchase, usernames))
+    return results, time.perf_counter() - started
+
+
+def _percentiles(values):
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+
+    def pick(percent):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))] * 1000, 1)
+
+    return {'p50_ms': pick(50), 'p95_ms': pick(95), 'p99_ms': pick(99), 'max_ms': round(ordered[-1] * 1000, 1)}
+
+
+def summarize(results, elapsed):
+    """
+    Summarizes a load test run.
+
+    Returns:
+        dict: The outcome counts, the completed purchases per second, the end-to-end and
+            per-step latency percentiles, and the most common errors.
+    """
+    outcomes = Counter(result['outcome'] for result in results)
+    return {
+        'users': len(results),
+        'seconds': round(elapsed, 2),
+        'outcomes': dict(outcomes),
+        'purchases_per_second': round(outcomes['succeeded'] / elapsed, 2) if elapsed else 0.0,
+        'latency': _percentiles([result['total'] for result in results if result['outcome'] != 'error']),
+        'steps': {
+            step: _percentiles([result['steps'][step] for result in results if step in result['steps']])
+            for step in STEPS
+        },
+        'errors': dict(Counter(result['error'] for result in results if result['error']).most_common(10)),
+    }
+
+
+def check_integrity(usernames, references):
+    """
+    Looks for keys and payments that concurrency should never produce.
+
+    Args:
+        usernames (list): The virtual users.
+        references (list): The references of the payments they made.
+
+    Returns:
+        dict: The number of schools with more than one active key, of key strings used more than
+            once, of succeeded payments without a key, of keys issued and of succeeded payments,
+            and the failure messages of the failed payments.
+    """
+    users = User.objects.filter(username__in=usernames)
+    school_ids = users.values('school_id')
+    payments = Payment.objects.filter(reference__in=references)
+    keys = AccessKey.objects.filter(school_id__in=school_ids)
+    return {
+        'schools_with_multiple_active_keys': keys.filter(status='active').values('school_id')
+            .annotate(n=Count('pk')).filter(n__gt=1).count(),
+        'duplicate_keys': AccessKey.objects.values('key').annotate(n=Count('pk')).filter(n__gt=1).count(),
+        'succeeded_without_key': payments.filter(status=Payment.SUCCEEDED, access_key__isnull=True).count(),
+        'keys_issued': keys.count(),
+        'payments_succeeded': payments.filter(status=Payment.SUCCEEDED).count(),
+        'payment_failures': dict(Counter(payments.filter(status=Payment.FAILED).values_list('message', flat=True))),
+    }
@@ -0,0 +1,85 @@
+import logging
+import os
+import statistics
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+from access_key_manager.log import NonBlockingHandler
+
+
+class FsyncFileHandler(logging.FileHandler):
+    """
+    A file handler that syncs every record to disk, standing in for a slow or busy disk.
+    """
+
+    def emit(self, record):
+        super().emit(record)
+        self.flush()
+        os.fsync(self.stream.fileno())
+
+
+class Command(BaseCommand):
+    """
+    Measures the time a request spends logging with a direct file handler and with the
+    queue-backed handler configured in settings.LOGGING.
+
+    Example:
+        python manage.py benchmark_logging --requests 5000 --lines 10 --fsync
+    """
+    help = 'Compare the per-request logging overhead of a direct file handler and the queue-backed handler.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='The number of simulated requests.')
+        parser.add_argument('--lines', type=int, default=5, help='The number of log lines per request.')
+        parser.add_argument('--fsync', action='store_true', help='Sync every record to disk to simulate a slow disk.')
+
+    def handle(self, *args, **options):
+        file_handler_class = 'access_keys.management.commands.benchmark_logging.FsyncFileHandler' if options['fsync'] else 'logging.FileHandler'
+
+        with tempfile.TemporaryDirectory() as directory:
+            direct = FsyncFileHandler(os.path.join(directory, 'direct.log')) if options['fsync'] else logging.FileHandler(os.path.join(directory, 'direct.log'))
+            direct.setFormatter(logging.Formatter('{levelname} {asctime} {module} {message}', style='{'))
+            queued = NonBlockingHandler(
+                {'class': file_handler_class, 'filename': os.path.join(directory, 'queued.log')},
+                target_formatter='access_key_manager.log.JSONFormatter',
+            )
+
+            self.stdout.write(f"{'handler':<12}{'mean (us)':>12}{'p50 (us)':>12}{'p99 (us)':>12}{'total (s)':>12}")
+            for name, handler in (('direct', direct), ('queued', queued)):
+                timings, total = self.run(handler, options['requests'], options['lines'])
+                self.stdout.write(
+                    f"{name:<12}{statistics.mean(timings):>12.1f}{statistics.median(timings):>12.1f}"
+                    f"{self.percentile(timings, 99):>12.1f}{total:>12.2f}"
+                )
+                if handler is queued and handler.dropped:
+                    self.stdout.write(self.style.WARNING(f'The queued handler dropped {handler.dropped} records.'))
+
+    def run(self, handler, requests, lines):
+        """
+        Logs `lines` records per simulated request and times each request in the calling thread.
+
+        Returns:
+            tuple: The per-request timings in microseconds, and the total seconds including the
+                time the handler takes to write out every record.
+        """
+        logger = logging.getLogger(f'benchmark_logging.{id(handler)}')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+
+        timings = []
+        started = time.perf_counter()
+        for request in range(requests):
+            request_started = time.perf_counter()
+            for line in range(lines):
+                logger.info(f"Request {request}: line {line} of the benchmark.")
+            timings.append((time.perf_counter() - request_started) * 1e6)
+
+        # Closing the queued handler waits until the listener has written every record
+        logger.removeHandler(handler)
+        handler.close()
+        return timings, time.perf_counter() - started
+
+    def percentile(self, values, percent):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
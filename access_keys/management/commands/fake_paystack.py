@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from access_keys.fake_paystack import FakePaystackServer
+
+
+class Command(BaseCommand):
+    """
+    Runs a local stand-in for the Paystack transaction API.
+
+    Example:
+        python manage.py fake_paystack --port 8001 --latency 0.3 --jitter 0.2 --error-rate 0.02 --timeout-rate 0.01
+        PAYSTACK_BASE_URL=http://127.0.0.1:8001 CALLBACK_URL=http://127.0.0.1:8000/access-keys/paystack/callback/ gunicorn ...
+    """
+    help = 'Run a fake Paystack API server with configurable latency, errors and timeouts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='The address to listen on.')
+        parser.add_argument('--port', type=int, default=8001, help='The port to listen on.')
+        parser.add_argument('--latency', type=float, default=0.0, help='The mean response latency, in seconds.')
+        parser.add_argument('--jitter', type=float, default=0.0, help='The latency varies by up to this many seconds.')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='The fraction of calls answered with a 500.')
+        parser.add_argument('--timeout-rate', type=float, default=0.0, help='The fraction of calls that hang.')
+        parser.add_argument('--hang', type=float, default=30.0, help='How long hanging calls hang, in seconds.')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='The fraction of transactions that verify as failed.')
+        parser.add_argument('--seed', type=int, help='The random seed of the injected faults.')
+
+    def handle(self, *args, **options):
+        server = FakePaystackServer(
+            (options['host'], options['port']),
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            timeout_rate=options['timeout_rate'],
+            hang=options['hang'],
+            failure_rate=options['failure_rate'],
+            seed=options['seed'],
+        )
+        self.stdout.write(f'Fake Paystack API listening on {server.base_url}. Press Ctrl+C to stop.')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        self.stdout.write(f'Served {len(server.calls)} API calls for {len(server.transactions)} transactions.')
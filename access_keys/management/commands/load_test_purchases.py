@@ -0,0 +1,53 @@
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from access_keys.load_test import PurchaseDriver, check_integrity, create_load_test_users, run_load_test, summarize
+
+
+class Command(BaseCommand):
+    """
+    Drives concurrent school personnel through the purchase flow of a running server.
+
+    The server must use the same database as this command, point PAYSTACK_BASE_URL at a fake
+    Paystack server (`manage.py fake_paystack`) and point CALLBACK_URL at its own callback view.
+    Each run creates its own schools and users.
+
+    Example:
+        python manage.py load_test_purchases --base-url http://127.0.0.1:8000 --schools 50 --users-per-school 2 --concurrency 20
+    """
+    help = 'Load test the purchase flow end to end and check the database for conflicting keys.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='The root URL of the server under test.')
+        parser.add_argument('--schools', type=int, default=20, help='The number of schools buying a key.')
+        parser.add_argument('--users-per-school', type=int, default=2, help='The number of users racing to buy each key.')
+        parser.add_argument('--concurrency', type=int, default=10, help='The number of users purchasing at once.')
+        parser.add_argument('--password', default='load-test-password', help='The password of the created users.')
+        parser.add_argument('--poll-timeout', type=float, default=60.0, help='Seconds to wait for a payment to be processed.')
+        parser.add_argument('--output', help='Save the summary to this JSON file.')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['schools'] < 1 or options['users_per_school'] < 1:
+            raise CommandError('--schools, --users-per-school and --concurrency must be at least 1.')
+
+        prefix = f'load{int(time.time())}'
+        usernames = create_load_test_users(options['schools'], options['users_per_school'], options['password'], prefix)
+        self.stdout.write(f"Created {len(usernames)} users in {options['schools']} schools ({prefix}).")
+
+        driver = PurchaseDriver(options['base_url'], options['password'], poll_timeout=options['poll_timeout'])
+        results, elapsed = run_load_test(driver, usernames, options['concurrency'])
+        summary = summarize(results, elapsed)
+        summary['integrity'] = check_integrity(usernames, [result['reference'] for result in results if result['reference']])
+
+        self.stdout.write(json.dumps(summary, indent=2))
+        integrity = summary['integrity']
+        if integrity['schools_with_multiple_active_keys'] or integrity['duplicate_keys'] or integrity['succeeded_without_key']:
+            self.stdout.write(self.style.ERROR('Integrity violations found.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"{summary['outcomes'].get('succeeded', 0)} purchases in {summary['seconds']}s "
+                f"({summary['purchases_per_second']}/s), no integrity violations."
+            ))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(summary, f, indent=2)
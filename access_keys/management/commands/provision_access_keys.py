@@ -0,0 +1,80 @@
+from datetime import datetime, time
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from access_keys.services import provision_access_keys
+from users.models import User
+
+
+class Command(BaseCommand):
+    """
+    Issues an active access key to each of many schools at once.
+
+    Example:
+        python manage.py provision_access_keys 1 2 3 --expires 2025-12-31
+        python manage.py provision_access_keys --file district_schools.txt --expires 2025-12-31 --price 80
+    """
+    help = 'Issue an active access key to each of the given schools in one transaction.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('schools', nargs='*', type=int, help='The ids of the schools to provision.')
+        parser.add_argument('--file', help='A file with one school id per line.')
+        parser.add_argument('--expires', required=True, help='The expiry date of the keys (YYYY-MM-DD or an ISO datetime).')
+        parser.add_argument('--price', default=str(settings.ACCESS_KEY_PRICE), help='The price recorded on each key.')
+        parser.add_argument('--user', help='The username recorded on the key logs. Defaults to the first superuser.')
+
+    def handle(self, *args, **options):
+        school_ids = list(options['schools'])
+        if options['file']:
+            try:
+                with open(options['file']) as f:
+                    school_ids.extend(int(line) for line in f if line.strip())
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read school ids from {options['file']}: {e}")
+        if not school_ids:
+            raise CommandError('No schools given.')
+
+        try:
+            price = Decimal(options['price'])
+        except InvalidOperation:
+            raise CommandError(f"Invalid price: {options['price']}")
+
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+        else:
+            user = User.objects.filter(is_superuser=True).order_by('pk').first()
+        if not user:
+            raise CommandError('No user to record on the key logs. Pass --user or create a superuser.')
+
+        try:
+            results = provision_access_keys(school_ids, self.parse_expiry(options['expires']), price, user)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for school_id, result in results.items():
+            if result['status'] == 'issued':
+                self.stdout.write(f"{school_id}\tissued\t{result['key']}")
+            else:
+                self.stdout.write(f"{school_id}\t{result['status']}")
+
+        issued = sum(result['status'] == 'issued' for result in results.values())
+        self.stdout.write(self.style.SUCCESS(f'Issued {issued} access keys for {len(results)} schools.'))
+
+    def parse_expiry(self, value):
+        """
+        Parses an ISO datetime, or a date meaning the end of that day, in the current time zone.
+        """
+        try:
+            expiry = parse_datetime(value)
+            day = parse_date(value) if expiry is None else None
+        except ValueError:
+            expiry = day = None
+        if expiry is None:
+            if day is None:
+                raise CommandError(f'Invalid expiry date: {value}')
+            expiry = datetime.combine(day, time.max)
+        if timezone.is_naive(expiry):
+            expiry = timezone.make_aware(expiry)
+        return expiry
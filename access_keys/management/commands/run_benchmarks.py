@@ -0,0 +1,100 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from django.utils import timezone
+from access_keys.benchmarks import SCENARIOS, compare_results, environment, offline, run_scenarios, seed_data
+
+
+class Command(BaseCommand):
+    """
+    Seeds a throwaway test database and benchmarks the hot paths against it.
+
+    The database is created like the test runner's: an in-memory SQLite database by default, or
+    `test_<name>` on the server DATABASE_URL points to, e.g. a local Postgres. Paystack and the
+    Celery broker are stubbed, so no network access is needed.
+
+    Example:
+        python manage.py run_benchmarks --schools 1000 --logs 50000 --output bench/baseline.json
+        python manage.py run_benchmarks --schools 1000 --logs 50000 --compare bench/baseline.json
+    """
+    help = 'Benchmark the hot paths against a seeded test database and optionally compare with an earlier run.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f"The scenarios to run: {', '.join(SCENARIOS)}. Defaults to all.")
+        parser.add_argument('--schools', type=int, default=200, help='The number of schools with keys.')
+        parser.add_argument('--users-per-school', type=int, default=2, help='The number of users per school.')
+        parser.add_argument('--keys-per-school', type=int, default=5, help='The number of keys per school.')
+        parser.add_argument('--logs', type=int, default=5000, help='The number of key log entries.')
+        parser.add_argument('--expiring', type=int, default=100, help='The number of keys update_key_statuses expires per run.')
+        parser.add_argument('--iterations', type=int, default=50, help='The number of timed iterations per scenario.')
+        parser.add_argument('--warmup', type=int, default=5, help='The number of untimed iterations per scenario.')
+        parser.add_argument('--seed', type=int, default=0, help='The random seed of the data set.')
+        parser.add_argument('--output', help='Save the results to this JSON file.')
+        parser.add_argument('--compare', help='Compare the results with this earlier JSON file.')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1.')
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        previous = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    previous = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read {options['compare']}: {e}")
+
+        volumes = {
+            'schools': options['schools'],
+            'users_per_school': options['users_per_school'],
+            'keys_per_school': options['keys_per_school'],
+            'logs': options['logs'],
+            'expiring': options['expiring'],
+            'seed': options['seed'],
+        }
+        # Every payment scenario iteration issues a key to a school that has none yet
+        buyers = options['iterations'] + options['warmup'] + 1
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with offline() as paystack:
+                self.stdout.write(f"Seeding {volumes['schools']} schools and {volumes['logs']} key logs...")
+                data = seed_data(buyers=buyers, **volumes)
+                results = {
+                    'created_at': timezone.now().isoformat(),
+                    'environment': environment(),
+                    'volumes': volumes,
+                    'scenarios': run_scenarios(data, paystack, names, options['iterations'], options['warmup']),
+                }
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        self.report(results)
+        if previous:
+            self.report_comparison(previous, results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results saved to {options['output']}."))
+
+    def report(self, results):
+        self.stdout.write(f"\n{'scenario':<22}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'queries':>10}{'peak KiB':>10}")
+        for name, result in results['scenarios'].items():
+            self.stdout.write(
+                f"{name:<22}{result['p50_ms']:>10.3f}{result['p90_ms']:>10.3f}{result['p99_ms']:>10.3f}"
+                f"{result['max_ms']:>10.3f}{result['queries']:>10.2f}{result['peak_memory_kb']:>10.1f}"
+            )
+
+    def report_comparison(self, previous, results):
+        if previous.get('volumes') != results['volumes']:
+            self.stdout.write(self.style.WARNING('The compared runs used different data volumes.'))
+        self.stdout.write(f"\n{'scenario':<22}{'metric':<16}{'before':>12}{'after':>12}{'change':>10}")
+        for name, metric, before, after, change in compare_results(previous, results):
+            change_text = 'n/a' if change is None else f'{change:+.1f}%'
+            self.stdout.write(f'{name:<22}{metric:<16}{before:>12}{after:>12}{change_text:>10}')
@@ -0,0 +1,48 @@
+# Generated by Django 5.0.6 on 2026-10-18 13:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_key_stats(apps, schema_editor):
+    AccessKey = apps.get_model('access_keys', 'AccessKey')
+    KeyStats = apps.get_model('access_keys', 'KeyStats')
+    User = apps.get_model('users', 'User')
+    fields = {'active': 'active_count', 'expired': 'expired_count', 'revoked': 'revoked_count'}
+
+    per_school = {}
+    for row in AccessKey.objects.values('school_id', 'status').annotate(total=Count('pk')).order_by():
+        if row['status'] in fields:
+            per_school.setdefault(row['school_id'], {})[fields[row['status']]] = row['total']
+    KeyStats.objects.bulk_create([KeyStats(school_id=school_id, **counts) for school_id, counts in per_school.items()])
+
+    KeyStats.objects.create(
+        school=None,
+        registered_schools=User.objects.filter(school__isnull=False).values('school').distinct().count(),
+        **{field: sum(counts.get(field, 0) for counts in per_school.values()) for field in fields.values()},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_keys', '0002_initial'),
+        ('users', '0003_merge_0001_add_schools_0002_add_schools'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('active_count', models.IntegerField(default=0)),
+                ('expired_count', models.IntegerField(default=0)),
+                ('revoked_count', models.IntegerField(default=0)),
+                ('registered_schools', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('school', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='key_stats', to='users.school')),
+            ],
+        ),
+        migrations.RunPython(populate_key_stats, migrations.RunPython.noop),
+    ]
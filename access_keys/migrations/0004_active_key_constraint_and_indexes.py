@@ -0,0 +1,77 @@
+# Generated by Django 5.0.6 on 2026-10-18 13:39
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def expire_duplicate_active_keys(apps, schema_editor):
+    # Keep only the most recently procured active key of each school so the constraint can be added
+    AccessKey = apps.get_model('access_keys', 'AccessKey')
+    KeyLog = apps.get_model('access_keys', 'KeyLog')
+    KeyStats = apps.get_model('access_keys', 'KeyStats')
+    duplicated = (
+        AccessKey.objects.filter(status='active').values('school_id')
+        .annotate(total=Count('pk')).filter(total__gt=1).values_list('school_id', flat=True)
+    )
+    for school_id in list(duplicated):
+        keys = AccessKey.objects.filter(school_id=school_id, status='active').order_by('-procurement_date', '-pk')
+        kept, *stale = keys.select_related('school')
+        stale_ids = [access_key.pk for access_key in stale]
+        AccessKey.objects.filter(pk__in=stale_ids).update(status='expired')
+        # Record why each key expired; the wording is kept as free text by the event type backfill
+        KeyLog.objects.bulk_create([
+            KeyLog(
+                access_key_id=access_key.pk,
+                user_id=access_key.assigned_to_id,
+                action=(
+                    f"Duplicate active access key {access_key.key} of school {kept.school.name} expired "
+                    f"when one active key per school was enforced; key {kept.key} stays active"
+                )[:255],
+            )
+            for access_key in stale
+        ])
+        for stats in (KeyStats.objects.filter(school_id=school_id), KeyStats.objects.filter(school__isnull=True)):
+            stats.update(active_count=F('active_count') - len(stale_ids), expired_count=F('expired_count') + len(stale_ids))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_keys', '0003_keystats'),
+        ('users', '0003_merge_0001_add_schools_0002_add_schools'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='accesskey',
+            name='status',
+            field=models.CharField(choices=[('active', 'Active'), ('expired', 'Expired'), ('revoked', 'Revoked')], max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='accesskey',
+            index=models.Index(fields=['status', 'expiry_date'], name='accesskey_status_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accesskey',
+            index=models.Index(fields=['school', 'status'], name='accesskey_school_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accesskey',
+            index=models.Index(fields=['school', '-procurement_date'], name='accesskey_school_procured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accesskey',
+            index=models.Index(fields=['-procurement_date', '-id'], name='accesskey_procured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='keylog',
+            index=models.Index(fields=['-timestamp', '-id'], name='keylog_timestamp_idx'),
+        ),
+        migrations.RunPython(expire_duplicate_active_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='accesskey',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'active')), fields=('school',), name='unique_active_key_per_school'),
+        ),
+    ]
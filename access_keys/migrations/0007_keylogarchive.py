@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_keys', '0006_pooledkey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeyLogArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month_start', models.DateTimeField(unique=True)),
+                ('month_end', models.DateTimeField()),
+                ('path', models.CharField(max_length=255)),
+                ('row_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:10
+
+import re
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+ACTION_PATTERN = re.compile(r'^Access key (?P<key>\S+) (?P<event_type>purchased|provisioned|revoked|expired) for school .*$')
+BATCH_SIZE = 2000
+
+
+def backfill_event_types(apps, schema_editor):
+    # Parse the free-text actions into event types and payloads, and copy the school of each key
+    KeyLog = apps.get_model('access_keys', 'KeyLog')
+    batch = []
+    for log in KeyLog.objects.select_related('access_key').iterator(chunk_size=BATCH_SIZE):
+        log.school_id = log.access_key.school_id
+        match = ACTION_PATTERN.match(log.action)
+        if match:
+            log.event_type = match['event_type']
+            log.payload = {'key': match['key']}
+            log.action = ''
+        batch.append(log)
+        if len(batch) >= BATCH_SIZE:
+            KeyLog.objects.bulk_update(batch, ['school_id', 'event_type', 'payload', 'action'])
+            batch = []
+    if batch:
+        KeyLog.objects.bulk_update(batch, ['school_id', 'event_type', 'payload', 'action'])
+
+
+def restore_actions(apps, schema_editor):
+    KeyLog = apps.get_model('access_keys', 'KeyLog')
+    batch = []
+    logs = KeyLog.objects.exclude(event_type='other').select_related('school')
+    for log in logs.iterator(chunk_size=BATCH_SIZE):
+        school_name = log.school.name if log.school_id else ''
+        log.action = f"Access key {log.payload.get('key', '')} {log.event_type} for school {school_name}"
+        batch.append(log)
+        if len(batch) >= BATCH_SIZE:
+            KeyLog.objects.bulk_update(batch, ['action'])
+            batch = []
+    if batch:
+        KeyLog.objects.bulk_update(batch, ['action'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_keys', '0007_keylogarchive'),
+        ('users', '0004_emailoutbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='keylog',
+            name='event_type',
+            field=models.CharField(choices=[('purchased', 'Purchased'), ('provisioned', 'Provisioned'), ('revoked', 'Revoked'), ('expired', 'Expired'), ('other', 'Other')], default='other', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='keylog',
+            name='payload',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='keylog',
+            name='school',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='key_logs', to='users.school'),
+        ),
+        migrations.AlterField(
+            model_name='keylog',
+            name='action',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(backfill_event_types, restore_actions),
+        migrations.AddIndex(
+            model_name='keylog',
+            index=models.Index(fields=['event_type', 'timestamp'], name='keylog_event_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='keylog',
+            index=models.Index(fields=['school', '-timestamp'], name='keylog_school_timestamp_idx'),
+        ),
+    ]
@@ -10,6 +10,9 @@ def validate_active_key(access_key):
     """
     Validates that a school can have only one active access key at a time.
 
+    No longer attached to AccessKey.status, which is now guarded by the database constraint
+    'unique_active_key_per_school'; kept because historical migrations reference it.
+
     Args:
         access_key (AccessKey): The AccessKey instance to be validated.
 
@@ -48,8 +51,7 @@ class AccessKey(models.Model):
     key = models.CharField(max_length=20, unique=True)
     school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='access_keys')
     status = models.CharField(max_length=10,
-                               choices=[('active', 'Active'), ('expired', 'Expired'), ('revoked', 'Revoked')],
-                               validators=[validate_active_key])
+                               choices=[('active', 'Active'), ('expired', 'Expired'), ('revoked', 'Revoked')])
 
     assigned_to = models.ForeignKey(User, on_delete=models.CASCADE, related_name='access_keys')
     procurement_date = models.DateTimeField(auto_now_add=True)
@@ -58,6 +60,18 @@ class AccessKey(models.Model):
     revoked_on = models.DateTimeField(null=True, blank=True)
     price = models.DecimalField(max_digits=8, decimal_places=2)
 
+    class Meta:
+        constraints = [
+            # A school can have only one active access key at a time
+            models.UniqueConstraint(fields=['school'], condition=models.Q(status='active'), name='unique_active_key_per_school'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'expiry_date'], name='accesskey_status_expiry_idx'),
+            models.Index(fields=['school', 'status'], name='accesskey_school_status_idx'),
+            models.Index(fields=['school', '-procurement_date'], name='accesskey_school_procured_idx'),
+            models.Index(fields=['-procurement_date', '-id'], name='accesskey_procured_idx'),
+        ]
+
     def __str__(self):
         return f"{self.key} - {self.school.name} - {self.status}"
     
@@ -66,14 +80,191 @@ class KeyLog(models.Model):
     """
     Model representing a log entry for an action performed on an access key.
 
+    Entries store a compact event type, the school and a small JSON payload; the human-readable
+    message is only rendered for display (see `message`).
+
     Attributes:
-        action (CharField): A description of the action performed on the access key.
+        event_type (CharField): The kind of event.
+        school (ForeignKey): The school of the access key, denormalized for filtering.
+        payload (JSONField): The event details needed to render its message, such as the key.
+        action (CharField): A free-text description, for events of type 'other' only.
         user (ForeignKey): The user who performed the action.
         access_key (ForeignKey): The access key on which the action was performed.
         timestamp (DateTimeField): The timestamp when the action was performed.
     """
+    PURCHASED = 'purchased'
+    PROVISIONED = 'provisioned'
+    REVOKED = 'revoked'
+    EXPIRED = 'expired'
+    OTHER = 'other'
+    EVENT_TYPES = [
+        (PURCHASED, 'Purchased'),
+        (PROVISIONED, 'Provisioned'),
+        (REVOKED, 'Revoked'),
+        (EXPIRED, 'Expired'),
+        (OTHER, 'Other'),
+    ]
+    EVENT_MESSAGES = {
+        PURCHASED: 'Access key {key} purchased for school {school}',
+        PROVISIONED: 'Access key {key} provisioned for school {school}',
+        REVOKED: 'Access key {key} revoked for school {school}',
+        EXPIRED: 'Access key {key} expired for school {school}',
+    }
 
-    action = models.CharField(max_length=255)
+    event_type = models.CharField(max_length=12, choices=EVENT_TYPES, default=OTHER)
+    school = models.ForeignKey(School, on_delete=models.CASCADE, null=True, blank=True, related_name='key_logs')
+    payload = models.JSONField(default=dict, blank=True)
+    action = models.CharField(max_length=255, blank=True, default='')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     access_key = models.ForeignKey(AccessKey, on_delete=models.CASCADE, related_name='key_logs')
     timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-timestamp', '-id'], name='keylog_timestamp_idx'),
+            models.Index(fields=['event_type', 'timestamp'], name='keylog_event_timestamp_idx'),
+            models.Index(fields=['school', '-timestamp'], name='keylog_school_timestamp_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.school_id is None and self.access_key_id is not None:
+            self.school_id = self.access_key.school_id
+        super().save(*args, **kwargs)
+
+    @property
+    def message(self):
+        """
+        Returns the human-readable message of the entry. Fetches the school unless it was
+        selected with the entry.
+        """
+        school_name = self.school.name if self.school_id else ''
+        return render_key_log_message(self.event_type, self.payload, school_name, self.action)
+
+
+def render_key_log_message(event_type, payload, school_name, action=''):
+    """
+    Renders the message of a key log entry from its stored fields.
+
+    Args:
+        event_type (str): The event type of the entry.
+        payload (dict): The payload of the entry.
+        school_name (str): The name of the entry's school.
+        action (str, optional): The free-text description, used for events of type 'other'.
+
+    Returns:
+        str: The message.
+    """
+    template = KeyLog.EVENT_MESSAGES.get(event_type)
+    if template is None:
+        return action
+    return template.format(key=(payload or {}).get('key', ''), school=school_name)
+
+
+class KeyStats(models.Model):
+    """
+    Model holding materialized access key counters.
+
+    There is one row per school that has bought a key, plus a single global row with no school.
+    The counters are kept in step by the purchase, revoke and expire code paths (see
+    `access_keys.counters`) and rebuilt periodically to correct any drift.
+
+    Attributes:
+        school (OneToOneField): The school the counters belong to, or None for the global row.
+        active_count (IntegerField): The number of active keys.
+        expired_count (IntegerField): The number of expired keys.
+        revoked_count (IntegerField): The number of revoked keys.
+        registered_schools (IntegerField): The number of schools with at least one user (global row only).
+        updated_at (DateTimeField): The timestamp of the last change to the counters.
+    """
+    school = models.OneToOneField(School, on_delete=models.CASCADE, null=True, blank=True, related_name='key_stats')
+    active_count = models.IntegerField(default=0)
+    expired_count = models.IntegerField(default=0)
+    revoked_count = models.IntegerField(default=0)
+    registered_schools = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        scope = self.school.name if self.school_id else 'All schools'
+        return f"{scope} - {self.active_count} active, {self.expired_count} expired, {self.revoked_count} revoked"
+
+
+class Payment(models.Model):
+    """
+    Model representing a Paystack payment and the access key it was exchanged for.
+
+    A payment is recorded as soon as its reference reaches the app and is then processed once,
+    asynchronously; the unique reference makes that processing idempotent.
+
+    Attributes:
+        reference (CharField): The Paystack transaction reference.
+        status (CharField): The processing status of the payment.
+        user (ForeignKey): The user who paid, once known.
+        access_key (OneToOneField): The access key issued for the payment.
+        amount (DecimalField): The amount paid, in cedis.
+        message (CharField): The reason a payment failed, if it did.
+        created_at (DateTimeField): The timestamp when the reference was recorded.
+        processed_at (DateTimeField): The timestamp when processing finished.
+    """
+    PENDING = 'pending'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'Pending'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    reference = models.CharField(max_length=100, unique=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='payments')
+    access_key = models.OneToOneField(AccessKey, on_delete=models.SET_NULL, null=True, blank=True, related_name='payment')
+    amount = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
+    message = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.reference} - {self.status}"
+
+
+class PooledKey(models.Model):
+    """
+    Model representing a pre-generated access key waiting to be issued.
+
+    The pool is topped up in bulk by the `top_up_access_key_pool` task, so issuing a key only has to
+    claim a row (see `access_keys.key_pool`).
+
+    Attributes:
+        key (CharField): The pre-generated key.
+        created_at (DateTimeField): The timestamp when the key was generated.
+    """
+    key = models.CharField(max_length=20, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.key
+
+
+class KeyLogArchive(models.Model):
+    """
+    Model recording a month of key logs moved out of the KeyLog table into a compressed file.
+
+    Months are archived oldest first, so the archives always cover a contiguous range that ends
+    where the rows still in the KeyLog table begin (see `access_keys.archive`).
+
+    Attributes:
+        month_start (DateTimeField): The start of the archived month.
+        month_end (DateTimeField): The start of the following month.
+        path (CharField): The name of the gzip-compressed JSON Lines file in the key log archive storage.
+        row_count (IntegerField): The number of archived log entries.
+        created_at (DateTimeField): The timestamp when the month was archived.
+    """
+    month_start = models.DateTimeField(unique=True)
+    month_end = models.DateTimeField()
+    path = models.CharField(max_length=255)
+    row_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.month_start:%Y-%m} - {self.row_count} logs"
+
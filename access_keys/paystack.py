@@ -0,0 +1,272 @@
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from urllib.parse import quote
+from django.conf import settings
+import requests
+from access_key_manager import metrics
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+"""
+Shared client for the Paystack transaction API.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class PaystackError(requests.RequestException):
+    """
+    Raised when a Paystack call fails. Subclasses RequestException so callers handling
+    network errors handle it too.
+    """
+
+
+class CircuitOpenError(PaystackError):
+    """
+    Raised without calling Paystack while the circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    A thread-safe circuit breaker.
+
+    After `failure_threshold` consecutive failures the breaker opens and rejects calls for
+    `reset_timeout` seconds. It then lets a single trial call through (half-open): a success
+    closes it again, a failure re-opens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns True if a call may proceed.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.error(f"Paystack circuit breaker opened after {self.failures} failures.")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class LatencyHistogram:
+    """
+    A thread-safe, cumulative latency histogram per label, in seconds.
+    """
+
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label, seconds):
+        with self._lock:
+            series = self._series.setdefault(label, {'counts': [0] * len(self.buckets), 'count': 0, 'sum': 0.0})
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series['counts'][i] += 1
+            series['count'] += 1
+            series['sum'] += seconds
+
+    def snapshot(self):
+        """
+        Returns a copy of the histogram: for each label, the cumulative count per bucket bound,
+        the total count and the sum of observations.
+        """
+        with self._lock:
+            return {
+                label: {
+                    'buckets': dict(zip(self.buckets, series['counts'])),
+                    'count': series['count'],
+                    'sum': series['sum'],
+                }
+                for label, series in self._series.items()
+            }
+
+
+class PaystackClient:
+    """
+    A pooled, timeout-bounded client for the Paystack transaction API.
+
+    Requests share one keep-alive `requests.Session`. Every call has connect and read timeouts.
+    Idempotent verify calls are retried a bounded number of times with jittered exponential
+    backoff; initialize calls are never retried because they create a transaction. 5xx responses
+    and calls that end without a response, such as connection errors and timeouts, count towards
+    the circuit breaker, which fails fast with CircuitOpenError while Paystack is degraded. Call
+    latencies are recorded per endpoint in `latency`.
+
+    Attributes:
+        base_url (str): The Paystack API base URL.
+        timeout (tuple): The connect and read timeouts, in seconds.
+        breaker (CircuitBreaker): The circuit breaker guarding all calls.
+        latency (LatencyHistogram): The call latencies per endpoint and outcome.
+    """
+
+    def __init__(self, base_url, secret_key, connect_timeout=3.05, read_timeout=10.0, max_retries=2,
+                 pool_size=10, failure_threshold=5, reset_timeout=30.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.latency = LatencyHistogram()
+
+        retry = Retry(
+            total=max_retries,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({'GET'}),
+            backoff_factor=0.2,
+            backoff_jitter=0.2,
+            raise_on_status=False,
+        )
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f'Bearer {secret_key}',
+            'Content-Type': 'application/json',
+        })
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=pool_size, max_retries=retry))
+        self.session.mount('http://', HTTPAdapter(pool_maxsize=pool_size, max_retries=retry))
+
+    def initialize_transaction(self, email, amount, currency, callback_url):
+        """
+        Initializes a transaction.
+
+        Args:
+            email (str): The customer's email address.
+            amount (int): The amount in the currency's subunit (pesewas).
+            currency (str): The currency code.
+            callback_url (str): The URL Paystack redirects the customer to after payment.
+
+        Returns:
+            dict: The decoded Paystack response.
+
+        Raises:
+            requests.RequestException: If the call fails, times out or the breaker is open.
+        """
+        data = {
+            'email': email,
+            'amount': amount,
+            'currency': currency,
+            'callback_url': callback_url,
+        }
+        return self._request('POST', '/transaction/initialize', 'initialize', json=data)
+
+    def verify_transaction(self, reference):
+        """
+        Verifies a transaction, retrying transient failures.
+
+        Args:
+            reference (str): The transaction reference.
+
+        Returns:
+            dict: The decoded Paystack response.
+
+        Raises:
+            requests.RequestException: If the call fails, times out or the breaker is open.
+        """
+        # The reference comes from the callback URL; escaped, it cannot reach another endpoint
+        return self._request('GET', f'/transaction/verify/{quote(reference, safe="")}', 'verify')
+
+    def _request(self, method, path, endpoint, **kwargs):
+        if not self.breaker.allow():
+            self.latency.observe((endpoint, 'rejected'), 0.0)
+            metrics.inc('paystack_requests_rejected_total', endpoint=endpoint)
+            raise CircuitOpenError(f'Paystack circuit breaker is open; {endpoint} call rejected.')
+
+        started = time.monotonic()
+        outcome = 'error'
+        recorded = False
+        try:
+            response = self.session.request(method, f'{self.base_url}{path}', timeout=self.timeout, **kwargs)
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            recorded = True
+            response.raise_for_status()
+            outcome = 'ok'
+            return response.json()
+        finally:
+            if not recorded:
+                # Every exchange without a response counts as a failure, e.g. a connection error,
+                # a timeout, a broken body or too many redirects, so a half-open trial never
+                # leaves the breaker waiting for an outcome
+                self.breaker.record_failure()
+            elapsed = time.monotonic() - started
+            self.latency.observe((endpoint, outcome), elapsed)
+            metrics.observe('paystack_request_duration_seconds', elapsed, endpoint=endpoint, outcome=outcome)
+            logger.debug(f"Paystack {endpoint} call finished in {elapsed:.3f}s ({outcome}).")
+
+
+def is_valid_signature(payload, signature, secret_key):
+    """
+    Checks the `x-paystack-signature` header of a webhook request.
+
+    Args:
+        payload (bytes): The raw request body.
+        signature (str): The signature header value.
+        secret_key (str): The Paystack secret key.
+
+    Returns:
+        bool: True if the signature is the HMAC-SHA512 of the body under the secret key.
+    """
+    if not signature:
+        return False
+    expected = hmac.new(secret_key.encode(), payload, hashlib.sha512).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_paystack_client():
+    """
+    Returns the process-wide PaystackClient built from PAYSTACK_SETTINGS.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                paystack_settings = settings.PAYSTACK_SETTINGS
+                _client = PaystackClient(
+                    base_url=paystack_settings.get('BASE_URL', 'https://api.paystack.co'),
+                    secret_key=paystack_settings['SECRET_KEY'],
+                    connect_timeout=paystack_settings.get('CONNECT_TIMEOUT', 3.05),
+                    read_timeout=paystack_settings.get('READ_TIMEOUT', 10.0),
+                    max_retries=paystack_settings.get('MAX_RETRIES', 2),
+                    pool_size=paystack_settings.get('POOL_SIZE', 10),
+                    failure_threshold=paystack_settings.get('BREAKER_FAILURE_THRESHOLD', 5),
+                    reset_timeout=paystack_settings.get('BREAKER_RESET_TIMEOUT', 30.0),
+                )
+    return _client
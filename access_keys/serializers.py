@@ -1,3 +1,6 @@
+from decimal import Decimal
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
 from .models import AccessKey
 
@@ -20,4 +23,29 @@ class AccessKeySerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = AccessKey
-        fields = ['key', 'status', 'procurement_date', 'expiry_date']
\ No newline at end of file
+        fields = ['key', 'status', 'procurement_date', 'expiry_date']
+
+
+class BulkProvisionSerializer(serializers.Serializer):
+    """
+    Serializer validating a bulk access key provisioning request.
+
+    Attributes:
+        schools (ListField): The ids of the schools to provision, at most ACCESS_KEY_PROVISION_LIMIT.
+        expiry_date (DateTimeField): The expiry date of the new keys, in the future.
+        price (DecimalField): The price recorded on each key. Defaults to ACCESS_KEY_PRICE.
+    """
+    schools = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+    expiry_date = serializers.DateTimeField()
+    price = serializers.DecimalField(max_digits=8, decimal_places=2, min_value=Decimal('0'), required=False)
+
+    def validate_schools(self, value):
+        limit = settings.ACCESS_KEY_PROVISION_LIMIT
+        if len(value) > limit:
+            raise serializers.ValidationError(f'At most {limit} schools can be provisioned at once.')
+        return value
+
+    def validate_expiry_date(self, value):
+        if value <= timezone.now():
+            raise serializers.ValidationError('The expiry date must be in the future.')
+        return value
@@ -0,0 +1,317 @@
+import logging
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.html import strip_tags
+import requests
+from access_keys.cache import invalidate_key_status
+from access_keys.counters import record_key_change, record_key_changes
+from access_keys.key_pool import claim_keys, create_access_key
+from access_keys.models import AccessKey, KeyLog, Payment
+from access_keys.paystack import get_paystack_client
+from access_keys.tasks import schedule_key_expiry
+from users.emails import queue_email
+from users.models import School, User
+
+
+"""
+Payment processing and access key issuance, shared by the payment views and tasks.
+"""
+
+logger = logging.getLogger(__name__)
+
+PROVISION_ATTEMPTS = 3
+
+ACTIVE_KEY_CONSTRAINT = 'unique_active_key_per_school'
+
+
+def is_active_key_conflict(error):
+    """
+    Tells whether an IntegrityError comes from a school already having an active access key.
+
+    PostgreSQL reports the violated constraint by name; SQLite only names the columns of the
+    unique index, and the school column is unique only through that constraint.
+
+    Args:
+        error (IntegrityError): The error raised by an access key insert.
+
+    Returns:
+        bool: True if the error is a unique_active_key_per_school violation.
+    """
+    constraint_name = getattr(getattr(error.__cause__, 'diag', None), 'constraint_name', None)
+    if constraint_name:
+        return constraint_name == ACTIVE_KEY_CONSTRAINT
+    message = str(error)
+    return ACTIVE_KEY_CONSTRAINT in message or 'access_keys_accesskey.school_id' in message
+
+
+def issue_access_key(user, school, amount):
+    """
+    Issues an active access key to a school.
+
+    The key, its log entry, the key counters, the expiry timer and the cached status payloads
+    are all handled in one transaction. The unique_active_key_per_school constraint rejects a
+    second active key, e.g. from a concurrent payment, without a pre-check query.
+
+    Args:
+        user (User): The user the key is assigned to.
+        school (School): The school the key is issued to.
+        amount (Decimal): The price paid for the key.
+
+    Returns:
+        AccessKey: The issued access key.
+
+    Raises:
+        IntegrityError: If the school already has an active access key (see `is_active_key_conflict`),
+            or the key collides even after retries.
+    """
+    procurement_date = timezone.now()
+    expiry_date = procurement_date + timedelta(days=1)
+    with transaction.atomic():
+        access_key = create_access_key(
+            school=school,
+            status='active',
+            assigned_to=user,
+            procurement_date=procurement_date,
+            expiry_date=expiry_date,
+            price=amount,
+        )
+
+        # Log key creation
+        KeyLog.objects.create(
+            access_key=access_key,
+            event_type=KeyLog.PURCHASED,
+            school=school,
+            payload={'key': access_key.key},
+            user=user
+        )
+        record_key_change(school.id, new_status='active')
+        schedule_key_expiry(access_key)
+        invalidate_key_status([school.id])
+    return access_key
+
+
+def provision_access_keys(school_ids, expiry_date, price, provisioned_by):
+    """
+    Issues an active access key to each of many schools in one transaction.
+
+    Schools that already have an active key are skipped, as are unknown school ids. Keys are
+    claimed from the key pool and the access keys and their log entries are inserted with one
+    bulk_create each, so the number of queries does not grow with the number of schools. Each
+    key is assigned to the school's first user, or to `provisioned_by` if the school has none.
+
+    If a concurrent purchase gives one of the schools an active key first, the
+    unique_active_key_per_school constraint aborts the transaction and the whole batch is
+    retried, skipping that school.
+
+    Args:
+        school_ids (list): The ids of the schools to provision.
+        expiry_date (datetime): The expiry date of the new keys.
+        price (Decimal): The price recorded on each key.
+        provisioned_by (User): The admin recorded on the key logs.
+
+    Returns:
+        dict: The result per school id: {'status': 'issued', 'key': ...}, {'status': 'already_active'}
+            or {'status': 'not_found'}.
+
+    Raises:
+        ValueError: If the expiry date is not in the future.
+        IntegrityError: If the batch keeps conflicting with concurrent purchases or key collisions.
+    """
+    if expiry_date <= timezone.now():
+        raise ValueError('The expiry date must be in the future.')
+
+    school_ids = list(dict.fromkeys(school_ids))
+    for attempt in range(PROVISION_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return _provision_access_keys(school_ids, expiry_date, price, provisioned_by)
+        except IntegrityError as e:
+            if attempt == PROVISION_ATTEMPTS - 1:
+                raise
+            if is_active_key_conflict(e):
+                logger.warning(f"Bulk provisioning conflicted with a concurrent purchase. Retrying (attempt {attempt + 2}).")
+            else:
+                logger.warning(f"Bulk provisioning failed on a key collision: {str(e)}. Retrying (attempt {attempt + 2}).")
+
+
+def _provision_access_keys(school_ids, expiry_date, price, provisioned_by):
+    found = set(School.objects.filter(pk__in=school_ids).values_list('pk', flat=True))
+    already_active = set(
+        AccessKey.objects.filter(school_id__in=found, status='active').values_list('school_id', flat=True)
+    )
+    eligible = [school_id for school_id in school_ids if school_id in found and school_id not in already_active]
+
+    assignees = {}
+    for school_id, user_id in User.objects.filter(school_id__in=eligible).order_by('school_id', 'pk').values_list('school_id', 'pk'):
+        assignees.setdefault(school_id, user_id)
+
+    procurement_date = timezone.now()
+    access_keys = AccessKey.objects.bulk_create([
+        AccessKey(
+            key=key,
+            school_id=school_id,
+            status='active',
+            assigned_to_id=assignees.get(school_id, provisioned_by.pk),
+            procurement_date=procurement_date,
+            expiry_date=expiry_date,
+            price=price,
+        )
+        for school_id, key in zip(eligible, claim_keys(len(eligible)))
+    ])
+    KeyLog.objects.bulk_create([
+        KeyLog(
+            access_key=access_key,
+            event_type=KeyLog.PROVISIONED,
+            school_id=access_key.school_id,
+            payload={'key': access_key.key},
+            user=provisioned_by,
+        )
+        for access_key in access_keys
+    ])
+    record_key_changes(Counter(eligible), new_status='active')
+    invalidate_key_status(eligible)
+
+    # Keys expiring after the next sweep get their timers from the sweep itself
+    if expiry_date <= procurement_date + timedelta(minutes=settings.ACCESS_KEY_EXPIRY_SWEEP_MINUTES):
+        for access_key in access_keys:
+            schedule_key_expiry(access_key)
+
+    results = {}
+    issued = {access_key.school_id: access_key.key for access_key in access_keys}
+    for school_id in school_ids:
+        if school_id in issued:
+            results[school_id] = {'status': 'issued', 'key': issued[school_id]}
+        elif school_id in already_active:
+            results[school_id] = {'status': 'already_active'}
+        else:
+            results[school_id] = {'status': 'not_found'}
+    logger.info(f"Provisioned {len(access_keys)} access keys for {len(school_ids)} requested schools.")
+    return results
+
+
+def queue_purchase_email(user, access_key, school):
+    """
+    Queues the access key purchase confirmation email in the email outbox.
+    """
+    subject = 'Access Key Purchase Successful'
+    html_message = render_to_string('emails/access_key_purchase_success.html', {'user': user, 'access_key': access_key, 'school': school})
+    plain_message = strip_tags(html_message)
+    queue_email(subject, plain_message, user.email, html_body=html_message, dedupe_key=f'access-key-purchase:{access_key.pk}')
+
+
+def _fail(payment, message):
+    payment.status = Payment.FAILED
+    payment.message = message
+    payment.processed_at = timezone.now()
+    payment.save(update_fields=['status', 'message', 'processed_at'])
+    logger.warning(f"Payment {payment.reference} failed: {message}")
+    return payment
+
+
+def fail_pending_payment(reference, message):
+    """
+    Fails a payment that is still pending, e.g. once its processing has given up.
+
+    Args:
+        reference (str): The Paystack transaction reference.
+        message (str): The message shown to the user.
+
+    Returns:
+        Payment: The payment, or None if no payment has the reference.
+    """
+    with transaction.atomic():
+        payment = Payment.objects.select_for_update().filter(reference=reference).first()
+        if payment is None or payment.status != Payment.PENDING:
+            return payment
+        return _fail(payment, message)
+
+
+def process_payment(reference, transaction_data=None):
+    """
+    Verifies a Paystack payment and issues the access key it pays for, exactly once.
+
+    The Paystack round trip happens before any row is locked, and is skipped when the
+    transaction data comes from a signed webhook event. The payment row is then locked and
+    re-checked, so concurrent or repeated calls for the same reference issue at most one key;
+    calls for an already processed reference return immediately. Whether the payment came from
+    the callback or a webhook event, a key is only issued for a successful transaction of exactly
+    ACCESS_KEY_PRICE cedis.
+
+    Args:
+        reference (str): The Paystack transaction reference.
+        transaction_data (dict, optional): The transaction from a verified webhook event.
+
+    Returns:
+        Payment: The payment, succeeded or failed.
+
+    Raises:
+        requests.RequestException: If Paystack cannot be reached or fails with a 5xx error; the
+            payment stays pending. A 4xx response fails the payment.
+        IntegrityError: If the key cannot be inserted for a reason other than an existing active
+            key; the payment stays pending.
+    """
+    payment, _ = Payment.objects.get_or_create(reference=reference)
+    if payment.status != Payment.PENDING:
+        return payment
+
+    if transaction_data is not None:
+        result = {'status': True, 'data': transaction_data}
+    else:
+        try:
+            result = get_paystack_client().verify_transaction(reference)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code >= 500:
+                raise
+            # Paystack rejected the reference itself, e.g. an unknown one; retrying cannot help
+            logger.warning(f"Paystack rejected verification of payment {reference}: {str(e)}")
+            result = None
+
+    with transaction.atomic():
+        payment = Payment.objects.select_for_update().get(pk=payment.pk)
+        if payment.status != Payment.PENDING:
+            return payment
+        if result is None:
+            return _fail(payment, 'Payment could not be verified.')
+
+        data = result.get('data') or {}
+        if not result.get('status') or data.get('status') != 'success':
+            return _fail(payment, 'Payment failed.')
+
+        amount = data.get('amount')
+        if not isinstance(amount, int) or isinstance(amount, bool):
+            return _fail(payment, 'The payment amount could not be read.')
+        if amount != int(settings.ACCESS_KEY_PRICE * 100) or data.get('currency') != 'GHS':
+            logger.warning(f"Payment {reference} of {amount} {data.get('currency')} does not match the access key price.")
+            return _fail(payment, 'The amount paid does not match the access key price.')
+
+        email = (data.get('customer') or {}).get('email')
+        user = User.objects.filter(email=email).first() if email else None
+        school = School.objects.filter(users=user).first() if user else None
+        if not school:
+            return _fail(payment, 'No school account matches this payment.')
+
+        payment.user = user
+        payment.amount = amount / 100  # Convert from pesewas to cedis
+        try:
+            access_key = issue_access_key(user, school, payment.amount)
+        except IntegrityError as e:
+            if not is_active_key_conflict(e):
+                # The payment stays pending, to be processed again by a retry
+                logger.error(f"Issuing the access key for payment {reference} failed: {str(e)}")
+                raise
+            logger.warning(f"School {school.name} already has an active key. Payment {reference} did not issue a new key.")
+            payment.save(update_fields=['user', 'amount'])
+            return _fail(payment, 'Your school already has an active access key.')
+
+        payment.access_key = access_key
+        payment.status = Payment.SUCCEEDED
+        payment.processed_at = timezone.now()
+        payment.save(update_fields=['user', 'amount', 'access_key', 'status', 'processed_at'])
+        queue_purchase_email(user, access_key, school)
+
+    logger.info(f"Payment {reference} verified. Access key {access_key.key} issued and email queued.")
+    return payment
@@ -1,7 +1,17 @@
-from celery import shared_task
+import time
+from collections import Counter
+from datetime import timedelta
+from celery import Task, shared_task
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.utils import timezone
+import requests
+from access_key_manager.locks import check_lease, single_run
+from access_keys.cache import invalidate_key_status
+from access_keys.counters import rebuild_key_stats, record_key_changes
 from access_keys.models import AccessKey, KeyLog
-from users.models import User 
+from access_keys.paystack import CircuitOpenError
+from users.models import User
 from celery.utils.log import get_task_logger
 
 
@@ -11,38 +21,254 @@ Celery tasks for managing access keys and monitoring worker resources.
 
 logger = get_task_logger(__name__)
 
+
+def schedule_key_expiry(access_key):
+    """
+    Arms a timer that expires the given access key at its expiry date.
+
+    The timer is an ETA task enqueued once the surrounding transaction commits. Timers are
+    never cancelled: revoking or extending a key simply turns the pending timer into a no-op,
+    and extending a key should call this function again to arm a timer for the new date.
+
+    Args:
+        access_key (AccessKey): The access key to schedule.
+
+    Returns:
+        bool: True if a timer was armed, False if the key is not active.
+    """
+    if access_key.status != 'active':
+        return False
+
+    key_id = access_key.pk
+    expiry_date = access_key.expiry_date
+
+    def arm():
+        try:
+            expire_access_key.apply_async(args=[key_id], eta=expiry_date)
+            logger.info(f"Armed expiry timer for key {key_id} at {expiry_date}", extra={'sample': True})
+        except Exception as e:
+            # The reconciliation sweep will still pick the key up
+            logger.error(f"Could not arm expiry timer for key {key_id}: {str(e)}")
+
+    transaction.on_commit(arm)
+    return True
+
+
+def expire_due_keys(now, system_user, key_ids=None, chunk_size=None):
+    """
+    Expires every active key whose expiry date is at or before `now`, in bounded chunks.
+
+    Each chunk locks up to `chunk_size` due keys (skipping rows another sweep holds), flips them
+    to 'expired' with one conditional UPDATE, writes their KeyLog rows with one bulk_create,
+    moves the key counters and drops the cached status payloads of their schools, all in a
+    single transaction. Only the chunk's ids, keys and school ids are held in memory, and no
+    other table is joined.
+
+    Args:
+        now (datetime): The cut-off for expiry.
+        system_user (User): The user recorded on the expiry log entries.
+        key_ids (list, optional): Restricts the expiry to these access key ids.
+        chunk_size (int, optional): Keys per chunk. Defaults to ACCESS_KEY_EXPIRY_CHUNK_SIZE.
+
+    Returns:
+        dict: The number of expired keys, the number of chunks and the elapsed seconds.
+    """
+    chunk_size = chunk_size or settings.ACCESS_KEY_EXPIRY_CHUNK_SIZE
+    due_keys = AccessKey.objects.filter(status='active', expiry_date__lte=now)
+    if key_ids is not None:
+        due_keys = due_keys.filter(pk__in=key_ids)
+
+    started = time.monotonic()
+    expired_count = 0
+    chunks = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                due_keys.select_for_update(skip_locked=True, of=('self',))
+                .order_by('pk')
+                .values_list('pk', 'key', 'school_id')[:chunk_size]
+            )
+            if not rows:
+                break
+            # A sweep that outlived its lease stops before writing what the next sweep owns
+            check_lease()
+
+            updated = AccessKey.objects.filter(
+                pk__in=[pk for pk, _, _ in rows], status='active', expiry_date__lte=now
+            ).update(status='expired')
+            KeyLog.objects.bulk_create([
+                KeyLog(
+                    access_key_id=pk,
+                    event_type=KeyLog.EXPIRED,
+                    school_id=school_id,
+                    payload={'key': key},
+                    user=system_user,
+                )
+                for pk, key, school_id in rows
+            ])
+            record_key_changes(Counter(school_id for _, _, school_id in rows), 'active', 'expired')
+            invalidate_key_status(school_id for _, _, school_id in rows)
+
+        expired_count += updated
+        chunks += 1
+        logger.debug(f"Expired chunk {chunks} of {updated} keys.")
+
+    return {
+        'expired': expired_count,
+        'chunks': chunks,
+        'seconds': round(time.monotonic() - started, 3),
+    }
+
+
+@shared_task
+def expire_access_key(key_id):
+    """
+    Expire a single access key when its timer fires.
+
+    The update is conditional, so a timer for a key that has since been revoked, extended or
+    expired by the sweep does nothing.
+
+    Args:
+        key_id (int): The primary key of the access key to expire.
+
+    Returns:
+        bool: True if the key was expired by this call, False otherwise.
+    """
+    system_user = User.objects.filter(is_superuser=True).first()
+    if not system_user:
+        logger.error('No admin user found. Please create an admin user.')
+        return False
+
+    result = expire_due_keys(timezone.now(), system_user, key_ids=[key_id])
+    if not result['expired']:
+        logger.info(f"Key {key_id} is no longer due for expiry. Skipping.", extra={'sample': True})
+        return False
+
+    logger.info(f"Expired key {key_id}.", extra={'sample': True})
+    return True
+
+
 @shared_task
+@single_run()
 def update_key_statuses():
     """
-    Update the status of expired access keys and schedule the next run.
+    Reconcile access key statuses with their expiry dates.
 
-    This task checks for expired access keys and updates their status to 'expired'. It also logs the expiration event and schedules the next run based on upcoming expiries.
+    Keys are normally expired by the per-key timers armed in `schedule_key_expiry`. This sweep
+    runs every ACCESS_KEY_EXPIRY_SWEEP_MINUTES as a safety net: it expires any key whose timer
+    was lost, in chunks of ACCESS_KEY_EXPIRY_CHUNK_SIZE, and arms timers for keys that expire
+    before the next sweep. A sweep that starts while another is running is skipped.
 
     Returns:
-        str: A message indicating the completion of the task, including the number of expired keys.
+        dict: The number of expired keys, chunks and elapsed seconds, plus the number of timers
+            armed, or None if the sweep was skipped.
     """
     now = timezone.now()
     logger.info(f"Running update_key_statuses at {now}")
 
-    expired_keys = AccessKey.objects.filter(expiry_date__lte=now, status='active')
-    expired_count = expired_keys.count()
-    logger.info(f"Found {expired_count} expired keys")
-
     system_user = User.objects.filter(is_superuser=True).first()
 
     if not system_user:
         logger.error('No admin user found. Please create an admin user.')
         return
 
-    for key in expired_keys:
-        key.status = 'expired'
-        key.save()
-        logger.info(f"Expired key: {key.key}")
-        KeyLog.objects.create(
-            access_key=key,
-            action=f'Access key {key.key} expired for school {key.school.name}',
-            user=system_user
-        )
-        logger.info(f"Updated key {key.key} to expired.")
-    logger.info(f'Checked at {timezone.now()}: Updated {expired_keys.count()} keys.')
-    
\ No newline at end of file
+    result = expire_due_keys(now, system_user)
+
+    next_sweep = now + timedelta(minutes=settings.ACCESS_KEY_EXPIRY_SWEEP_MINUTES)
+    upcoming_keys = AccessKey.objects.filter(
+        expiry_date__gt=now, expiry_date__lte=next_sweep, status='active'
+    ).only('pk', 'status', 'expiry_date')
+    result['armed'] = sum(schedule_key_expiry(key) for key in upcoming_keys.iterator())
+
+    logger.info(
+        f"Checked at {now}: expired {result['expired']} keys in {result['chunks']} chunks "
+        f"({result['seconds']}s), armed {result['armed']} timers."
+    )
+    return result
+
+
+@shared_task
+@single_run()
+def rebuild_key_statistics():
+    """
+    Rebuild the materialized key counters from scratch to correct any drift.
+
+    Returns:
+        int: The number of schools with counters.
+    """
+    return rebuild_key_stats()
+
+
+@shared_task
+@single_run()
+def archive_old_key_logs():
+    """
+    Move whole months of key logs older than KEYLOG_RETENTION_DAYS to compressed archives.
+
+    Returns:
+        dict: The number of archived months and of archived log entries.
+    """
+    from access_keys.archive import archive_key_logs
+
+    result = archive_key_logs()
+    logger.info(f"Archived {result['archived']} key logs from {result['months']} months.")
+    return result
+
+
+@shared_task
+@single_run()
+def top_up_access_key_pool():
+    """
+    Refill the pre-generated access key pool up to ACCESS_KEY_POOL_SIZE keys.
+
+    Returns:
+        int: The number of keys added to the pool.
+    """
+    from access_keys.key_pool import top_up_key_pool
+
+    return top_up_key_pool()
+
+
+class PaymentTask(Task):
+    """
+    Fails the payment once its task gives up, so that it never stays pending.
+    """
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        from access_keys.services import fail_pending_payment
+
+        reference = args[0] if args else kwargs['reference']
+        logger.error(f"Giving up on payment {reference}: {str(exc)}")
+        fail_pending_payment(reference, 'We could not confirm your payment. Please contact support with your payment reference.')
+
+
+@shared_task(
+    base=PaymentTask,
+    # Only transient errors are retried: Paystack unreachable, failing with a 5xx error (4xx
+    # responses fail the payment) or shed by the circuit breaker, and key insert conflicts
+    autoretry_for=(requests.ConnectionError, requests.Timeout, requests.HTTPError, CircuitOpenError, IntegrityError),
+    retry_backoff=True,
+    retry_backoff_max=300,
+    max_retries=8,
+)
+def issue_key_for_payment(reference, transaction_data=None):
+    """
+    Verify a Paystack payment and issue its access key off the request thread.
+
+    The task is idempotent per reference, so a redelivered or duplicated task is a no-op.
+    Transient errors leave the payment pending and the task is retried with exponential backoff;
+    once the retries are exhausted, or on any other error, the payment is failed.
+
+    Args:
+        reference (str): The Paystack transaction reference.
+        transaction_data (dict, optional): The transaction from a verified webhook event, which
+            makes the verify call unnecessary.
+
+    Returns:
+        str: The resulting payment status.
+    """
+    from access_keys.services import process_payment
+
+    payment = process_payment(reference, transaction_data)
+    logger.info(f"Payment {reference} processed: {payment.status}")
+    return payment.status
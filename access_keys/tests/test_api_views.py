@@ -1,13 +1,25 @@
-from django.test import TestCase
+import json
+from unittest.mock import patch
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
+from access_key_manager.db_router import use_primary
 from users.models import User, School
+from access_keys.cache import key_status_cache_key
 from access_keys.models import AccessKey
+from access_keys.tasks import expire_due_keys
 from django.utils import timezone
 
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
 class CheckAccessKeyStatusViewTest(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.school = School.objects.create(name='Test School')
         self.user = User.objects.create_user(
@@ -95,4 +107,128 @@ class CheckAccessKeyStatusViewTest(TestCase):
 
         self.client.login(username='school_user', password='schoolpassword')
         response = self.client.get(url)
-        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN) 
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN) 
+
+    def test_check_access_key_served_from_cache(self):
+        self.login_admin()
+        url = reverse('access_keys:key_status', kwargs={'email': 'school@example.com'})
+        self.client.get(url)
+
+        # The session, the request user and the key status all come from the cache
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['key'], self.access_key.key)
+
+    def test_check_access_key_cache_ttl_capped_at_expiry(self):
+        self.access_key.expiry_date = timezone.now() + timezone.timedelta(seconds=30)
+        self.access_key.save()
+        self.login_admin()
+        with patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            self.client.get(reverse('access_keys:key_status', kwargs={'email': 'school@example.com'}))
+
+        timeouts = [call.args[2] for call in cache_set.call_args_list if call.args[0] == key_status_cache_key('school@example.com')]
+        self.assertEqual(len(timeouts), 1)
+        self.assertLessEqual(timeouts[0], 30)
+
+    def test_check_access_key_cache_invalidated_on_revoke(self):
+        self.admin_user.user_permissions.add(Permission.objects.get(codename='can_revoke_access_key'))
+        self.login_admin()
+        url = reverse('access_keys:key_status', kwargs={'email': 'school@example.com'})
+        self.client.get(url)
+
+        with patch.object(User, 'is_profile_complete', return_value=True):
+            self.client.post(reverse('access_keys:revoke_access_key', args=[self.access_key.id]))
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'])
+    def test_check_access_key_cache_filled_from_the_primary(self):
+        self.login_admin()
+        url = reverse('access_keys:key_status', kwargs={'email': 'school@example.com'})
+        with patch('access_keys.api_views.use_primary', wraps=use_primary) as primary:
+            self.client.get(url)
+            # A cache hit does not query at all
+            self.client.get(url)
+        primary.assert_called_once_with()
+
+    def test_check_access_key_cache_invalidated_on_expiry(self):
+        self.login_admin()
+        url = reverse('access_keys:key_status', kwargs={'email': 'school@example.com'})
+        self.client.get(url)
+
+        expire_due_keys(self.access_key.expiry_date, self.admin_user)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CheckAccessKeyStatusBatchViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('access_keys:key_status_batch')
+        self.school = School.objects.create(name='Test School')
+        self.other_school = School.objects.create(name='Other School')
+        self.user = User.objects.create_user(username='school_user', email='school@example.com', password='pass', school=self.school)
+        User.objects.create_user(username='other_user', email='other@example.com', password='pass', school=self.other_school)
+        User.objects.create_user(username='no_school_user', email='no_school@example.com', password='pass')
+        User.objects.create_user(username='admin', email='admin@example.com', password='adminpassword', is_admin=True)
+        self.access_key = AccessKey.objects.create(
+            school=self.school,
+            key='TESTKEY123',
+            status='active',
+            assigned_to=self.user,
+            expiry_date=timezone.now() + timezone.timedelta(days=30),
+            price=100
+        )
+        self.client.login(username='admin', password='adminpassword')
+
+    def test_batch_returns_result_per_email(self):
+        emails = ['school@example.com', 'other@example.com', 'no_school@example.com', 'missing@example.com']
+        response = self.client.post(self.url, {'emails': emails}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual(list(results), emails)
+        self.assertEqual(results['school@example.com']['access_key']['key'], 'TESTKEY123')
+        self.assertEqual(results['other@example.com']['error'], 'No active access key found.')
+        self.assertEqual(results['no_school@example.com']['error'], 'User is not associated with any school.')
+        self.assertEqual(results['missing@example.com']['error'], 'User not found.')
+
+    def test_batch_query_count_is_constant(self):
+        emails = [f'user{i}@example.com' for i in range(200)] + ['school@example.com']
+        # One query for users and one for keys
+        with self.assertNumQueries(2):
+            response = self.client.post(self.url, {'emails': emails}, format='json')
+        self.assertEqual(len(response.data['results']), 201)
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'], ACCESS_KEY_STATUS_BATCH_CHUNK_SIZE=2)
+    def test_batch_reads_from_the_primary(self):
+        emails = ['school@example.com', 'other@example.com', 'missing@example.com']
+        with patch('access_keys.api_views.use_primary', wraps=use_primary) as primary:
+            response = self.client.post(self.url, {'emails': emails}, format='json')
+            b''.join(response.streaming_content)
+        # Once per chunk
+        self.assertEqual(primary.call_count, 2)
+
+    @override_settings(ACCESS_KEY_STATUS_BATCH_CHUNK_SIZE=2)
+    def test_large_batch_is_streamed(self):
+        emails = ['school@example.com', 'other@example.com', 'no_school@example.com', 'missing@example.com', 'school@example.com']
+        response = self.client.post(self.url, {'emails': emails}, format='json')
+
+        self.assertTrue(response.streaming)
+        results = json.loads(b''.join(response.streaming_content))['results']
+        self.assertEqual(len(results), 4)
+        self.assertTrue(results['school@example.com']['found'])
+        self.assertFalse(results['missing@example.com']['found'])
+
+    @override_settings(ACCESS_KEY_STATUS_BATCH_LIMIT=2)
+    def test_batch_rejects_too_many_emails(self):
+        response = self.client.post(self.url, {'emails': ['a@example.com', 'b@example.com', 'c@example.com']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_requires_email_list(self):
+        response = self.client.post(self.url, {'emails': 'school@example.com'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'A list of emails is required.')
@@ -0,0 +1,139 @@
+import json
+import os
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from unittest.mock import patch
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from access_keys.archive import ArchiveWriteError, archive_key_logs, archive_storage, query_key_logs
+from access_keys.models import AccessKey, KeyLog, KeyLogArchive
+from users.models import School, User
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+class KeyLogArchiveTest(TestCase):
+    def setUp(self):
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        storages = {
+            **settings.STORAGES,
+            'key_log_archives': {
+                'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                'OPTIONS': {'location': archive_dir.name},
+            },
+        }
+        settings_override = override_settings(STORAGES=storages, KEYLOG_RETENTION_DAYS=30)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.archive_dir = archive_dir.name
+
+        self.school = School.objects.create(name='Test School')
+        self.user = User.objects.create_user(username='admin', email='admin@example.com', password='adminpassword', is_admin=True)
+        self.access_key = AccessKey.objects.create(
+            school=self.school,
+            key='TESTKEY123',
+            status='expired',
+            assigned_to=self.user,
+            expiry_date=utc(2024, 1, 2),
+            price=100
+        )
+        self.timestamps = [utc(2024, 1, 15), utc(2024, 1, 31, 23, 59), utc(2024, 2, 10), utc(2024, 4, 1)]
+        for i, timestamp in enumerate(self.timestamps):
+            log = KeyLog.objects.create(access_key=self.access_key, action=f'action {i}', user=self.user)
+            KeyLog.objects.filter(pk=log.pk).update(timestamp=timestamp)
+
+    def test_archives_whole_months_past_retention(self):
+        result = archive_key_logs(now=utc(2024, 4, 15), chunk_size=1)
+
+        # The cutoff is the start of the month 30 days ago, i.e. 2024-03-01
+        self.assertEqual(result, {'months': 2, 'archived': 3})
+        self.assertEqual(list(KeyLog.objects.values_list('action', flat=True)), ['action 3'])
+        archives = list(KeyLogArchive.objects.order_by('month_start'))
+        self.assertEqual([(archive.path, archive.row_count) for archive in archives],
+                         [('key_logs-2024-01.jsonl.gz', 2), ('key_logs-2024-02.jsonl.gz', 1)])
+        self.assertTrue(os.path.exists(os.path.join(self.archive_dir, 'key_logs-2024-01.jsonl.gz')))
+
+        # Nothing more to archive
+        self.assertEqual(archive_key_logs(now=utc(2024, 4, 15)), {'months': 0, 'archived': 0})
+
+    def test_query_spans_archives_and_table(self):
+        archive_key_logs(now=utc(2024, 4, 15))
+
+        entries = list(query_key_logs())
+        self.assertEqual([entry['message'] for entry in entries], ['action 0', 'action 1', 'action 2', 'action 3'])
+        self.assertEqual([entry['timestamp'] for entry in entries], self.timestamps)
+        self.assertEqual(entries[0]['school_name'], 'Test School')
+
+        entries = list(query_key_logs(start=utc(2024, 1, 31), end=utc(2024, 4, 1)))
+        self.assertEqual([entry['message'] for entry in entries], ['action 1', 'action 2'])
+
+        self.assertEqual(list(query_key_logs(school_id=self.school.id + 1)), [])
+
+    def test_query_filters_by_event_type(self):
+        log = KeyLog.objects.create(
+            access_key=self.access_key,
+            event_type=KeyLog.EXPIRED,
+            payload={'key': self.access_key.key},
+            user=self.user
+        )
+        KeyLog.objects.filter(pk=log.pk).update(timestamp=utc(2024, 1, 2))
+        archive_key_logs(now=utc(2024, 4, 15))
+
+        entries = list(query_key_logs(event_type=KeyLog.EXPIRED))
+        self.assertEqual([entry['message'] for entry in entries], ['Access key TESTKEY123 expired for school Test School'])
+
+    def test_interrupted_delete_is_finished_without_duplicates(self):
+        archive_key_logs(now=utc(2024, 4, 15))
+        # Simulate a run that recorded the archive but died before deleting the rows
+        log = KeyLog.objects.create(access_key=self.access_key, action='action 0', user=self.user)
+        KeyLog.objects.filter(pk=log.pk).update(timestamp=self.timestamps[0])
+
+        self.assertEqual(len(list(query_key_logs())), 4)
+        archive_key_logs(now=utc(2024, 4, 15))
+        self.assertFalse(KeyLog.objects.filter(timestamp__lt=utc(2024, 3, 1)).exists())
+
+    def test_rows_are_kept_when_the_archive_is_not_confirmed(self):
+        with patch.object(type(archive_storage()), 'size', return_value=0):
+            with self.assertRaises(ArchiveWriteError):
+                archive_key_logs(now=utc(2024, 4, 15))
+
+        self.assertEqual(KeyLog.objects.count(), 4)
+        self.assertFalse(KeyLogArchive.objects.exists())
+
+    def test_rerun_replaces_the_archive_file(self):
+        archive_key_logs(now=utc(2024, 4, 15))
+        KeyLogArchive.objects.all().delete()
+        log = KeyLog.objects.create(access_key=self.access_key, action='action 0', user=self.user)
+        KeyLog.objects.filter(pk=log.pk).update(timestamp=self.timestamps[0])
+
+        archive_key_logs(now=utc(2024, 4, 15))
+
+        self.assertEqual(sorted(os.listdir(self.archive_dir)), ['key_logs-2024-01.jsonl.gz', 'key_logs-2024-02.jsonl.gz'])
+        self.assertEqual(KeyLogArchive.objects.get(path='key_logs-2024-01.jsonl.gz').row_count, 1)
+
+    def test_query_skips_missing_archive_files(self):
+        archive_key_logs(now=utc(2024, 4, 15))
+        os.remove(os.path.join(self.archive_dir, 'key_logs-2024-01.jsonl.gz'))
+
+        with self.assertLogs('access_keys.archive', 'ERROR'):
+            entries = list(query_key_logs())
+        self.assertEqual([entry['message'] for entry in entries], ['action 2', 'action 3'])
+
+    def test_api_streams_entries(self):
+        archive_key_logs(now=utc(2024, 4, 15))
+        client = APIClient()
+        client.login(username='admin', password='adminpassword')
+
+        response = client.get(reverse('access_keys:key_logs'), {'start': '2024-02-01T00:00:00Z'})
+
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['message'] for line in lines], ['action 2', 'action 3'])
+
+        response = client.get(reverse('access_keys:key_logs'), {'start': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
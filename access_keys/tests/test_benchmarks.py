@@ -0,0 +1,46 @@
+from django.test import TestCase
+from access_keys.benchmarks import SCENARIOS, compare_results, offline, run_scenarios, seed_data
+from access_keys.models import AccessKey, KeyLog, Payment
+from users.models import School
+
+
+class SeedDataTest(TestCase):
+    def test_seeds_requested_volumes(self):
+        data = seed_data(schools=4, users_per_school=2, keys_per_school=3, logs=20, expiring=2, buyers=3)
+        self.assertEqual(School.objects.filter(name__startswith='Bench School').count(), 7)
+        self.assertEqual(AccessKey.objects.count(), 12)
+        self.assertEqual(AccessKey.objects.filter(status='active').count(), 4)
+        self.assertEqual(KeyLog.objects.count(), 20)
+        self.assertEqual(len(data['emails']), 8)
+        self.assertEqual(len(data['buyers']), 3)
+        self.assertEqual(len(data['expiring']), 2)
+
+
+class RunScenariosTest(TestCase):
+    def test_runs_every_scenario_offline(self):
+        with offline() as paystack:
+            data = seed_data(schools=3, users_per_school=1, keys_per_school=2, logs=10, expiring=2, buyers=3)
+            results = run_scenarios(data, paystack, iterations=2, warmup=0)
+
+        self.assertEqual(set(results), set(SCENARIOS))
+        for result in results.values():
+            self.assertEqual(result['iterations'], 2)
+            self.assertLessEqual(result['p50_ms'], result['max_ms'])
+        self.assertEqual(results['generate_access_key']['queries'], 0)
+        self.assertLess(results['key_status_cached']['queries'], results['key_status']['queries'])
+        self.assertEqual(Payment.objects.filter(status=Payment.SUCCEEDED).count(), 3)
+
+
+class CompareResultsTest(TestCase):
+    def test_reports_change_per_metric(self):
+        previous = {'scenarios': {'home': {'p50_ms': 10.0, 'p99_ms': 20.0, 'queries': 5, 'peak_memory_kb': 0}}}
+        current = {'scenarios': {
+            'home': {'p50_ms': 5.0, 'p99_ms': 30.0, 'queries': 5, 'peak_memory_kb': 1.0},
+            'key_status': {'p50_ms': 1.0},
+        }}
+        self.assertEqual(compare_results(previous, current), [
+            ('home', 'p50_ms', 10.0, 5.0, -50.0),
+            ('home', 'p99_ms', 20.0, 30.0, 50.0),
+            ('home', 'queries', 5, 5, 0.0),
+            ('home', 'peak_memory_kb', 0, 1.0, None),
+        ])
@@ -0,0 +1,83 @@
+import re
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+from django.conf import settings
+from django.test import SimpleTestCase
+from access_key_manager.celery import (
+    QUEUES, TASK_QUEUES, app, record_queue_wait, record_task_duration, stamp_published_at,
+)
+from access_keys.tasks import archive_old_key_logs, issue_key_for_payment, update_key_statuses
+from users.tasks import send_outbox_emails
+
+
+class QueueRoutingTest(SimpleTestCase):
+    def test_tasks_are_routed_to_their_workload_queue(self):
+        for task, queue in [
+            (issue_key_for_payment, 'payments'),
+            (update_key_statuses, 'expiry'),
+            (send_outbox_emails, 'email'),
+            (archive_old_key_logs, 'maintenance'),
+        ]:
+            self.assertEqual(app.amqp.router.route({}, task.name)['queue'].name, queue)
+
+    def test_unrouted_tasks_go_to_maintenance(self):
+        self.assertEqual(app.amqp.router.route({}, 'access_key_manager.celery.debug_task')['queue'].name, 'maintenance')
+
+    def test_every_routed_queue_is_declared(self):
+        self.assertLessEqual(set(TASK_QUEUES.values()), set(QUEUES))
+
+    def test_tasks_take_the_settings_of_their_queue(self):
+        self.assertTrue(issue_key_for_payment.acks_late)
+        self.assertTrue(issue_key_for_payment.reject_on_worker_lost)
+        self.assertEqual(issue_key_for_payment.soft_time_limit, 60)
+        self.assertFalse(archive_old_key_logs.acks_late)
+        self.assertEqual(archive_old_key_logs.time_limit, QUEUES['maintenance']['time_limit'])
+
+
+@patch('access_key_manager.metrics.observe')
+class TaskTimingSignalTest(SimpleTestCase):
+    def task(self, **request):
+        request = {'eta': None, 'delivery_info': {'routing_key': 'payments'}, **request}
+        return SimpleNamespace(name='access_keys.tasks.issue_key_for_payment', request=SimpleNamespace(**request))
+
+    def test_publish_stamps_headers(self, observe):
+        headers = {}
+        stamp_published_at(headers=headers)
+        self.assertAlmostEqual(headers['published_at'], time.time(), delta=5)
+
+    def test_records_queue_wait_and_duration(self, observe):
+        task = self.task(published_at=time.time() - 2)
+        record_queue_wait(task=task)
+        record_task_duration(task=task, state='SUCCESS')
+
+        (wait_name, wait), wait_labels = observe.call_args_list[0]
+        self.assertEqual(wait_name, 'celery_task_queue_wait_seconds')
+        self.assertAlmostEqual(wait, 2, delta=1)
+        self.assertEqual(wait_labels, {'queue': 'payments', 'task': 'access_keys.tasks.issue_key_for_payment'})
+        (duration_name, _), duration_labels = observe.call_args_list[1]
+        self.assertEqual(duration_name, 'celery_task_duration_seconds')
+        self.assertEqual(duration_labels['state'], 'SUCCESS')
+
+    def test_queue_wait_of_scheduled_tasks_counts_from_eta(self, observe):
+        eta = time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(time.time() - 1))
+        record_queue_wait(task=self.task(published_at=time.time() - 600, eta=eta))
+        self.assertLess(observe.call_args[0][1], 60)
+
+    def test_eager_tasks_are_not_recorded(self, observe):
+        task = self.task()
+        record_queue_wait(task=task)
+        record_task_duration(task=task, state='SUCCESS')
+        observe.assert_not_called()
+
+
+class SupervisordWorkersTest(SimpleTestCase):
+    def test_worker_programs_match_the_queue_settings(self):
+        with open(settings.BASE_DIR / 'Supervisord.conf') as f:
+            commands = [line for line in f if line.startswith('command=celery') and ' worker ' in line]
+
+        self.assertEqual(len(commands), len(QUEUES))
+        for command in commands:
+            queue = re.search(r'-n (\w+)@', command).group(1)
+            self.assertIn(f"--concurrency={QUEUES[queue]['concurrency']} ", command)
+            self.assertIn(f"--prefetch-multiplier={QUEUES[queue]['prefetch_multiplier']} ", command)
@@ -0,0 +1,116 @@
+from unittest.mock import patch
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+from access_keys.counters import get_key_stats, rebuild_key_stats, record_key_change
+from access_keys.models import AccessKey, KeyStats
+from users.contexts import common_context_data
+from users.models import School, User
+
+
+class KeyStatsTest(TestCase):
+    def setUp(self):
+        self.school = School.objects.create(name='Test School')
+        self.user = User.objects.create_user(
+            username='school_user',
+            email='school@example.com',
+            password='pass',
+            is_school_personnel=True,
+            school=self.school
+        )
+
+    def create_key(self, key, status):
+        return AccessKey.objects.create(
+            school=self.school,
+            key=key,
+            status=status,
+            assigned_to=self.user,
+            expiry_date=timezone.now() + timezone.timedelta(days=1),
+            price=100
+        )
+
+    def test_rebuild_key_stats_corrects_drift(self):
+        self.create_key('ACTIVE1', 'active')
+        self.create_key('EXPIRED1', 'expired')
+        self.create_key('REVOKED1', 'revoked')
+        KeyStats.objects.filter(school__isnull=True).update(active_count=42)
+
+        rebuild_key_stats()
+
+        global_stats, school_stats = get_key_stats(self.school.id)
+        self.assertEqual(global_stats['active_count'], 1)
+        self.assertEqual(global_stats['registered_schools'], 1)
+        self.assertEqual(
+            (school_stats['active_count'], school_stats['expired_count'], school_stats['revoked_count']),
+            (1, 1, 1)
+        )
+
+    def test_record_key_change_seeds_and_moves_counters(self):
+        rebuild_key_stats()
+        access_key = self.create_key('ACTIVE1', 'active')
+        record_key_change(self.school.id, new_status='active')
+        self.assertEqual(KeyStats.objects.get(school=self.school).active_count, 1)
+
+        access_key.status = 'revoked'
+        access_key.save()
+        record_key_change(self.school.id, 'active', 'revoked')
+
+        global_stats, school_stats = get_key_stats(self.school.id)
+        self.assertEqual((global_stats['active_count'], global_stats['revoked_count']), (0, 1))
+        self.assertEqual((school_stats['active_count'], school_stats['revoked_count']), (0, 1))
+
+    def test_concurrent_first_changes_both_count(self):
+        rebuild_key_stats()
+        self.create_key('REVOKED1', 'revoked')
+        bulk_create = KeyStats.objects.bulk_create
+
+        def seeded_concurrently(objs, **kwargs):
+            # Another transaction seeded the row, for a key this one cannot see, after the check
+            KeyStats.objects.create(school=self.school, expired_count=1)
+            return bulk_create(objs, **kwargs)
+
+        with patch.object(KeyStats.objects, 'bulk_create', side_effect=seeded_concurrently):
+            record_key_change(self.school.id, new_status='revoked')
+
+        stats = KeyStats.objects.get(school=self.school)
+        self.assertEqual((stats.expired_count, stats.revoked_count), (1, 1))
+
+    def test_registered_schools_follow_user_changes(self):
+        rebuild_key_stats()
+        other_school = School.objects.create(name='Other School')
+        User.objects.create_user(username='other', email='other@example.com', password='pass', school=other_school)
+        self.assertEqual(get_key_stats()[0]['registered_schools'], 2)
+
+        self.user.delete()
+        self.assertEqual(get_key_stats()[0]['registered_schools'], 1)
+
+    def test_saves_that_keep_the_school_skip_the_recount(self):
+        user = User.objects.get(pk=self.user.pk)
+        with patch('users.signals.refresh_registered_schools') as refresh:
+            user.first_name = 'Changed'
+            user.save()
+            user.save(update_fields=['last_login'])
+            refresh.assert_not_called()
+
+            user.school = School.objects.create(name='Other School')
+            user.save()
+            refresh.assert_called_once()
+
+    def test_common_context_data_reads_counters(self):
+        self.create_key('ACTIVE1', 'active')
+        self.create_key('EXPIRED1', 'expired')
+        rebuild_key_stats()
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        with self.assertNumQueries(1):
+            context = common_context_data(request)
+        self.assertEqual(context['total_keys_purchased'], 2)
+
+        request.user = self.user
+        # Global and school counters, then the school's active key
+        with self.assertNumQueries(2):
+            context = common_context_data(request)
+        self.assertEqual(context['active_key'].key, 'ACTIVE1')
+        self.assertEqual(context['keys_purchased_count'], 2)
+        self.assertEqual(context['expired_keys_count'], 1)
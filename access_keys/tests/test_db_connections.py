@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+from django.db import OperationalError, connections
+from django.test import SimpleTestCase, override_settings
+from access_key_manager import db_connections
+
+
+class ConnectionSettingsTest(SimpleTestCase):
+    def test_connections_are_persistent_and_health_checked(self):
+        settings_dict = connections['default'].settings_dict
+        self.assertGreater(settings_dict['CONN_MAX_AGE'], 0)
+        self.assertTrue(settings_dict['CONN_HEALTH_CHECKS'])
+
+    @override_settings(WEB_CONCURRENCY=4, GUNICORN_THREADS=2, DB_MAX_CONNECTIONS=10)
+    def test_warns_when_the_processes_exceed_the_connection_limit(self):
+        errors = db_connections.check_connection_budget(None)
+        self.assertEqual([error.id for error in errors], ['access_key_manager.W001'])
+
+    @override_settings(DB_MAX_CONNECTIONS=0)
+    def test_budget_check_can_be_disabled(self):
+        self.assertEqual(db_connections.check_connection_budget(None), [])
+
+
+@patch('access_key_manager.metrics.inc')
+class ConnectionCheckoutTest(SimpleTestCase):
+    def conn(self, alias, open_):
+        return SimpleNamespace(alias=alias, connection=object() if open_ else None)
+
+    def test_counts_new_and_reused_connections(self, inc):
+        with patch.object(db_connections.connections, 'all', return_value=[self.conn('default', True), self.conn('replica_1', False)]):
+            db_connections.begin_unit('celery')
+        db_connections.count_new_connection(sender=None, connection=SimpleNamespace(alias='replica_1'))
+        db_connections.end_unit()
+
+        inc.assert_any_call('db_connections_opened_total', alias='replica_1')
+        inc.assert_any_call('db_connection_checkouts_total', alias='replica_1', kind='celery', outcome='new')
+        inc.assert_any_call('db_connection_checkouts_total', alias='default', kind='celery', outcome='reused')
+
+    def test_connection_errors_recycle_the_task_connections(self, inc):
+        conn = MagicMock(alias='default')
+        task = SimpleNamespace(request=SimpleNamespace(is_eager=False))
+        with patch.object(db_connections.connections, 'all', return_value=[conn]):
+            db_connections.recycle_after_connection_error(sender=task, exception=ValueError())
+            conn.close.assert_not_called()
+            db_connections.recycle_after_connection_error(sender=task, exception=OperationalError('server closed the connection'))
+        conn.close.assert_called_once()
+        inc.assert_called_once_with('db_connections_recycled_total', alias='default')
@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from access_key_manager.celery import pin_task_to_primary, unpin_task
+from access_key_manager.db_router import PrimaryReplicaRouter, start_tracking_writes, stop_tracking_writes, use_primary
+from access_key_manager.middleware import PrimaryStickinessMiddleware
+from access_keys.models import AccessKey
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class PrimaryReplicaRouterTest(SimpleTestCase):
+    # Not a TestCase, whose transaction would keep every read on the primary
+    databases = {'default'}
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.addCleanup(stop_tracking_writes, start_tracking_writes())
+
+    def test_reads_go_to_a_replica(self):
+        self.assertEqual(self.router.db_for_read(AccessKey), 'replica_1')
+
+    def test_writes_go_to_the_primary_and_pin_later_reads(self):
+        self.assertEqual(self.router.db_for_write(AccessKey), 'default')
+        self.assertEqual(self.router.db_for_read(AccessKey), 'default')
+
+    def test_primary_apps_stay_on_the_primary(self):
+        self.assertEqual(self.router.db_for_read(Session), 'default')
+        self.router.db_for_write(Session)
+        self.assertEqual(self.router.db_for_read(AccessKey), 'replica_1')
+
+    def test_reads_in_a_transaction_or_use_primary_block_go_to_the_primary(self):
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(AccessKey), 'default')
+        with transaction.atomic():
+            self.assertEqual(self.router.db_for_read(AccessKey), 'default')
+
+    def test_celery_tasks_read_from_the_primary(self):
+        task = SimpleNamespace(request=SimpleNamespace())
+        pin_task_to_primary(task=task)
+        try:
+            self.assertEqual(self.router.db_for_read(AccessKey), 'default')
+        finally:
+            unpin_task(task=task)
+
+    def test_only_the_primary_is_migrated(self):
+        self.assertTrue(self.router.allow_migrate('default', 'access_keys'))
+        self.assertFalse(self.router.allow_migrate('replica_1', 'access_keys'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_routing_is_left_to_django(self):
+        self.assertIsNone(self.router.db_for_read(AccessKey))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'], REPLICA_STICKY_SECONDS=15)
+class PrimaryStickinessMiddlewareTest(SimpleTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.reads = []
+
+    def view(self, write=False):
+        def view(request):
+            if write:
+                self.router.db_for_write(AccessKey)
+            self.reads.append(self.router.db_for_read(AccessKey))
+            return HttpResponse()
+        return view
+
+    def test_writing_request_sets_the_sticky_cookie(self):
+        response = PrimaryStickinessMiddleware(self.view(write=True))(RequestFactory().post('/'))
+        self.assertEqual(response.cookies['use_primary']['max-age'], 15)
+        self.assertEqual(self.reads, ['default'])
+
+    def test_sticky_client_reads_from_the_primary(self):
+        request = RequestFactory().get('/')
+        request.COOKIES['use_primary'] = '1'
+        response = PrimaryStickinessMiddleware(self.view())(request)
+        PrimaryStickinessMiddleware(self.view())(RequestFactory().get('/'))
+
+        self.assertNotIn('use_primary', response.cookies)
+        self.assertEqual(self.reads, ['default', 'replica_1'])
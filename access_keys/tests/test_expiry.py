@@ -0,0 +1,67 @@
+from unittest.mock import patch
+from django.test import TestCase
+from django.utils import timezone
+from access_keys.models import AccessKey, KeyLog
+from access_keys.tasks import expire_access_key, schedule_key_expiry, update_key_statuses
+from users.models import School, User
+
+
+class KeyExpirySchedulingTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='school_user', email='school@example.com', password='pass')
+        self.superuser = User.objects.create_superuser(username='root', email='root@example.com', password='pass')
+
+    def create_key(self, key='TESTKEY123', status='active', expires_in=timezone.timedelta(days=1)):
+        return AccessKey.objects.create(
+            school=School.objects.create(name=f'{key} School'),
+            key=key,
+            status=status,
+            assigned_to=self.user,
+            expiry_date=timezone.now() + expires_in,
+            price=100
+        )
+
+    @patch('access_keys.tasks.expire_access_key.apply_async')
+    def test_schedule_arms_timer_on_commit(self, mock_apply_async):
+        access_key = self.create_key()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(schedule_key_expiry(access_key))
+        mock_apply_async.assert_called_once_with(args=[access_key.pk], eta=access_key.expiry_date)
+
+    @patch('access_keys.tasks.expire_access_key.apply_async')
+    def test_schedule_skips_inactive_key(self, mock_apply_async):
+        access_key = self.create_key(status='revoked')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertFalse(schedule_key_expiry(access_key))
+        mock_apply_async.assert_not_called()
+
+    def test_expire_access_key_expires_due_key(self):
+        access_key = self.create_key(expires_in=-timezone.timedelta(seconds=1))
+        self.assertTrue(expire_access_key(access_key.pk))
+        access_key.refresh_from_db()
+        self.assertEqual(access_key.status, 'expired')
+        self.assertEqual(KeyLog.objects.filter(access_key=access_key).count(), 1)
+
+    def test_expire_access_key_ignores_revoked_or_extended_key(self):
+        revoked_key = self.create_key(status='revoked', expires_in=-timezone.timedelta(seconds=1))
+        extended_key = self.create_key(key='EXTENDED123')
+        self.assertFalse(expire_access_key(revoked_key.pk))
+        self.assertFalse(expire_access_key(extended_key.pk))
+        extended_key.refresh_from_db()
+        self.assertEqual(extended_key.status, 'active')
+        self.assertFalse(KeyLog.objects.exists())
+
+    @patch('access_keys.tasks.expire_access_key.apply_async')
+    def test_sweep_expires_overdue_and_arms_upcoming_keys(self, mock_apply_async):
+        overdue_key = self.create_key(key='OVERDUE123', expires_in=-timezone.timedelta(minutes=5))
+        upcoming_key = self.create_key(key='UPCOMING123', expires_in=timezone.timedelta(minutes=10))
+        self.create_key(key='LATER123', expires_in=timezone.timedelta(days=2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = update_key_statuses()
+
+        self.assertEqual(result["expired"], 1)
+        self.assertEqual(result["armed"], 1)
+        overdue_key.refresh_from_db()
+        self.assertEqual(overdue_key.status, 'expired')
+        mock_apply_async.assert_called_once_with(args=[upcoming_key.pk], eta=upcoming_key.expiry_date)
@@ -0,0 +1,75 @@
+from unittest.mock import patch
+from django.db import IntegrityError
+from django.test import TestCase
+from django.utils import timezone
+from access_keys.key_pool import claim_keys, create_access_key, generate_unique_keys, top_up_key_pool
+from access_keys.models import AccessKey, PooledKey
+from access_keys.utils import KEY_CHARACTERS, generate_access_key
+from users.models import School, User
+
+
+class GenerateAccessKeyTest(TestCase):
+    def test_generates_keys_without_queries(self):
+        with self.assertNumQueries(0):
+            keys = {generate_access_key() for _ in range(100)}
+        self.assertEqual(len(keys), 100)
+        self.assertTrue(all(len(key) == 20 and set(key) <= set(KEY_CHARACTERS) for key in keys))
+
+    def test_rejects_invalid_length(self):
+        with self.assertRaises(ValueError):
+            generate_access_key(0)
+
+
+class KeyPoolTest(TestCase):
+    def setUp(self):
+        self.school = School.objects.create(name='Test School')
+        self.user = User.objects.create_user(username='school_user', email='school@example.com', password='pass', school=self.school)
+
+    def key_fields(self, school=None):
+        return {
+            'school': school or self.school,
+            'status': 'active',
+            'assigned_to': self.user,
+            'expiry_date': timezone.now() + timezone.timedelta(days=1),
+            'price': 100,
+        }
+
+    def test_top_up_fills_pool_in_batches(self):
+        # Count, then per batch: two uniqueness checks and one insert, then the final count
+        with self.assertNumQueries(1 + 3 * 3 + 1):
+            added = top_up_key_pool(target=250, batch_size=100)
+        self.assertEqual(added, 250)
+        self.assertEqual(top_up_key_pool(target=250), 0)
+
+    def test_generate_unique_keys_skips_taken_keys(self):
+        AccessKey.objects.create(key='TAKEN', **self.key_fields())
+        PooledKey.objects.create(key='POOLED')
+        with patch('access_keys.key_pool.generate_access_key', side_effect=['TAKEN', 'POOLED', 'FREE']):
+            self.assertEqual(generate_unique_keys(3), ['FREE'])
+
+    def test_claim_keys_takes_from_pool(self):
+        PooledKey.objects.bulk_create([PooledKey(key=f'POOLED{i}') for i in range(3)])
+        self.assertEqual(claim_keys(2), ['POOLED0', 'POOLED1'])
+        self.assertEqual(list(PooledKey.objects.values_list('key', flat=True)), ['POOLED2'])
+
+    @patch('access_keys.tasks.top_up_access_key_pool.delay')
+    def test_claim_keys_falls_back_to_generation(self, mock_top_up):
+        PooledKey.objects.create(key='POOLED0')
+        with self.captureOnCommitCallbacks(execute=True):
+            keys = claim_keys(3)
+        self.assertEqual(keys[0], 'POOLED0')
+        self.assertEqual(len(set(keys)), 3)
+        mock_top_up.assert_called_once_with()
+
+    def test_create_access_key_retries_key_collision(self):
+        AccessKey.objects.create(key='TAKEN', **self.key_fields(School.objects.create(name='Other School')))
+        PooledKey.objects.create(key='TAKEN')
+        with patch('access_keys.key_pool.generate_access_key', return_value='FRESH'):
+            access_key = create_access_key(**self.key_fields())
+        self.assertEqual(access_key.key, 'FRESH')
+
+    def test_create_access_key_raises_other_integrity_errors(self):
+        AccessKey.objects.create(key='EXISTING', **self.key_fields())
+        PooledKey.objects.create(key='POOLED0')
+        with self.assertRaises(IntegrityError):
+            create_access_key(**self.key_fields())
@@ -0,0 +1,45 @@
+from unittest.mock import patch
+from django.test import LiveServerTestCase, override_settings
+from access_keys import paystack
+from access_keys.fake_paystack import FakePaystackServer
+from access_keys.load_test import PurchaseDriver, check_integrity, create_load_test_users, run_load_test, summarize
+from access_keys.models import AccessKey
+from access_keys.services import process_payment
+
+
+class PurchaseLoadTest(LiveServerTestCase):
+    def setUp(self):
+        self.fake_paystack = FakePaystackServer().start()
+        self.addCleanup(self.fake_paystack.stop)
+
+        paystack_settings = {
+            'SECRET_KEY': 'sk_test',
+            'BASE_URL': self.fake_paystack.base_url,
+            'CALLBACK_URL': f'{self.live_server_url}/access-keys/paystack/callback/',
+        }
+        settings_override = override_settings(PAYSTACK_SETTINGS=paystack_settings)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for patcher in (
+            patch.object(paystack, '_client', None),
+            patch('celery.app.task.Task.apply_async'),
+            # Process payments inline in the server thread instead of in a worker
+            patch('access_keys.views.issue_key_for_payment.delay', side_effect=process_payment),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_purchase_flow_issues_one_key_per_school(self):
+        usernames = create_load_test_users(2, 2, 'password', 'loadtest')
+        driver = PurchaseDriver(self.live_server_url, 'password', poll_interval=0.05, poll_timeout=10)
+        results, elapsed = run_load_test(driver, usernames, concurrency=1)
+        summary = summarize(results, elapsed)
+
+        self.assertEqual(summary['outcomes'], {'succeeded': 2, 'already_active': 2}, summary['errors'])
+        self.assertIn('p50_ms', summary['steps']['callback'])
+        self.assertEqual(AccessKey.objects.filter(school__name__startswith='loadtest', status='active').count(), 2)
+
+        integrity = check_integrity(usernames, [result['reference'] for result in results if result['reference']])
+        self.assertEqual(integrity['schools_with_multiple_active_keys'], 0)
+        self.assertEqual(integrity['succeeded_without_key'], 0)
+        self.assertEqual(integrity['payments_succeeded'], 2)
@@ -0,0 +1,135 @@
+from unittest.mock import patch
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from access_key_manager.beat import LeaderScheduler
+from access_key_manager.locks import Lease, LeaseLost, check_lease, single_run
+from access_keys.key_pool import generate_unique_keys
+from access_keys.models import PooledKey
+from access_keys.tasks import top_up_access_key_pool, update_key_statuses
+
+
+class LeaseTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_only_one_holder_at_a_time(self):
+        first, second = Lease('job', ttl=60), Lease('job', ttl=60)
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        first.release()
+        self.assertTrue(second.acquire())
+        self.assertGreater(second.token, 1)
+
+    def test_failed_attempts_do_not_use_up_tokens(self):
+        first, second = Lease('job', ttl=60), Lease('job', ttl=60)
+        first.acquire()
+        first_token = first.token
+        self.assertFalse(second.acquire(wait=0.05, poll_interval=0.01))
+        first.release()
+        second.acquire()
+        self.assertEqual(second.token, first_token + 1)
+
+    def test_stale_holder_cannot_release_or_renew_a_taken_over_lease(self):
+        stale, current = Lease('job', ttl=60), Lease('job', ttl=60)
+        stale.acquire()
+        cache.delete(stale.key)  # The lease expired
+        current.acquire()
+
+        self.assertFalse(stale.is_held())
+        self.assertFalse(stale.renew())
+        stale.release()
+        self.assertTrue(current.is_held())
+        self.assertTrue(current.renew())
+
+
+class SingleRunTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_skips_while_another_run_holds_the_lease(self):
+        @single_run(name='job')
+        def job():
+            return 'ran'
+
+        other = Lease('job', ttl=60)
+        other.acquire()
+        self.assertIsNone(job())
+        other.release()
+        self.assertEqual(job(), 'ran')
+
+    def test_check_lease_stops_a_run_whose_lease_was_taken_over(self):
+        @single_run(name='job')
+        def job():
+            check_lease()
+            cache.delete('lease:job')
+            Lease('job', ttl=60).acquire()
+            check_lease()
+
+        with self.assertRaises(LeaseLost):
+            job()
+
+    def test_check_lease_outside_single_run_does_nothing(self):
+        check_lease()
+
+
+class TaskFencingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_top_up_stops_once_its_lease_is_taken_over(self):
+        def generate_after_takeover(count):
+            cache.delete('lease:access_keys.tasks.top_up_access_key_pool')
+            Lease('access_keys.tasks.top_up_access_key_pool', ttl=60).acquire()
+            return generate_unique_keys(count)
+
+        with patch('access_keys.key_pool.generate_unique_keys', side_effect=generate_after_takeover):
+            with self.assertRaises(LeaseLost):
+                top_up_access_key_pool()
+        self.assertFalse(PooledKey.objects.exists())
+
+
+class UpdateKeyStatusesLockTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_overlapping_sweep_is_skipped(self):
+        lease = Lease('access_keys.tasks.update_key_statuses', ttl=60)
+        lease.acquire()
+        self.addCleanup(lease.release)
+        with patch('access_keys.tasks.expire_due_keys') as expire_due_keys:
+            self.assertIsNone(update_key_statuses())
+        expire_due_keys.assert_not_called()
+
+
+class LeaderSchedulerTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def scheduler(self):
+        # Skips DatabaseScheduler.__init__, which loads the schedule from the database
+        scheduler = LeaderScheduler.__new__(LeaderScheduler)
+        scheduler.lease = Lease('celery-beat-leader', ttl=30)
+        scheduler.is_leader = False
+        return scheduler
+
+    def test_only_one_beat_leads(self):
+        first, second = self.scheduler(), self.scheduler()
+        self.assertTrue(first.hold_lease())
+        self.assertFalse(second.hold_lease())
+        self.assertTrue(first.hold_lease())
+
+    def test_follower_takes_over_when_the_leader_lease_expires(self):
+        first, second = self.scheduler(), self.scheduler()
+        first.hold_lease()
+        cache.delete(first.lease.key)
+        self.assertTrue(second.hold_lease())
+        self.assertFalse(first.hold_lease())
+
+    @patch('django_celery_beat.schedulers.DatabaseScheduler.tick', return_value=0)
+    def test_followers_do_not_send_tasks(self, tick):
+        leader, follower = self.scheduler(), self.scheduler()
+        leader.hold_lease()
+        self.assertEqual(follower.tick(), 10)
+        tick.assert_not_called()
+        self.assertEqual(leader.tick(), 0)
+        tick.assert_called_once()
@@ -0,0 +1,135 @@
+import json
+import logging
+import os
+import queue
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from access_key_manager.log import JSONFormatter, NonBlockingHandler, SamplingFilter, SizedTimedRotatingFileHandler
+
+
+def make_record(message='Hello', level=logging.INFO, **extra):
+    record = logging.LogRecord('access_keys.tasks', level, __file__, 1, message, None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class JSONFormatterTest(SimpleTestCase):
+    def test_formats_record_as_json(self):
+        entry = json.loads(JSONFormatter().format(make_record('Expired key 1.')))
+        self.assertEqual(entry['level'], 'INFO')
+        self.assertEqual(entry['logger'], 'access_keys.tasks')
+        self.assertEqual(entry['message'], 'Expired key 1.')
+        self.assertIn('time', entry)
+
+
+class SamplingFilterTest(SimpleTestCase):
+    def test_keeps_unsampled_records_and_warnings(self):
+        sampling = SamplingFilter(rate=0)
+        self.assertTrue(sampling.filter(make_record()))
+        self.assertTrue(sampling.filter(make_record(level=logging.WARNING, sample=True)))
+
+    def test_samples_marked_records(self):
+        sampling = SamplingFilter(rate=0.5)
+        with patch('access_key_manager.log.random.random', side_effect=[0.2, 0.8]):
+            self.assertTrue(sampling.filter(make_record(sample=True)))
+            self.assertFalse(sampling.filter(make_record(sample=True)))
+
+
+class RotatingHandlerTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'app.log')
+
+    def test_rotates_on_size(self):
+        handler = SizedTimedRotatingFileHandler(self.path, maxBytes=50, backupCount=2)
+        self.addCleanup(handler.close)
+        for _ in range(5):
+            handler.emit(make_record('x' * 30))
+        self.assertTrue(os.path.exists(f'{self.path}.1'))
+        self.assertTrue(os.path.exists(f'{self.path}.2'))
+        self.assertFalse(os.path.exists(f'{self.path}.3'))
+
+    def test_rotates_on_age(self):
+        handler = SizedTimedRotatingFileHandler(self.path, interval=60, backupCount=1)
+        self.addCleanup(handler.close)
+        handler.emit(make_record())
+        self.assertFalse(os.path.exists(f'{self.path}.1'))
+
+        handler.rollover_at -= 120
+        handler.emit(make_record())
+        self.assertTrue(os.path.exists(f'{self.path}.1'))
+
+    def test_per_process_files(self):
+        handler = SizedTimedRotatingFileHandler(self.path, per_process=True)
+        self.addCleanup(handler.close)
+        handler.emit(make_record('Parent'))
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, f'app.{os.getpid()}.log')))
+
+        # As seen by a forked child with another process id
+        with patch('access_key_manager.log.os.getpid', return_value=4321):
+            handler.after_fork()
+        handler.emit(make_record('Child'))
+        with open(os.path.join(self.directory.name, 'app.4321.log')) as f:
+            self.assertEqual(f.read(), 'Child\n')
+
+
+class NonBlockingHandlerTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'app.log')
+
+    def test_writes_json_lines_in_background(self):
+        handler = NonBlockingHandler(
+            {'class': 'logging.FileHandler', 'filename': self.path},
+            target_formatter='access_key_manager.log.JSONFormatter',
+        )
+        handler.handle(make_record('First'))
+        handler.handle(make_record('Second'))
+        handler.close()
+
+        with open(self.path) as f:
+            messages = [json.loads(line)['message'] for line in f]
+        self.assertEqual(messages, ['First', 'Second'])
+
+    def test_keeps_the_traceback_for_the_formatter(self):
+        handler = NonBlockingHandler(
+            {'class': 'logging.FileHandler', 'filename': self.path},
+            target_formatter='access_key_manager.log.JSONFormatter',
+        )
+        logger = logging.getLogger('access_keys.tests.exceptions')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        try:
+            raise ValueError('Broken')
+        except ValueError:
+            with patch.object(logger, 'propagate', False):
+                logger.error('Failed for %s', 'school', exc_info=True)
+        handler.close()
+
+        with open(self.path) as f:
+            entry = json.loads(f.readline())
+        self.assertEqual(entry['message'], 'Failed for school')
+        self.assertIn('ValueError: Broken', entry['exception'])
+
+    def test_drops_records_when_queue_is_full(self):
+        handler = NonBlockingHandler({'class': 'logging.NullHandler'})
+        self.addCleanup(handler.close)
+        handler.queue = queue.Queue(maxsize=1)
+        handler.queue.put_nowait(make_record())
+
+        handler.handle(make_record())
+        self.assertEqual(handler.dropped, 1)
+
+
+class BenchmarkLoggingCommandTest(SimpleTestCase):
+    def test_reports_both_handlers(self):
+        out = StringIO()
+        call_command('benchmark_logging', requests=20, lines=2, stdout=out)
+        output = out.getvalue()
+        self.assertIn('direct', output)
+        self.assertIn('queued', output)
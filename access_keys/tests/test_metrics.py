@@ -0,0 +1,124 @@
+import threading
+from unittest.mock import patch
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.urls import reverse
+import redis
+from access_key_manager import metrics
+from access_key_manager.metrics import MetricsRegistry, render_metrics
+from users.models import User
+
+
+class MetricsRegistryTest(SimpleTestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry('redis://localhost:6379/0', 'metrics', flush_interval=3600)
+
+    def test_observe_buffers_bucket_sum_and_count(self):
+        self.registry.observe('latency_seconds', 0.07, buckets=(0.05, 0.1, float('inf')), view='home')
+        self.registry.observe('latency_seconds', 0.1, buckets=(0.05, 0.1, float('inf')), view='home')
+        self.assertEqual(self.registry._pending['latency_seconds_bucket\tview="home"\t0.1'], 2)
+        self.assertEqual(self.registry._pending['latency_seconds_count\tview="home"\t'], 2)
+        self.assertAlmostEqual(self.registry._pending['latency_seconds_sum\tview="home"\t'], 0.17)
+
+    def test_failed_flush_keeps_increments(self):
+        self.registry.inc('requests_total', view='home')
+        with patch.object(MetricsRegistry, 'client') as client:
+            client.pipeline.return_value.execute.side_effect = redis.ConnectionError('down')
+            self.registry.flush()
+        self.registry.inc('requests_total', view='home')
+        self.assertEqual(self.registry._pending['requests_total\tview="home"\t'], 2)
+
+    def test_flush_adds_increments_to_hash(self):
+        self.registry.inc('requests_total', 3, view='home')
+        with patch.object(MetricsRegistry, 'client') as client:
+            self.registry.flush()
+        client.pipeline.return_value.hincrbyfloat.assert_called_once_with('metrics', 'requests_total\tview="home"\t', 3)
+        self.assertEqual(len(self.registry._pending), 0)
+
+    def test_increments_are_flushed_by_a_background_thread(self):
+        registry = MetricsRegistry('redis://localhost:6379/0', 'metrics', flush_interval=0.01)
+        flushed = threading.Event()
+        flushing_threads = []
+
+        def flush():
+            flushing_threads.append(threading.current_thread())
+            flushed.set()
+
+        with patch.object(registry, 'flush', side_effect=flush):
+            registry.inc('requests_total', view='home')
+            self.assertTrue(flushed.wait(5))
+            # Park the thread
+            registry.flush_interval = 3600
+            registry._pending.clear()
+        self.assertNotIn(threading.current_thread(), flushing_threads)
+
+
+class RenderMetricsTest(SimpleTestCase):
+    def test_renders_cumulative_histogram_and_counter(self):
+        text = render_metrics({
+            'latency_seconds_bucket\tview="home"\t0.05': 1,
+            'latency_seconds_bucket\tview="home"\t0.1': 2,
+            'latency_seconds_sum\tview="home"\t': 0.25,
+            'latency_seconds_count\tview="home"\t': 3,
+            'requests_total\tstatus="200"\t': 3,
+        })
+        self.assertIn('# TYPE latency_seconds histogram', text)
+        self.assertIn('latency_seconds_bucket{view="home",le="0.05"} 1', text)
+        self.assertIn('latency_seconds_bucket{view="home",le="0.1"} 3', text)
+        self.assertIn('latency_seconds_bucket{view="home",le="+Inf"} 3', text)
+        self.assertIn('latency_seconds_sum{view="home"} 0.25', text)
+        self.assertIn('# TYPE requests_total counter', text)
+        self.assertIn('requests_total{status="200"} 3', text)
+
+
+@patch.object(metrics.registry, 'flush_interval', 3600)
+class RequestMetricsMiddlewareTest(TestCase):
+    def setUp(self):
+        metrics.registry._pending.clear()
+
+    def test_records_metrics_per_url_name(self):
+        response = self.client.get(reverse('access_keys:key_status', args=['nobody@example.com']))
+        labels = 'method="GET",view="access_keys:key_status"'
+        self.assertEqual(metrics.registry._pending[f'http_request_duration_seconds_count\t{labels}\t'], 1)
+        self.assertEqual(metrics.registry._pending[f'http_request_db_queries_count\t{labels}\t'], 1)
+        self.assertEqual(metrics.registry._pending[f'http_response_size_bytes_sum\t{labels}\t'], len(response.content))
+        status_labels = f'method="GET",status="{response.status_code}",view="access_keys:key_status"'
+        self.assertEqual(metrics.registry._pending[f'http_requests_total\t{status_labels}\t'], 1)
+
+    def test_labels_unresolved_requests(self):
+        self.client.get('/no-such-page/')
+        self.assertEqual(metrics.registry._pending['http_requests_total\tmethod="GET",status="404",view="unmatched"\t'], 1)
+
+
+@override_settings(METRICS_TOKEN='scrape-token')
+@patch('access_key_manager.views.queue_lengths', return_value={'payments': 3})
+@patch.object(metrics.registry, 'collect', return_value={'requests_total\tview="home"\t': 5})
+class MetricsViewTest(TestCase):
+    def test_admin_can_read_metrics(self, collect, queue_lengths):
+        User.objects.create_user(username='admin', email='admin@example.com', password='adminpassword', is_admin=True)
+        self.client.login(username='admin', password='adminpassword')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'requests_total{view="home"} 5', response.content)
+
+    def test_scraper_with_token_can_read_metrics(self, collect, queue_lengths):
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+
+    def test_other_users_are_refused(self, collect, queue_lengths):
+        User.objects.create_user(username='staff', email='staff@example.com', password='password')
+        self.client.login(username='staff', password='password')
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+    def test_anonymous_users_are_redirected_to_login(self, collect, queue_lengths):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+
+    def test_reports_queue_lengths(self, collect, queue_lengths):
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertIn(b'# TYPE celery_queue_length gauge\ncelery_queue_length{queue="payments"} 3', response.content)
+
+    def test_broker_outage_leaves_out_queue_lengths(self, collect, queue_lengths):
+        queue_lengths.side_effect = ConnectionError('broker down')
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(b'celery_queue_length', response.content)
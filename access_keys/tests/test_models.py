@@ -1,5 +1,8 @@
 import datetime
+import importlib
+from django.apps import apps as django_apps
 from django.conf import settings
+from django.db import IntegrityError
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from access_keys.models import School, AccessKey, KeyLog
@@ -107,3 +110,78 @@ class KeyLogModelTest(TestCase):
         )
 
         self.assertIsNotNone(key_log.user)
+
+    def test_key_log_message_is_rendered_from_event(self):
+        school = School.objects.create(name='Test School6')
+        user = User.objects.create(username='test_user12', email='test_user12@example.com')
+        access_key = AccessKey.objects.create(
+            key='test_key6',
+            school=school,
+            assigned_to=user,
+            expiry_date=timezone.now() + datetime.timedelta(days=30),
+            price=settings.ACCESS_KEY_PRICE
+        )
+
+        key_log = KeyLog.objects.create(
+            event_type=KeyLog.REVOKED,
+            payload={'key': access_key.key},
+            user=user,
+            access_key=access_key
+        )
+
+        # The school defaults to the access key's school
+        self.assertEqual(key_log.school, school)
+        self.assertEqual(key_log.action, '')
+        self.assertEqual(key_log.message, 'Access key test_key6 revoked for school Test School6')
+        self.assertEqual(KeyLog.objects.get(event_type=KeyLog.REVOKED, timestamp__lte=timezone.now()), key_log)
+
+    def test_key_log_backfill_parses_actions(self):
+        backfill = importlib.import_module('access_keys.migrations.0008_keylog_event_type').backfill_event_types
+        school = School.objects.create(name='Test School7')
+        user = User.objects.create(username='test_user13', email='test_user13@example.com')
+        access_key = AccessKey.objects.create(
+            key='test_key7',
+            school=school,
+            assigned_to=user,
+            expiry_date=timezone.now() + datetime.timedelta(days=30),
+            price=settings.ACCESS_KEY_PRICE
+        )
+        KeyLog.objects.bulk_create([
+            KeyLog(access_key=access_key, user=user, action='Access key test_key7 purchased for school Test School7'),
+            KeyLog(access_key=access_key, user=user, action='Key inspected'),
+        ])
+
+        backfill(django_apps, None)
+
+        purchased, other = KeyLog.objects.order_by('pk')
+        self.assertEqual((purchased.event_type, purchased.payload, purchased.action), (KeyLog.PURCHASED, {'key': 'test_key7'}, ''))
+        self.assertEqual(purchased.message, 'Access key test_key7 purchased for school Test School7')
+        self.assertEqual((other.event_type, other.school, other.message), (KeyLog.OTHER, school, 'Key inspected'))
+
+
+class AccessKeyConstraintTest(TestCase):
+
+    def setUp(self):
+        self.school = School.objects.create(name='Test School')
+        self.user = User.objects.create(username='test_user', email='test_user@example.com')
+
+    def create_key(self, key, status):
+        return AccessKey.objects.create(
+            key=key,
+            school=self.school,
+            status=status,
+            assigned_to=self.user,
+            expiry_date=timezone.now() + datetime.timedelta(days=30),
+            price=settings.ACCESS_KEY_PRICE
+        )
+
+    def test_school_cannot_have_two_active_keys(self):
+        self.create_key('active_key', 'active')
+        with self.assertRaises(IntegrityError):
+            self.create_key('second_active_key', 'active')
+
+    def test_school_can_have_many_inactive_keys(self):
+        self.create_key('active_key', 'active')
+        self.create_key('expired_key', 'expired')
+        self.create_key('revoked_key', 'revoked')
+        self.assertEqual(AccessKey.objects.filter(school=self.school).count(), 3)
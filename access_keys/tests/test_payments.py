@@ -0,0 +1,178 @@
+from unittest.mock import patch
+from django.db import IntegrityError
+from django.test import TestCase
+from django.utils import timezone
+import requests
+from access_keys.models import AccessKey, KeyLog, Payment
+from access_keys.services import process_payment
+from access_keys.tasks import issue_key_for_payment
+from users.models import EmailOutbox, School, User
+
+
+def verified(email='school@example.com', status='success'):
+    return {
+        'status': True,
+        'data': {
+            'status': status,
+            'amount': 10000,
+            'currency': 'GHS',
+            'customer': {'email': email}
+        }
+    }
+
+
+def http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(f'{status_code} Error', response=response)
+
+
+@patch('access_keys.paystack.PaystackClient.verify_transaction')
+class ProcessPaymentTest(TestCase):
+    def setUp(self):
+        self.school = School.objects.create(name='Test School')
+        self.user = User.objects.create_user(
+            username='school_user',
+            email='school@example.com',
+            password='pass',
+            is_school_personnel=True,
+            school=self.school
+        )
+
+    def test_successful_payment_issues_key(self, mock_verify):
+        mock_verify.return_value = verified()
+
+        payment = process_payment('ref1')
+
+        self.assertEqual(payment.status, Payment.SUCCEEDED)
+        self.assertEqual(payment.user, self.user)
+        self.assertEqual(payment.access_key.school, self.school)
+        self.assertEqual(payment.access_key.price, 100)
+        self.assertEqual(KeyLog.objects.filter(access_key=payment.access_key).count(), 1)
+        self.assertEqual(EmailOutbox.objects.filter(recipient='school@example.com').count(), 1)
+
+    def test_processing_is_idempotent_per_reference(self, mock_verify):
+        mock_verify.return_value = verified()
+
+        process_payment('ref1')
+        payment = process_payment('ref1')
+
+        self.assertEqual(payment.status, Payment.SUCCEEDED)
+        self.assertEqual(AccessKey.objects.count(), 1)
+        self.assertEqual(mock_verify.call_count, 1)
+
+    def test_webhook_transaction_skips_verify_call(self, mock_verify):
+        payment = process_payment('ref1', verified()['data'])
+
+        self.assertEqual(payment.status, Payment.SUCCEEDED)
+        mock_verify.assert_not_called()
+
+    def test_unsuccessful_transaction_fails_payment(self, mock_verify):
+        mock_verify.return_value = verified(status='abandoned')
+
+        payment = process_payment('ref1')
+
+        self.assertEqual(payment.status, Payment.FAILED)
+        self.assertFalse(AccessKey.objects.exists())
+
+    def test_transaction_without_a_status_fails_payment(self, mock_verify):
+        mock_verify.return_value = verified()
+        del mock_verify.return_value['data']['status']
+
+        payment = process_payment('ref1')
+
+        self.assertEqual(payment.status, Payment.FAILED)
+        self.assertFalse(AccessKey.objects.exists())
+
+    def test_transaction_without_an_amount_fails_payment(self, mock_verify):
+        mock_verify.return_value = verified()
+        del mock_verify.return_value['data']['amount']
+
+        payment = process_payment('ref1')
+
+        self.assertEqual(payment.status, Payment.FAILED)
+        self.assertEqual(payment.message, 'The payment amount could not be read.')
+        self.assertFalse(AccessKey.objects.exists())
+
+    def test_wrong_amount_or_currency_fails_payment(self, mock_verify):
+        for field, value in (('amount', 100), ('currency', 'NGN')):
+            with self.subTest(field=field):
+                transaction_data = verified()['data']
+                transaction_data[field] = value
+
+                payment = process_payment(f'ref-{field}', transaction_data)
+
+                self.assertEqual(payment.status, Payment.FAILED)
+                self.assertEqual(payment.message, 'The amount paid does not match the access key price.')
+        self.assertFalse(AccessKey.objects.exists())
+
+    def test_unknown_customer_fails_payment(self, mock_verify):
+        mock_verify.return_value = verified(email='stranger@example.com')
+
+        payment = process_payment('ref1')
+
+        self.assertEqual(payment.status, Payment.FAILED)
+        self.assertEqual(payment.message, 'No school account matches this payment.')
+
+    def test_existing_active_key_fails_payment(self, mock_verify):
+        AccessKey.objects.create(
+            school=self.school,
+            status='active',
+            key='existing_key',
+            assigned_to=self.user,
+            expiry_date=timezone.now() + timezone.timedelta(days=1),
+            price=100
+        )
+        mock_verify.return_value = verified()
+
+        payment = process_payment('ref1')
+
+        self.assertEqual(payment.status, Payment.FAILED)
+        self.assertEqual(payment.message, 'Your school already has an active access key.')
+        self.assertEqual(AccessKey.objects.filter(school=self.school).count(), 1)
+        self.assertFalse(KeyLog.objects.exists())
+        self.assertFalse(EmailOutbox.objects.exists())
+
+    def test_key_collision_leaves_payment_pending(self, mock_verify):
+        mock_verify.return_value = verified()
+        collision = IntegrityError('UNIQUE constraint failed: access_keys_accesskey.key')
+
+        with patch('access_keys.services.create_access_key', side_effect=collision):
+            with self.assertRaises(IntegrityError):
+                process_payment('ref1')
+
+        self.assertEqual(Payment.objects.get(reference='ref1').status, Payment.PENDING)
+
+    def test_rejected_reference_fails_payment(self, mock_verify):
+        mock_verify.side_effect = http_error(404)
+
+        payment = process_payment('bogus')
+
+        self.assertEqual(payment.status, Payment.FAILED)
+        self.assertEqual(payment.message, 'Payment could not be verified.')
+
+    def test_paystack_server_error_leaves_payment_pending(self, mock_verify):
+        mock_verify.side_effect = http_error(503)
+
+        with self.assertRaises(requests.HTTPError):
+            process_payment('ref1')
+
+        self.assertEqual(Payment.objects.get(reference='ref1').status, Payment.PENDING)
+
+    def test_payment_is_failed_when_the_task_gives_up(self, mock_verify):
+        mock_verify.side_effect = ValueError('Unexpected response')
+
+        result = issue_key_for_payment.apply(args=['ref1'])
+
+        self.assertTrue(result.failed())
+        payment = Payment.objects.get(reference='ref1')
+        self.assertEqual(payment.status, Payment.FAILED)
+        self.assertIn('contact support', payment.message)
+
+    def test_paystack_error_leaves_payment_pending(self, mock_verify):
+        mock_verify.side_effect = requests.ConnectionError('Paystack unavailable')
+
+        with self.assertRaises(requests.RequestException):
+            issue_key_for_payment.run('ref1')
+
+        self.assertEqual(Payment.objects.get(reference='ref1').status, Payment.PENDING)
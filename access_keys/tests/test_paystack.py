@@ -0,0 +1,117 @@
+import time
+from unittest.mock import patch
+from django.test import SimpleTestCase
+import requests
+from access_keys.fake_paystack import FakePaystackServer
+from access_keys.paystack import CircuitOpenError, PaystackClient
+
+
+class PaystackClientTest(SimpleTestCase):
+    def setUp(self):
+        self.server = FakePaystackServer().start()
+        self.server.add_transaction('a@example.com', 10000, reference='ref123')
+        self.addCleanup(self.server.stop)
+
+    def make_client(self, **kwargs):
+        options = {'read_timeout': 1.0, 'max_retries': 2, 'failure_threshold': 3, 'reset_timeout': 60}
+        options.update(kwargs)
+        return PaystackClient(self.server.base_url, 'sk_test', **options)
+
+    def test_verify_transaction(self):
+        client = self.make_client()
+        result = client.verify_transaction('ref123')
+        self.assertEqual(result['data']['reference'], 'ref123')
+        self.assertEqual(client.latency.snapshot()[('verify', 'ok')]['count'], 1)
+
+    def test_verify_escapes_the_reference(self):
+        with self.assertRaises(requests.HTTPError):
+            self.make_client().verify_transaction('../../customer?perPage=1')
+        self.assertEqual(self.server.calls, [('GET', '/transaction/verify/..%2F..%2Fcustomer%3FperPage%3D1')])
+
+    def test_verify_retries_transient_errors(self):
+        self.server.script = [(503, 0), (502, 0)]
+        result = self.make_client().verify_transaction('ref123')
+        self.assertTrue(result['status'])
+        self.assertEqual(len(self.server.calls), 3)
+
+    def test_initialize_is_not_retried(self):
+        self.server.script = [(503, 0)]
+        with self.assertRaises(requests.HTTPError):
+            self.make_client().initialize_transaction('a@example.com', 10000, 'GHS', 'http://localhost/cb')
+        self.assertEqual(len(self.server.calls), 1)
+
+    def test_read_timeout(self):
+        self.server.script = [(200, 0.5)]
+        started = time.monotonic()
+        with self.assertRaises(requests.RequestException):
+            self.make_client(read_timeout=0.1, max_retries=0).verify_transaction('ref123')
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_circuit_breaker_fails_fast(self):
+        self.server.script = [(500, 0)] * 3
+        client = self.make_client(max_retries=0)
+        for _ in range(3):
+            with self.assertRaises(requests.HTTPError):
+                client.verify_transaction('ref123')
+
+        with self.assertRaises(CircuitOpenError):
+            client.verify_transaction('ref123')
+        self.assertEqual(len(self.server.calls), 3)
+
+    def test_circuit_breaker_recovers_after_reset_timeout(self):
+        self.server.script = [(500, 0)] * 3
+        client = self.make_client(max_retries=0, reset_timeout=0.05)
+        for _ in range(3):
+            with self.assertRaises(requests.HTTPError):
+                client.verify_transaction('ref123')
+
+        time.sleep(0.1)
+        self.assertTrue(client.verify_transaction('ref123')['status'])
+        self.assertEqual(client.breaker.state, client.breaker.CLOSED)
+
+    def test_half_open_trial_failing_without_a_response_reopens_the_breaker(self):
+        client = self.make_client(max_retries=0, reset_timeout=0.05)
+        client.breaker.state = client.breaker.OPEN
+        time.sleep(0.1)
+
+        with patch.object(client.session, 'request', side_effect=requests.exceptions.ChunkedEncodingError):
+            with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                client.verify_transaction('ref123')
+        self.assertEqual(client.breaker.state, client.breaker.OPEN)
+
+        time.sleep(0.1)
+        self.assertTrue(client.verify_transaction('ref123')['status'])
+
+
+class FakePaystackServerTest(SimpleTestCase):
+    def setUp(self):
+        self.server = FakePaystackServer(seed=1).start()
+        self.addCleanup(self.server.stop)
+
+    def test_initialize_checkout_and_verify(self):
+        client = PaystackClient(self.server.base_url, 'sk_test')
+        result = client.initialize_transaction('a@example.com', 10000, 'GHS', 'http://localhost/cb?next=1')
+        reference = result['data']['reference']
+
+        response = requests.get(result['data']['authorization_url'], allow_redirects=False)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.headers['Location'], f'http://localhost/cb?next=1&trxref={reference}&reference={reference}')
+
+        data = client.verify_transaction(reference)['data']
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['amount'], 10000)
+        self.assertEqual(data['customer']['email'], 'a@example.com')
+
+    def test_unknown_reference(self):
+        with self.assertRaises(requests.HTTPError) as cm:
+            PaystackClient(self.server.base_url, 'sk_test').verify_transaction('missing')
+        self.assertEqual(cm.exception.response.status_code, 400)
+
+    def test_injected_errors_and_failures(self):
+        self.server.error_rate = 1.0
+        with self.assertRaises(requests.HTTPError):
+            PaystackClient(self.server.base_url, 'sk_test', max_retries=0).verify_transaction('missing')
+
+        self.server.failure_rate = 1.0
+        reference = self.server.add_transaction('a@example.com', 10000)
+        self.assertEqual(self.server.transactions[reference]['status'], 'failed')
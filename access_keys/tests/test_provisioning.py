@@ -0,0 +1,132 @@
+from io import StringIO
+from unittest.mock import patch
+from django.db import IntegrityError
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from access_keys.counters import get_key_stats, rebuild_key_stats
+from access_keys.key_pool import top_up_key_pool
+from access_keys.models import AccessKey, KeyLog
+from access_keys.services import PROVISION_ATTEMPTS, provision_access_keys
+from users.models import School, User
+
+
+class ProvisionAccessKeysTest(TestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username='admin',
+            email='admin@example.com',
+            password='adminpassword',
+            is_admin=True,
+            is_superuser=True
+        )
+        self.schools = School.objects.bulk_create([School(name=f'School {i}') for i in range(20)])
+        self.school_user = User.objects.create_user(
+            username='school_user', email='school@example.com', password='pass', school=self.schools[0]
+        )
+        self.expiry_date = timezone.now() + timezone.timedelta(days=365)
+
+    def test_provisions_all_schools_in_constant_queries(self):
+        rebuild_key_stats()
+        top_up_key_pool(target=20)
+        school_ids = [school.id for school in self.schools]
+
+        with self.assertNumQueries(17):
+            results = provision_access_keys(school_ids, self.expiry_date, 80, self.admin_user)
+
+        self.assertEqual({result['status'] for result in results.values()}, {'issued'})
+        self.assertEqual(AccessKey.objects.filter(status='active').count(), 20)
+        self.assertEqual(KeyLog.objects.count(), 20)
+        self.assertEqual(AccessKey.objects.get(school=self.schools[0]).assigned_to, self.school_user)
+        self.assertEqual(AccessKey.objects.get(school=self.schools[1]).assigned_to, self.admin_user)
+        global_stats, school_stats = get_key_stats(self.schools[1].id)
+        self.assertEqual((global_stats['active_count'], school_stats['active_count']), (20, 1))
+
+    def test_reports_skipped_schools(self):
+        AccessKey.objects.create(
+            school=self.schools[0],
+            key='EXISTING',
+            status='active',
+            assigned_to=self.school_user,
+            expiry_date=self.expiry_date,
+            price=100
+        )
+
+        results = provision_access_keys([self.schools[0].id, self.schools[1].id, 9999], self.expiry_date, 80, self.admin_user)
+
+        self.assertEqual(results[self.schools[0].id], {'status': 'already_active'})
+        self.assertEqual(results[self.schools[1].id]['status'], 'issued')
+        self.assertEqual(results[9999], {'status': 'not_found'})
+        self.assertEqual(AccessKey.objects.filter(school=self.schools[0]).count(), 1)
+
+    def test_rejects_past_expiry(self):
+        with self.assertRaises(ValueError):
+            provision_access_keys([self.schools[0].id], timezone.now(), 80, self.admin_user)
+
+    def test_api(self):
+        client = APIClient()
+        client.login(username='admin', password='adminpassword')
+
+        response = client.post(reverse('access_keys:provision_access_keys'), {
+            'schools': [self.schools[0].id, self.schools[1].id],
+            'expiry_date': self.expiry_date.isoformat(),
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['issued'], 2)
+        self.assertEqual(response.json()['results'][str(self.schools[0].id)]['status'], 'issued')
+        self.assertEqual(AccessKey.objects.get(school=self.schools[0]).price, 100)
+
+    def test_api_validates_request(self):
+        client = APIClient()
+        client.login(username='admin', password='adminpassword')
+
+        response = client.post(reverse('access_keys:provision_access_keys'), {
+            'schools': [],
+            'expiry_date': timezone.now().isoformat(),
+        }, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'schools', 'expiry_date'})
+
+    @patch('access_keys.services._provision_access_keys', side_effect=IntegrityError('UNIQUE constraint failed: access_keys_accesskey.school_id'))
+    def test_api_reports_a_batch_that_keeps_conflicting(self, mock_provision):
+        client = APIClient()
+        client.login(username='admin', password='adminpassword')
+
+        response = client.post(reverse('access_keys:provision_access_keys'), {
+            'schools': [self.schools[0].id, self.schools[1].id],
+            'expiry_date': self.expiry_date.isoformat(),
+        }, format='json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['not_provisioned'], [self.schools[0].id, self.schools[1].id])
+        self.assertEqual(mock_provision.call_count, PROVISION_ATTEMPTS)
+        self.assertFalse(AccessKey.objects.exists())
+
+    def test_api_is_admin_only(self):
+        client = APIClient()
+        client.login(username='school_user', password='pass')
+
+        response = client.post(reverse('access_keys:provision_access_keys'), {
+            'schools': [self.schools[0].id],
+            'expiry_date': self.expiry_date.isoformat(),
+        }, format='json')
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(AccessKey.objects.exists())
+
+    def test_command(self):
+        out = StringIO()
+        call_command('provision_access_keys', str(self.schools[0].id), '9999', '--expires', '2099-12-31', stdout=out)
+
+        self.assertIn(f'{self.schools[0].id}\tissued', out.getvalue())
+        self.assertIn('9999\tnot_found', out.getvalue())
+        self.assertIn('Issued 1 access keys for 2 schools.', out.getvalue())
+        self.assertEqual(AccessKey.objects.get(school=self.schools[0]).expiry_date.year, 2099)
+
+    def test_command_rejects_invalid_expiry(self):
+        with self.assertRaises(CommandError):
+            call_command('provision_access_keys', str(self.schools[0].id), '--expires', 'soon', stdout=StringIO())
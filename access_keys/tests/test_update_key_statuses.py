@@ -1,50 +1,90 @@
-import unittest
-from unittest.mock import patch, MagicMock
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
-from datetime import timedelta
-from users.models import User
-from access_keys.tasks import update_key_statuses, monitor_memory 
-
-
-class TestCeleryTasks(unittest.TestCase):
-
-    @patch('access_keys.models.AccessKey.objects')
-    @patch('users.models.User.objects')
-    @patch('access_keys.models.KeyLog.objects.create')
-    @patch('access_keys.tasks.update_key_statuses.apply_async')
-    def test_update_key_statuses(self, mock_apply_async, mock_keylog_create, mock_user_objects, mock_accesskey_objects):
-        # Setup
-        now = timezone.now()
-        mock_expired_key = MagicMock(key='expired_key', school=MagicMock(name='Test School'))
-        mock_active_key = MagicMock(expiry_date=now + timedelta(days=1))
-        mock_accesskey_objects.filter.side_effect = [
-            MagicMock(count=lambda: 1, __iter__=lambda self: iter([mock_expired_key])),  # expired keys
-            MagicMock(__iter__=lambda self: iter([mock_active_key]))  # active keys
-        ]
-        mock_user_objects.filter.return_value.first.return_value = MagicMock(spec=User)
-
-        # Execute
+from access_keys.counters import rebuild_key_stats
+from access_keys.models import AccessKey, KeyLog, KeyStats
+from access_keys.tasks import expire_due_keys, update_key_statuses
+from users.models import School, User
+
+
+class UpdateKeyStatusesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='school_user', email='school@example.com', password='pass')
+        self.superuser = User.objects.create_superuser(username='root', email='root@example.com', password='pass')
+        self.now = timezone.now()
+
+    def create_keys(self, count, expires_in, status='active', prefix='KEY'):
+        schools = School.objects.bulk_create([School(name=f'{prefix} School {i}') for i in range(count)])
+        AccessKey.objects.bulk_create([
+            AccessKey(
+                school=school,
+                key=f'{prefix}{i}',
+                status=status,
+                assigned_to=self.user,
+                expiry_date=self.now + expires_in,
+                price=100
+            )
+            for i, school in enumerate(schools)
+        ])
+
+    def test_update_key_statuses(self):
+        self.create_keys(3, -timezone.timedelta(minutes=1), prefix='DUE')
+        self.create_keys(2, timezone.timedelta(days=1), prefix='LATER')
+
         result = update_key_statuses()
 
-        # Assert
-        self.assertEqual(result, "Update completed. Expired 1 keys.")
-        mock_expired_key.save.assert_called_once()
-        mock_keylog_create.assert_called_once()
-        mock_apply_async.assert_called_once()
+        self.assertEqual(result['expired'], 3)
+        self.assertEqual(AccessKey.objects.filter(status='expired').count(), 3)
+        self.assertEqual(AccessKey.objects.filter(status='active').count(), 2)
+        self.assertEqual(KeyLog.objects.filter(user=self.superuser).count(), 3)
+        key_log = KeyLog.objects.get(access_key__key='DUE0')
+        self.assertEqual(key_log.event_type, KeyLog.EXPIRED)
+        self.assertEqual(key_log.message, 'Access key DUE0 expired for school DUE School 0')
+
+    def test_update_key_statuses_without_admin_user(self):
+        self.superuser.delete()
+        self.create_keys(1, -timezone.timedelta(minutes=1))
+
+        self.assertIsNone(update_key_statuses())
+        self.assertEqual(AccessKey.objects.filter(status='active').count(), 1)
+
+    def test_expire_due_keys_in_chunks(self):
+        self.create_keys(5, -timezone.timedelta(minutes=1))
+
+        result = expire_due_keys(self.now, self.superuser, chunk_size=2)
+
+        self.assertEqual(result['expired'], 5)
+        self.assertEqual(result['chunks'], 3)
+        self.assertEqual(KeyLog.objects.count(), 5)
+
+    def test_expire_due_keys_query_count_is_per_chunk(self):
+        self.create_keys(50, -timezone.timedelta(minutes=1))
+        rebuild_key_stats()
+
+        with CaptureQueriesContext(connection) as queries:
+            expire_due_keys(self.now, self.superuser, chunk_size=20)
+
+        # select + update + bulk insert + 3 counter queries + cached email lookup per chunk,
+        # plus the final empty select
+        statements = [q['sql'] for q in queries.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual(len(statements), 3 * 7 + 1)
+
+    def test_expire_due_keys_skips_revoked_keys(self):
+        self.create_keys(2, -timezone.timedelta(minutes=1), status='revoked')
+
+        result = expire_due_keys(self.now, self.superuser)
 
-    @patch('psutil.Process')
-    def test_monitor_memory(self, mock_process):
-        # Setup
-        mock_process.return_value.memory_info.return_value = MagicMock(rss=104857600)  # 100 MB
-        mock_process.return_value.cpu_percent.return_value = 5.0
+        self.assertEqual(result['expired'], 0)
+        self.assertFalse(KeyLog.objects.exists())
 
-        # Execute
-        with self.assertLogs(level='INFO') as log:
-            monitor_memory()
+    def test_expire_due_keys_moves_counters(self):
+        self.create_keys(3, -timezone.timedelta(minutes=1))
+        rebuild_key_stats()
 
-        # Assert
-        self.assertIn("Celery worker memory usage: 100.00 MB", log.output[0])
-        self.assertIn("Celery worker CPU usage: 5.00%", log.output[1])
+        expire_due_keys(self.now, self.superuser, chunk_size=2)
 
-if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+        global_stats = KeyStats.objects.get(school__isnull=True)
+        self.assertEqual((global_stats.active_count, global_stats.expired_count), (0, 3))
+        school_stats = KeyStats.objects.get(school__name='KEY School 0')
+        self.assertEqual((school_stats.active_count, school_stats.expired_count), (0, 1))
@@ -1,4 +1,8 @@
-from django.test import TestCase, Client
+import hashlib
+import hmac
+import json
+from django.conf import settings
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
@@ -6,7 +10,7 @@ from django.contrib.contenttypes.models import ContentType
 from django.utils import timezone
 from unittest.mock import patch, MagicMock
 from decimal import Decimal
-from access_keys.models import AccessKey, KeyLog
+from access_keys.models import AccessKey, KeyLog, Payment
 from users.models import School, BillingInformation
 
 User = get_user_model()
@@ -61,14 +65,12 @@ class InitializePaymentViewTestCase(TestCase):
         permission = Permission.objects.get(codename='can_purchase_access_key')
         self.user.user_permissions.add(permission)
 
-    @patch('access_keys.views.requests.post')
-    def test_initialize_payment_success(self, mock_post):
-        mock_response = MagicMock()
-        mock_response.json.return_value = {
+    @patch('access_keys.paystack.PaystackClient.initialize_transaction')
+    def test_initialize_payment_success(self, mock_initialize):
+        mock_initialize.return_value = {
             'status': True,
             'data': {'authorization_url': 'https://paystack.com/pay/test'}
         }
-        mock_post.return_value = mock_response
 
         self.client.login(username='testuser', password='testpass123')
         response = self.client.post(reverse('access_keys:initialize_payment'))
@@ -84,22 +86,178 @@ class PaystackCallbackViewTestCase(TestCase):
         self.user.is_school_personnel = True
         self.user.save()
 
-    @patch('access_keys.views.requests.get')
-    def test_paystack_callback_success(self, mock_get):
-        mock_response = MagicMock()
-        mock_response.json.return_value = {
+    @patch('access_keys.views.issue_key_for_payment.delay')
+    def test_paystack_callback_enqueues_payment(self, mock_delay):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('access_keys:paystack_callback') + '?reference=test_ref')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'access_keys/payment_processing.html')
+        self.assertContains(response, reverse('access_keys:payment_status', args=['test_ref']))
+        self.assertEqual(Payment.objects.get(reference='test_ref').status, Payment.PENDING)
+        mock_delay.assert_called_once_with('test_ref', None)
+        self.assertFalse(AccessKey.objects.exists())
+
+    @patch('access_keys.views.issue_key_for_payment.delay')
+    def test_paystack_callback_does_not_reprocess_payment(self, mock_delay):
+        Payment.objects.create(reference='test_ref', status=Payment.SUCCEEDED)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('access_keys:paystack_callback') + '?reference=test_ref')
+
+        self.assertEqual(response.status_code, 200)
+        mock_delay.assert_not_called()
+
+    def test_paystack_callback_without_reference(self):
+        response = self.client.get(reverse('access_keys:paystack_callback'))
+        self.assertEqual(response.status_code, 400)
+
+    @patch('access_keys.tasks.top_up_access_key_pool.delay')
+    @patch('users.tasks.send_outbox_emails.delay')
+    @patch('access_keys.tasks.expire_access_key.apply_async')
+    @patch('access_keys.paystack.PaystackClient.verify_transaction')
+    @patch('access_keys.views.issue_key_for_payment.delay', side_effect=OSError('Broker unavailable'))
+    def test_paystack_callback_processes_inline_without_broker(self, mock_delay, mock_verify, mock_arm, mock_send, mock_top_up):
+        mock_verify.return_value = {
             'status': True,
             'data': {
+                'status': 'success',
                 'amount': 10000,
+                'currency': 'GHS',
                 'customer': {'email': 'test@example.com'}
             }
         }
-        mock_get.return_value = mock_response
 
-        response = self.client.get(reverse('access_keys:paystack_callback') + '?reference=test_ref')
-        self.assertRedirects(response, reverse('school_dashboard'), fetch_redirect_response=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('access_keys:paystack_callback') + '?reference=test_ref')
+
+        self.assertEqual(Payment.objects.get(reference='test_ref').status, Payment.SUCCEEDED)
         self.assertTrue(AccessKey.objects.filter(school=self.school, status='active').exists())
 
+
+@override_settings(PAYSTACK_SETTINGS={**settings.PAYSTACK_SETTINGS, 'SECRET_KEY': 'sk_test'})
+class PaystackWebhookViewTestCase(TestCase):
+    def post_event(self, event, signature=None):
+        body = json.dumps(event).encode()
+        if signature is None:
+            signature = hmac.new(b'sk_test', body, hashlib.sha512).hexdigest()
+        return self.client.post(
+            reverse('access_keys:paystack_webhook'),
+            data=body,
+            content_type='application/json',
+            HTTP_X_PAYSTACK_SIGNATURE=signature,
+        )
+
+    def charge_success(self, reference='test_ref'):
+        return {
+            'event': 'charge.success',
+            'data': {
+                'reference': reference,
+                'status': 'success',
+                'amount': 10000,
+                'currency': 'GHS',
+                'customer': {'email': 'test@example.com'},
+            },
+        }
+
+    @patch('access_keys.views.issue_key_for_payment.delay')
+    def test_charge_success_enqueues_payment(self, mock_delay):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_event(self.charge_success())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Payment.objects.get(reference='test_ref').status, Payment.PENDING)
+        mock_delay.assert_called_once_with('test_ref', {
+            'status': 'success',
+            'amount': 10000,
+            'currency': 'GHS',
+            'customer': {'email': 'test@example.com'},
+        })
+
+    @patch('access_keys.views.issue_key_for_payment.delay')
+    def test_events_for_processed_payments_are_ignored(self, mock_delay):
+        Payment.objects.create(reference='test_ref', status=Payment.SUCCEEDED)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_event(self.charge_success())
+
+        self.assertEqual(response.status_code, 200)
+        mock_delay.assert_not_called()
+
+    @patch('access_keys.views.issue_key_for_payment.delay')
+    def test_event_for_a_pending_callback_payment_is_enqueued(self, mock_delay):
+        Payment.objects.create(reference='test_ref')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_event(self.charge_success())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_delay.call_args[0][1]['amount'], 10000)
+
+    @patch('access_keys.views.issue_key_for_payment.delay')
+    def test_event_without_an_integer_amount_is_rejected(self, mock_delay):
+        event = self.charge_success()
+        event['data']['amount'] = '100.00'
+        response = self.post_event(event)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Payment.objects.exists())
+        mock_delay.assert_not_called()
+
+    @patch('access_keys.tasks.top_up_access_key_pool.delay')
+    @patch('users.tasks.send_outbox_emails.delay')
+    @patch('access_keys.views.issue_key_for_payment.delay', side_effect=OSError('Broker unavailable'))
+    def test_event_for_the_wrong_amount_fails_the_payment(self, mock_delay, mock_send, mock_top_up):
+        school = School.objects.create(name='Paying School')
+        User.objects.create_user(username='payer', email='test@example.com', password='pass', school=school)
+        event = self.charge_success()
+        event['data']['amount'] = 100
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_event(event)
+
+        self.assertEqual(response.status_code, 200)
+        payment = Payment.objects.get(reference='test_ref')
+        self.assertEqual(payment.status, Payment.FAILED)
+        self.assertEqual(payment.message, 'The amount paid does not match the access key price.')
+        self.assertFalse(AccessKey.objects.exists())
+
+    @patch('access_keys.views.issue_key_for_payment.delay')
+    def test_invalid_signature_is_rejected(self, mock_delay):
+        response = self.post_event(self.charge_success(), signature='forged')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Payment.objects.exists())
+        mock_delay.assert_not_called()
+
+    @patch('access_keys.views.issue_key_for_payment.delay')
+    def test_other_events_are_acknowledged(self, mock_delay):
+        response = self.post_event({'event': 'transfer.success', 'data': {'reference': 'test_ref'}})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Payment.objects.exists())
+
+
+class PaymentStatusViewTestCase(TestCase):
+    def test_pending_payment(self):
+        Payment.objects.create(reference='test_ref')
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('access_keys:payment_status', args=['test_ref']))
+        self.assertEqual(response.json(), {'status': 'pending'})
+
+    def test_succeeded_payment_redirects_to_dashboard(self):
+        Payment.objects.create(reference='test_ref', status=Payment.SUCCEEDED)
+        response = self.client.get(reverse('access_keys:payment_status', args=['test_ref']))
+        self.assertEqual(response.json(), {'status': 'succeeded', 'redirect_url': reverse('school_dashboard')})
+
+    def test_failed_payment_reports_reason(self):
+        Payment.objects.create(reference='test_ref', status=Payment.FAILED, message='Payment failed.')
+        response = self.client.get(reverse('access_keys:payment_status', args=['test_ref']))
+        self.assertEqual(response.json()['status'], 'failed')
+        messages = [str(message) for message in response.wsgi_request._messages]
+        self.assertEqual(messages, ['Payment failed.'])
+
+    def test_unknown_payment(self):
+        response = self.client.get(reverse('access_keys:payment_status', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+
+
 class RevokeAccessKeyViewTestCase(TestCase):
     def setUp(self):
         self.client = Client()
@@ -136,7 +294,7 @@ class RevokeAccessKeyViewTestCase(TestCase):
 
         self.access_key.refresh_from_db()
         self.assertEqual(self.access_key.status, 'revoked')
-        self.assertTrue(KeyLog.objects.filter(access_key=self.access_key, action__contains='revoked').exists())
+        self.assertTrue(KeyLog.objects.filter(access_key=self.access_key, event_type=KeyLog.REVOKED).exists())
 
     @patch.object(User, 'is_profile_complete', return_value=True)
     def test_only_admin_can_revoke_access_key(self, mock_is_profile_complete):
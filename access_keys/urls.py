@@ -7,7 +7,12 @@ urlpatterns = [
     path('purchase-access-key/', views.purchase_access_key_view, name='purchase_access_key'),
     path('initialize-payment/', views.initialize_payment, name='initialize_payment'),
     path('paystack/callback/', views.paystack_callback, name='paystack_callback'),
+    path('paystack/webhook/', views.paystack_webhook, name='paystack_webhook'),
+    path('payment-status/<str:reference>/', views.payment_status, name='payment_status'),
     path('revoke/<int:key_id>/', views.revoke_access_key_view, name='revoke_access_key'),
+    path('api/logs/', api_views.key_logs_view, name='key_logs'),
+    path('api/provision/', api_views.provision_access_keys_view, name='provision_access_keys'),
+    path('api/status/batch/', api_views.check_access_key_status_batch_view, name='key_status_batch'),
     path('api/status/<str:email>/', api_views.check_access_key_status_view, name='key_status'),
 ]
  
\ No newline at end of file
@@ -1,31 +1,35 @@
 import secrets
 import string
-from .models import AccessKey
+
+
+KEY_CHARACTERS = string.ascii_letters + string.digits
 
 
 def generate_access_key(key_length=20):
     """
-    Generates a unique access key.
+    Generates a random access key.
 
     Parameters:
         key_length (int): The length of the generated access key. Default is 20.
 
     Returns:
-        str: A unique access key of the specified length.
+        str: A random access key of the specified length.
 
     Raises:
         ValueError: If the specified key length is less than 1.
 
-    Uses the secrets module to generate random characters from the ASCII letters and digits.
-    It then checks if the generated key already exists in the AccessKey model.
-    If it does not exist, the function returns the generated key.
-    If it does, the function continues generating new keys until a unique one is found.
+    Draws a single random number below 62 ** key_length from the secrets module and writes it
+    in base 62 over the ASCII letters and digits, so every key is equally likely. Uniqueness is
+    not checked here: the key column is unique, and callers retry with a new key on the rare
+    IntegrityError instead of querying for every candidate.
     """
-
-    characters = string.ascii_letters + string.digits
-
-    while True:
-        key = ''.join(secrets.choice(characters) for _ in range(key_length))
-        if not AccessKey.objects.filter(key=key).exists():
-            return key
-        
\ No newline at end of file
+    if key_length < 1:
+        raise ValueError('Key length must be at least 1.')
+
+    base = len(KEY_CHARACTERS)
+    value = secrets.randbelow(base ** key_length)
+    characters = []
+    for _ in range(key_length):
+        value, index = divmod(value, base)
+        characters.append(KEY_CHARACTERS[index])
+    return ''.join(characters)
@@ -1,25 +1,28 @@
-from datetime import timedelta
+import json
 import logging
 from django.conf import settings
 from django.contrib.auth.decorators import login_required, permission_required
-from django.http import HttpResponse
-from django.views.decorators.http import require_GET
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_GET, require_POST
 from django.shortcuts import get_object_or_404, render, redirect
+from django.urls import reverse
 from django.contrib import messages
+from django.db import transaction
 from django.utils import timezone
 import requests
 
 from django.views.decorators.csrf import csrf_exempt
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
 
-from access_keys.models import AccessKey, KeyLog
+from access_keys.cache import invalidate_key_status
+from access_keys.counters import record_key_change
+from access_keys.models import AccessKey, KeyLog, Payment
 from users.contexts import common_context_data
 from users.forms import BillingInformationForm
 from users.helpers import is_admin, is_school_personnel, user_passes_test_with_403
-from users.models import School, User
-from .utils import generate_access_key
+from users.models import School
+from .paystack import get_paystack_client, is_valid_signature
+from .services import process_payment
+from .tasks import issue_key_for_payment
 
 
 logger = logging.getLogger(__name__)
@@ -107,25 +110,15 @@ def initialize_payment(request):
             logger.error("Billing information is missing for user.")
             return redirect('access_keys:purchase_access_key')
 
-        base_url = settings.PAYSTACK_SETTINGS.get('BASE_URL', 'https://api.paystack.co')
         callback_url = settings.PAYSTACK_SETTINGS['CALLBACK_URL']
 
-        url = f"{base_url}/transaction/initialize"
-        headers = {
-            'Authorization': f'Bearer {settings.PAYSTACK_SETTINGS["SECRET_KEY"]}',
-            'Content-Type': 'application/json',
-        }
-        data = {
-            'email': user.email,
-            'amount': int(settings.ACCESS_KEY_PRICE * 100),  # Convert from cedis to pesewas
-            'currency': 'GHS',
-            'callback_url': callback_url,
-        }
-
         try:
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            result = response.json()
+            result = get_paystack_client().initialize_transaction(
+                email=user.email,
+                amount=int(settings.ACCESS_KEY_PRICE * 100),  # Convert from cedis to pesewas
+                currency='GHS',
+                callback_url=callback_url,
+            )
             if result['status']:
                 authorization_url = result['data']['authorization_url']
                 logger.info("Payment initialization successful. Redirecting to Paystack.")
@@ -149,13 +142,17 @@ def initialize_payment(request):
 @csrf_exempt
 def paystack_callback(request):
     """
-    Handles the callback from Paystack after a successful payment.
+    Handles the callback from Paystack after a payment.
+
+    The reference is recorded and a Celery task verifies the payment and issues the access key,
+    so the response does not wait on Paystack or SMTP. The processing page polls
+    `payment_status` until the task has finished.
 
-   Args:
+    Args:
         request (HttpRequest): The HTTP request object.
 
     Returns:
-        HttpResponse indicating the success or failure of the payment.
+        HttpResponse: The payment processing page, or a 400 response if no reference was supplied.
     """
 
     reference = request.GET.get('reference')
@@ -164,71 +161,128 @@ def paystack_callback(request):
         logger.error("Payment reference not supplied.")
         return HttpResponse('Reference not supplied', status=400)
 
-    url = f"{settings.PAYSTACK_SETTINGS.get('BASE_URL', 'https://api.paystack.co')}/transaction/verify/{reference}"
-    headers = {
-        'Authorization': f'Bearer {settings.PAYSTACK_SETTINGS["SECRET_KEY"]}',
-    }
+    # Processing is idempotent per reference, so a revisited callback simply re-enqueues a
+    # payment that is still pending
+    payment, _ = Payment.objects.get_or_create(reference=reference)
+    if payment.status == Payment.PENDING:
+        transaction.on_commit(lambda: enqueue_payment(reference))
+        logger.info(f"Payment {reference} recorded. Verification enqueued.")
+
+    context = common_context_data(request)
+    context.update({
+        'payment': payment,
+        'status_url': reverse('access_keys:payment_status', args=[reference]),
+    })
+    return render(request, 'access_keys/payment_processing.html', context)
+
+
+@require_POST
+@csrf_exempt
+def paystack_webhook(request):
+    """
+    Receives Paystack webhook events.
+
+    The `x-paystack-signature` header must be the HMAC-SHA512 of the raw body under the Paystack
+    secret key. `charge.success` events for payments that are new or still pending are issued by
+    the same task as `paystack_callback`, without a verify call since the event is signed;
+    events for processed payments are ignored, and processing is idempotent per reference. Only
+    the shape of the amount is checked here: `process_payment` fails a charge that is not
+    exactly ACCESS_KEY_PRICE in GHS, for webhook and callback payments alike. The event is
+    acknowledged straight away; Paystack retries anything but a 200 response.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: 200 once the event is accepted, 400 if the signature or body is invalid or
+            the amount is not an integer number of pesewas.
+    """
+    signature = request.headers.get('x-paystack-signature')
+    if not is_valid_signature(request.body, signature, settings.PAYSTACK_SETTINGS['SECRET_KEY']):
+        logger.warning("Rejected Paystack webhook with an invalid signature.")
+        return HttpResponse('Invalid signature', status=400)
 
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        result = response.json()
-
-        if result['status']:
-            # Payment was successful
-            amount = result['data']['amount'] / 100  # Convert from pesewas to cedis
-            email = result['data']['customer']['email']
-
-            if not email:
-                logger.error("Email not found in payment verification.")
-                return HttpResponse('Email not found', status=400)
-
-            user = get_object_or_404(User, email=email)
-            school = get_object_or_404(School, users=user)
-
-            # Create access key
-            procurement_date = timezone.now()
-            expiry_date = procurement_date + timedelta(days=1)
-            access_key = AccessKey.objects.create(
-                school=school,
-                key=generate_access_key(),
-                status='active',
-                assigned_to=user,
-                procurement_date=procurement_date,
-                expiry_date=expiry_date,
-                price=amount,
-            )
+        event = json.loads(request.body)
+        data = event.get('data') or {}
+        reference = data.get('reference')
+    except (ValueError, AttributeError):
+        logger.error("Rejected Paystack webhook with an invalid body.")
+        return HttpResponse('Invalid payload', status=400)
+
+    if event.get('event') != 'charge.success' or not reference:
+        logger.info(f"Ignoring Paystack webhook event {event.get('event')}.")
+        return HttpResponse(status=200)
+
+    amount = data.get('amount')
+    if not isinstance(amount, int) or isinstance(amount, bool):
+        logger.error(f"Rejected Paystack webhook for payment {reference} without an integer amount: {amount!r}.")
+        return HttpResponse('Invalid amount', status=400)
+
+    payment, _ = Payment.objects.get_or_create(reference=reference)
+    if payment.status != Payment.PENDING:
+        # Already processed, e.g. from the callback or an earlier delivery of this event
+        logger.info(f"Ignoring Paystack webhook for processed payment {reference}.")
+        return HttpResponse(status=200)
+
+    # A payment the callback recorded may still be waiting on its verify call; the signed event
+    # lets it be issued without one
+    transaction_data = {
+        'status': data.get('status'),
+        'amount': amount,
+        'currency': data.get('currency'),
+        'customer': {'email': (data.get('customer') or {}).get('email')},
+    }
+    transaction.on_commit(lambda: enqueue_payment(reference, transaction_data))
+    logger.info(f"Payment {reference} recorded from webhook. Issuance enqueued.")
+    return HttpResponse(status=200)
 
-            # Log key creation
-            KeyLog.objects.create(
-                access_key=access_key,
-                action=f'Access key {access_key.key} purchased for school {school.name}',
-                user=user
-            )
 
-            # Send email notification
-            subject = 'Access Key Purchase Successful'
-            html_message = render_to_string('emails/access_key_purchase_success.html', {'user': user, 'access_key': access_key, 'school': school})
-            plain_message = strip_tags(html_message)
-            from_email = settings.DEFAULT_FROM_EMAIL
-            to = user.email
+def enqueue_payment(reference, transaction_data=None):
+    """
+    Enqueues the processing of a payment, processing it inline if the broker is unavailable.
 
-            send_mail(subject, plain_message, from_email, [to], html_message=html_message)
+    Args:
+        reference (str): The Paystack transaction reference.
+        transaction_data (dict, optional): The transaction from a verified webhook event.
+    """
+    try:
+        issue_key_for_payment.delay(reference, transaction_data)
+    except Exception as e:
+        logger.error(f"Could not enqueue payment {reference}: {str(e)}. Processing it inline.")
+        try:
+            process_payment(reference, transaction_data)
+        except requests.RequestException as e:
+            logger.error(f"Error verifying payment {reference}: {str(e)}")
 
-            messages.success(request, 'Payment successful. Access key purchased.')
-            logger.info("Payment verification successful. Access key created and email sent.")
-            return redirect('school_dashboard')
-        else:
-            messages.error(request, 'Payment failed.')
-            logger.error("Payment verification failed.")
-            return redirect('school_dashboard')
 
-    except requests.RequestException as e:
-        logger.error(f"Error verifying payment: {str(e)}")
-        return HttpResponse('Error verifying payment', status=500)
+@require_GET
+def payment_status(request, reference):
+    """
+    Returns the processing status of a payment as JSON, for the processing page to poll.
+
+    Once the payment is processed, the outcome is queued as a flash message and the response
+    carries the URL to continue to.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        reference (str): The Paystack transaction reference.
 
-    logger.error("Payment verification failed.")
-    return HttpResponse('Payment verification failed', status=400)
+    Returns:
+        JsonResponse: The payment status and, once processed, the redirect URL.
+    """
+    payment = Payment.objects.filter(reference=reference).values('status', 'message').first()
+    if payment is None:
+        return JsonResponse({'error': 'Payment not found.'}, status=404)
+
+    data = {'status': payment['status']}
+    if payment['status'] == Payment.SUCCEEDED:
+        messages.success(request, 'Payment successful. Access key purchased.')
+        data['redirect_url'] = reverse('school_dashboard')
+    elif payment['status'] == Payment.FAILED:
+        messages.error(request, payment['message'] or 'Payment failed.')
+        data['redirect_url'] = reverse('school_dashboard')
+    return JsonResponse(data)
 
 @login_required
 @user_passes_test_with_403(is_admin)
@@ -247,17 +301,23 @@ def revoke_access_key_view(request, key_id):
     """
     access_key = get_object_or_404(AccessKey, id=key_id)
     if request.method == 'POST':
-        access_key.status = 'revoked'
-        access_key.revoked_by = request.user
-        access_key.revoked_on = timezone.now()
-        access_key.save()
-
-        # Log key revocation
-        KeyLog.objects.create(
-            access_key=access_key,
-            action=f'Access key {access_key.key} revoked for school {access_key.school.name}',
-            user=request.user,
-        )
+        old_status = access_key.status
+        with transaction.atomic():
+            access_key.status = 'revoked'
+            access_key.revoked_by = request.user
+            access_key.revoked_on = timezone.now()
+            access_key.save()
+
+            # Log key revocation
+            KeyLog.objects.create(
+                access_key=access_key,
+                event_type=KeyLog.REVOKED,
+                school_id=access_key.school_id,
+                payload={'key': access_key.key},
+                user=request.user,
+            )
+            record_key_change(access_key.school_id, old_status, 'revoked')
+            invalidate_key_status([access_key.school_id])
 
         messages.success(request, 'Access key revoked successfully.')
         logger.info(f"Access key {access_key.key} revoked by admin.")
@@ -0,0 +1,6 @@
+from decouple import config
+
+
+# Each thread holds its own database connection; see the connection budget in settings.py
+workers = config('WEB_CONCURRENCY', default=1, cast=int)
+threads = config('GUNICORN_THREADS', default=1, cast=int)
@@ -0,0 +1,42 @@
+/**
+ * Polls the payment status endpoint until the payment has been processed,
+ * then follows the redirect it returns.
+ */
+document.addEventListener("DOMContentLoaded", function () {
+  let statusUrl = PAYMENT_STATUS_URL; // Status endpoint URL from the template
+  let delay = 1000; // Milliseconds before the next poll
+  const maxDelay = 10000;
+  const statusMessage = document.getElementById("payment-status-message");
+
+  /**
+   * Fetch the payment status and either redirect or schedule the next poll.
+   */
+  function poll() {
+    fetch(statusUrl, { headers: { Accept: "application/json" } })
+      .then(function (response) {
+        return response.json();
+      })
+      .then(function (data) {
+        if (data.status !== "pending" && data.redirect_url) {
+          window.location.href = data.redirect_url;
+          return;
+        }
+        scheduleNextPoll();
+      })
+      .catch(function () {
+        statusMessage.textContent =
+          "We could not check your payment status. Retrying...";
+        scheduleNextPoll();
+      });
+  }
+
+  /**
+   * Back off gradually so a slow payment does not flood the server.
+   */
+  function scheduleNextPoll() {
+    setTimeout(poll, delay);
+    delay = Math.min(delay * 1.5, maxDelay);
+  }
+
+  poll();
+});
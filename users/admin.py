@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, BillingInformation
+from .models import User, BillingInformation, EmailOutbox
 
 # Register your models here.
 admin.site.register(User, UserAdmin)
-admin.site.register(BillingInformation)
\ No newline at end of file
+admin.site.register(BillingInformation)
+admin.site.register(EmailOutbox)
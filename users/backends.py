@@ -0,0 +1,102 @@
+import copy
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+from access_key_manager.db_router import use_primary
+from users.permissions import resolver, user_roles
+
+
+"""
+An authentication backend that serves the logged-in user from the cache.
+
+`AuthenticationMiddleware` loads the user of every authenticated request through the backend's
+`get_user`. `CachedModelBackend` keeps each user, with the role flags and the permissions that
+`permission_required` checks already loaded, in the cache for AUTH_USER_CACHE_TIMEOUT seconds,
+so that together with cache-backed sessions an authenticated request runs no query before the
+view. Users are cached when they log in, and dropped from the cache whenever they, their
+permissions or their groups change (see users/signals.py).
+"""
+
+
+def user_cache_key(user_id):
+    return f'auth_user:{user_id}'
+
+
+def invalidate_cached_users(user_ids):
+    """
+    Drops the cached users, so their next request reloads them.
+
+    Inside a transaction the users are dropped immediately and again on commit, so a concurrent
+    request cannot re-cache the pre-commit state.
+
+    Args:
+        user_ids (iterable): The primary keys of the users.
+    """
+    cache_keys = [user_cache_key(user_id) for user_id in user_ids]
+    if not cache_keys:
+        return
+    if transaction.get_connection().in_atomic_block:
+        cache.delete_many(cache_keys)
+    transaction.on_commit(lambda: cache.delete_many(cache_keys))
+
+
+def cache_user(user):
+    """
+    Caches a user with their permissions loaded, e.g. when they log in.
+
+    The password hash is left out of the cached copy, which only keeps the session hash derived
+    from it. The password is a deferred field on the copy, so saving it never overwrites the hash.
+
+    Args:
+        user (User): The user.
+    """
+    ModelBackend().get_all_permissions(user)
+    cached = copy.copy(user)
+    cached._session_auth_hash = user.get_session_auth_hash()
+    cached.__dict__.pop('password', None)
+    cache.set(user_cache_key(user.pk), cached, settings.AUTH_USER_CACHE_TIMEOUT)
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    The model backend, with `get_user` served from the cache, and the permissions of the user's
+    roles granted on top of their own and their groups' (see users/permissions.py).
+    """
+
+    def get_user(self, user_id):
+        """
+        Returns the active user with the given primary key, from the cache when possible.
+
+        Cache misses are read from the primary, so a lagging replica never re-caches a stale user.
+
+        Args:
+            user_id: The primary key stored in the session.
+
+        Returns:
+            User: The user with their permissions loaded, or None.
+        """
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            with use_primary():
+                user = super().get_user(user_id)
+                if user is not None:
+                    cache_user(user)
+            return user
+        return user if self.user_can_authenticate(user) else None
+
+    def get_all_permissions(self, user_obj, obj=None):
+        """
+        Returns the user's own and group permissions, and the permissions of their roles.
+
+        Args:
+            user_obj (User): The user.
+            obj (optional): Object-level permissions are not supported.
+
+        Returns:
+            set: The permissions, as 'app_label.codename' strings.
+        """
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        return super().get_all_permissions(user_obj) | resolver.permissions(user_roles(user_obj))
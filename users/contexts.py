@@ -1,6 +1,5 @@
 from access_keys.models import AccessKey
-from users.models import School
-from django.db.models import Count
+from access_keys.counters import get_key_stats
 
 def common_context_data(request):
     """
@@ -9,44 +8,42 @@ def common_context_data(request):
     :param request: The HTTP request object.
     :return: A dictionary containing the common context data.
 
-    The function first calculates the total number of registered schools, the total number of active keys,
-    the total number of revoked keys, and the total number of expired keys. It then creates a dictionary
-    with these values and adds it to the context.
+    The function reads the total number of registered schools, the total number of active keys,
+    the total number of revoked keys, and the total number of expired keys from the materialized
+    key counters. It then creates a dictionary with these values and adds it to the context.
 
     If the user is authenticated, a school personnel, and has a school associated with their account,
     the function retrieves the user's school, the school's active key, the number of expired keys,
-    the number of revoked keys, and the total number of keys purchased by the school. It then updates
-    the context dictionary with these values.
+    the number of revoked keys, and the total number of keys purchased by the school. The school's
+    counters are read in the same query as the global ones. It then updates the context dictionary
+    with these values.
 
     The function returns the context dictionary.
     """
-    total_registered_schools = School.objects.annotate(user_count=Count('users')).filter(user_count__gt=0).count()
-    total_active_keys = AccessKey.objects.filter(status='active').count()
-    total_revoked_keys = AccessKey.objects.filter(status='revoked').count()
-    total_expired_keys = AccessKey.objects.filter(status='expired').count()
+    user = request.user
+    school_id = user.school_id if user.is_authenticated and user.is_school_personnel else None
+    global_stats, school_stats = get_key_stats(school_id)
+
+    total_active_keys = global_stats['active_count']
+    total_revoked_keys = global_stats['revoked_count']
+    total_expired_keys = global_stats['expired_count']
 
     context = {
-        'total_registered_schools': total_registered_schools,  # Note the updated context variable name
+        'total_registered_schools': global_stats['registered_schools'],
         'total_active_keys': total_active_keys,
         'total_revoked_keys': total_revoked_keys,
         'total_expired_keys': total_expired_keys,
         'total_keys_purchased': total_active_keys + total_revoked_keys + total_expired_keys,
     }
 
-    if request.user.is_authenticated and request.user.is_school_personnel and request.user.school:
-        school = request.user.school
-        active_key = school.access_keys.filter(status='active').first()
-        expired_keys_count = school.access_keys.filter(status='expired').count()
-        revoked_keys_count = school.access_keys.filter(status='revoked').count()
-        keys_purchased_count = school.access_keys.count()
+    if school_id:
+        active_key = AccessKey.objects.filter(school_id=school_id, status='active').first()
 
         context.update({
             'active_key': active_key,
-            'expired_keys_count': expired_keys_count,
-            'revoked_keys_count': revoked_keys_count,
-            'keys_purchased_count': keys_purchased_count,
+            'expired_keys_count': school_stats['expired_count'],
+            'revoked_keys_count': school_stats['revoked_count'],
+            'keys_purchased_count': school_stats['active_count'] + school_stats['expired_count'] + school_stats['revoked_count'],
         })
 
     return context
-
-            
\ No newline at end of file
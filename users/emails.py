@@ -0,0 +1,58 @@
+import logging
+from django.conf import settings
+from django.db import transaction
+from users.models import EmailOutbox
+
+
+"""
+Queueing of outgoing emails through the EmailOutbox.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def queue_email(subject, body, recipient, html_body='', dedupe_key=''):
+    """
+    Queues an email for delivery by the `send_outbox_emails` task.
+
+    Call this inside the transaction of the change the email reports, so that the email is
+    queued if and only if the change commits. Delivery is kicked off once the transaction commits;
+    the periodic drain picks the email up if that fails.
+
+    Args:
+        subject (str): The subject line.
+        body (str): The plain text body.
+        recipient (str): The recipient's email address.
+        html_body (str, optional): The HTML alternative body.
+        dedupe_key (str, optional): Identifies the email per recipient. If an email with the
+            same key was already queued for the recipient, no new email is queued.
+
+    Returns:
+        EmailOutbox: The queued email.
+    """
+    fields = {
+        'subject': subject,
+        'body': body,
+        'html_body': html_body,
+        'from_email': settings.DEFAULT_FROM_EMAIL,
+    }
+    if dedupe_key:
+        email, created = EmailOutbox.objects.get_or_create(recipient=recipient, dedupe_key=dedupe_key, defaults=fields)
+        if not created:
+            logger.info(f"Email {dedupe_key} to {recipient} is already queued. Skipping.")
+            return email
+    else:
+        email = EmailOutbox.objects.create(recipient=recipient, **fields)
+
+    transaction.on_commit(_kick_delivery)
+    return email
+
+
+def _kick_delivery():
+    from users.tasks import send_outbox_emails
+
+    try:
+        send_outbox_emails.delay()
+    except Exception as e:
+        # The periodic drain will still deliver the email
+        logger.error(f"Could not enqueue outbox delivery: {str(e)}")
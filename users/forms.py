@@ -346,4 +346,36 @@ class UpdateBillingInformationForm(forms.ModelForm):
                 logger.error("Credit card details provided for MOMO payment method")
 
         return cleaned_data
-    
\ No newline at end of file
+    
+
+class AdminDashboardFilterForm(forms.Form):
+    """
+    A form for filtering the access keys and key logs on the admin dashboard.
+
+    Attributes:
+        status (forms.ChoiceField): Restricts the access keys to one status.
+        school (forms.ModelChoiceField): Restricts the access keys and key logs to one school.
+        date_from (forms.DateField): The first day (inclusive) of the procurement or log date range.
+        date_to (forms.DateField): The last day (inclusive) of the procurement or log date range.
+    """
+    status = forms.ChoiceField(choices=[('', 'All statuses'), ('active', 'Active'), ('expired', 'Expired'), ('revoked', 'Revoked')], required=False)
+    school = forms.ModelChoiceField(queryset=School.objects.order_by('name'), required=False, empty_label='All schools')
+    date_from = forms.DateField(required=False, label='From', widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(required=False, label='To', widget=forms.DateInput(attrs={'type': 'date'}))
+
+    def clean(self):
+        """
+        Validates that the date range is not reversed.
+
+        Returns:
+            cleaned_data (dict): A dictionary containing the validated form data.
+
+        Raises:
+            ValidationError: If the start date is after the end date.
+        """
+        cleaned_data = super().clean()
+        date_from = cleaned_data.get('date_from')
+        date_to = cleaned_data.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise ValidationError('The start date must be on or before the end date.')
+        return cleaned_data
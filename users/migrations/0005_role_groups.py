@@ -0,0 +1,53 @@
+from django.contrib.auth.management import create_permissions
+from django.db import migrations
+
+
+# The permissions of each role group, and the user flag that gives a user the role
+ROLES = [
+    ('Admins', 'can_revoke_access_key', 'is_admin'),
+    ('School personnel', 'can_purchase_access_key', 'is_school_personnel'),
+]
+
+
+def create_role_groups(apps, schema_editor):
+    # Permissions are normally created after migrations run; create them now to grant them
+    users_app = apps.get_app_config('users')
+    users_app.models_module = True
+    create_permissions(users_app, apps=apps, verbosity=0)
+    users_app.models_module = None
+
+    Group = apps.get_model('auth', 'Group')
+    Permission = apps.get_model('auth', 'Permission')
+    User = apps.get_model('users', 'User')
+    for group_name, codename, flag in ROLES:
+        permission = Permission.objects.get(content_type__app_label='users', codename=codename)
+        group, _ = Group.objects.get_or_create(name=group_name)
+        group.permissions.add(permission)
+        # The role now grants the permission to every user with the flag
+        User.user_permissions.through.objects.filter(permission=permission, **{f'user__{flag}': True}).delete()
+
+
+def remove_role_groups(apps, schema_editor):
+    Group = apps.get_model('auth', 'Group')
+    Permission = apps.get_model('auth', 'Permission')
+    User = apps.get_model('users', 'User')
+    for group_name, codename, flag in ROLES:
+        permission = Permission.objects.get(content_type__app_label='users', codename=codename)
+        User.user_permissions.through.objects.bulk_create([
+            User.user_permissions.through(user_id=user_id, permission_id=permission.pk)
+            for user_id in User.objects.filter(**{flag: True}).values_list('pk', flat=True)
+        ], ignore_conflicts=True)
+        Group.objects.filter(name=group_name).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_emailoutbox'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_role_groups, remove_role_groups),
+    ]
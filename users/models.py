@@ -1,5 +1,6 @@
 import logging
 from django.db import models
+from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import AbstractUser
 
@@ -36,6 +37,25 @@ class User(AbstractUser):
             ("can_revoke_access_key", "Can revoke access key"),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Loads a user, remembering the school it was loaded with so that saves can tell whether it changed.
+        """
+        user = super().from_db(db, field_names, values)
+        if 'school_id' in user.__dict__:
+            user._loaded_school_id = user.school_id
+        return user
+
+    def get_session_auth_hash(self):
+        """
+        Returns the session hash, as computed before the password was left out of a cached copy
+        of the user (see users/backends.py), or from the password.
+        """
+        if 'password' not in self.__dict__ and hasattr(self, '_session_auth_hash'):
+            return self._session_auth_hash
+        return super().get_session_auth_hash()
+
     def clean(self):
         """
         Ensures that school personnel cannot change their school after submitting their profile.
@@ -135,3 +155,65 @@ class BillingInformation(models.Model):
     def __str__(self):
         return f"{self.user.email} - {self.get_payment_method_display()}"
 
+
+
+class EmailOutbox(models.Model):
+    """
+    Model representing an outgoing email waiting to be delivered.
+
+    Emails are written in the same transaction as the change that triggers them and delivered
+    later by the `send_outbox_emails` task, so SMTP latency never adds to request latency.
+
+    Attributes:
+        recipient (EmailField): The recipient's email address.
+        subject (CharField): The subject line.
+        body (TextField): The plain text body.
+        html_body (TextField): The HTML alternative body, if any.
+        from_email (CharField): The sender address.
+        dedupe_key (CharField): Identifies the email per recipient; a second email with the same key is not queued.
+        status (CharField): The delivery status.
+        attempts (PositiveIntegerField): The number of failed delivery attempts.
+        next_attempt_at (DateTimeField): The earliest time of the next delivery attempt, or the end of
+            the claim of a worker sending it.
+        last_error (TextField): The error of the last failed attempt.
+        created_at (DateTimeField): The timestamp when the email was queued.
+        sent_at (DateTimeField): The timestamp when the email was delivered.
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255)
+    dedupe_key = models.CharField(max_length=100, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipient', 'dedupe_key'],
+                condition=~models.Q(dedupe_key=''),
+                name='unique_outbox_email_per_recipient',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.recipient} - {self.status}"
@@ -0,0 +1,99 @@
+import base64
+import json
+import logging
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+logger = logging.getLogger(__name__)
+
+
+def encode_cursor(value, pk):
+    """
+    Encodes a keyset position (the ordering value and the primary key) into an opaque cursor.
+    """
+    raw = json.dumps([value.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor produced by `encode_cursor`.
+
+    Returns:
+        tuple: The ordering value and the primary key, or None if the cursor is invalid.
+    """
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        value = parse_datetime(value)
+        if value is None or not isinstance(pk, int):
+            raise ValueError(cursor)
+        return value, pk
+    except (TypeError, ValueError, UnicodeError):
+        logger.warning(f"Ignoring invalid pagination cursor: {cursor}")
+        return None
+
+
+class KeysetPage:
+    """
+    A page of results from `keyset_paginate`.
+
+    Attributes:
+        object_list (list): The rows of the page, newest first.
+        next_cursor (str): The cursor of the following (older) page, or None on the last page.
+        previous_cursor (str): The cursor of the preceding (newer) page, or None on the first page.
+    """
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def keyset_paginate(queryset, field, page_size, after=None, before=None):
+    """
+    Returns one page of a queryset ordered newest first by `field`, then by primary key.
+
+    Unlike offset pagination, each page is a range scan that starts from the position encoded
+    in the cursor, so its cost does not depend on how deep into the table the page is.
+
+    Args:
+        queryset (QuerySet): The rows to paginate.
+        field (str): The datetime field to order by, descending.
+        page_size (int): The number of rows per page.
+        after (str, optional): A cursor; the page starts just after (older than) this position.
+        before (str, optional): A cursor; the page ends just before (newer than) this position.
+
+    Returns:
+        KeysetPage: The requested page.
+    """
+    after = decode_cursor(after) if after else None
+    before = decode_cursor(before) if before else None
+
+    if before:
+        value, pk = before
+        rows = list(
+            queryset.filter(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk}))
+            .order_by(field, 'pk')[:page_size + 1]
+        )
+        has_newer = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        has_older = True
+    else:
+        if after:
+            value, pk = after
+            queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk}))
+        rows = list(queryset.order_by(f'-{field}', '-pk')[:page_size + 1])
+        has_older = len(rows) > page_size
+        rows = rows[:page_size]
+        has_newer = after is not None
+
+    next_cursor = encode_cursor(getattr(rows[-1], field), rows[-1].pk) if rows and has_older else None
+    previous_cursor = encode_cursor(getattr(rows[0], field), rows[0].pk) if rows and has_newer else None
+    return KeysetPage(rows, next_cursor, previous_cursor)
@@ -0,0 +1,101 @@
+import threading
+import time
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+
+
+"""
+Role-based permissions, resolved without per-user permission rows.
+
+A user's roles follow from their `is_admin` and `is_school_personnel` flags, and each role is
+granted the permissions of its group in ROLE_GROUPS, created by migration. Each process keeps
+the permissions per role in memory, tagged with the version of the role groups. Changing the
+permissions of a group bumps the shared version in the cache, and every process reloads the
+role permissions within ROLE_PERMISSIONS_CHECK_INTERVAL seconds of seeing the new version.
+"""
+
+ROLE_GROUPS = {
+    'admin': 'Admins',
+    'school_personnel': 'School personnel',
+}
+
+VERSION_KEY = 'role_permissions_version'
+
+
+def user_roles(user):
+    """
+    Returns the roles of a user.
+
+    Args:
+        user (User): The user.
+
+    Returns:
+        tuple: The names of the user's roles, e.g. ('school_personnel',).
+    """
+    return tuple(role for role, flag in (('admin', user.is_admin), ('school_personnel', user.is_school_personnel)) if flag)
+
+
+class RolePermissionResolver:
+    """
+    The process-local permissions per role, reloaded when the shared version changes.
+    """
+
+    def __init__(self):
+        self._permissions = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def permissions(self, roles):
+        """
+        Returns the permissions of the given roles, as 'app_label.codename' strings.
+
+        Args:
+            roles (iterable): The role names.
+
+        Returns:
+            set: The permissions granted to any of the roles.
+        """
+        permissions = self._current()
+        return set().union(*(permissions.get(role, ()) for role in roles))
+
+    def _current(self):
+        now = time.monotonic()
+        if self._permissions is not None and now - self._checked_at < settings.ROLE_PERMISSIONS_CHECK_INTERVAL:
+            return self._permissions
+        with self._lock:
+            version = cache.get(VERSION_KEY)
+            if self._permissions is None or version != self._version:
+                self._permissions = self._load()
+                self._version = version
+            self._checked_at = now
+            return self._permissions
+
+    def _load(self):
+        roles = {group: role for role, group in ROLE_GROUPS.items()}
+        permissions = {role: set() for role in ROLE_GROUPS}
+        rows = Group.objects.filter(name__in=roles, permissions__isnull=False).values_list(
+            'name', 'permissions__content_type__app_label', 'permissions__codename'
+        )
+        for group, app_label, codename in rows:
+            permissions[roles[group]].add(f'{app_label}.{codename}')
+        return {role: frozenset(codes) for role, codes in permissions.items()}
+
+    def invalidate(self):
+        """
+        Drops this process's role permissions, so that the next check reloads them.
+        """
+        self._permissions = None
+
+
+resolver = RolePermissionResolver()
+
+
+def bump_role_permissions_version():
+    """
+    Tells every process to reload the role permissions.
+    """
+    cache.add(VERSION_KEY, 0, timeout=None)
+    cache.incr(VERSION_KEY)
+    resolver.invalidate()
@@ -1,34 +1,131 @@
 import logging
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
-from django.contrib.auth.models import Permission
+from django.contrib.auth.models import Group
+from django.contrib.auth.signals import user_logged_in
+from access_keys.counters import refresh_registered_schools
+from users.backends import cache_user, invalidate_cached_users
+from users.permissions import bump_role_permissions_version
 from .models import User
 
 logger = logging.getLogger(__name__)
 
 @receiver(post_save, sender=User)
-def assign_permissions(sender, instance, created, **kwargs):
+def update_registered_schools(sender, instance, created, update_fields=None, **kwargs):
     """
-    Assigns permissions to users based on their roles (school personnel or admin).
+    Refreshes the registered schools counter when a user's school changed.
+
+    Saves that leave the school as it was loaded, e.g. the `last_login` update of every login or
+    a profile edit, skip the recount.
 
     Args:
         sender: The model class (User).
         instance: The actual instance being saved.
-        created: A boolean; True if a new record was created.
+        created: Whether the user was created.
+        update_fields: The fields passed to save(), if any.
     """
+    if update_fields is not None and 'school' not in update_fields:
+        return
     if created:
-        try:
-            if instance.is_school_personnel:
-                permission = Permission.objects.get(codename='can_purchase_access_key')
-                instance.user_permissions.add(permission)
-                logger.info(f"Assigned 'can_purchase_access_key' permission to user {instance.email}.")
-            elif instance.is_admin:
-                permission = Permission.objects.get(codename='can_revoke_access_key')
-                instance.user_permissions.add(permission)
-                logger.info(f"Assigned 'can_revoke_access_key' permission to admin user {instance.email}.")
-        except Permission.DoesNotExist as e:
-            logger.error(f"Permission assignment failed for user {instance.email}: {str(e)}")
-        except Exception as e:
-            logger.exception(f"Unexpected error while assigning permissions to user {instance.email}: {str(e)}")
+        changed = instance.school_id is not None
     else:
-        logger.info(f"User {instance.email} updated, but no permissions were assigned.")
+        # Users not loaded from the database, or loaded without their school, may have changed it
+        changed = getattr(instance, '_loaded_school_id', object()) != instance.school_id
+    instance._loaded_school_id = instance.school_id
+    if changed:
+        refresh_registered_schools()
+
+
+@receiver(post_delete, sender=User)
+def update_registered_schools_on_delete(sender, instance, **kwargs):
+    """
+    Refreshes the registered schools counter when a user with a school is deleted.
+
+    Args:
+        sender: The model class (User).
+        instance: The actual instance being deleted.
+    """
+    if instance.school_id is not None or getattr(instance, '_loaded_school_id', None) is not None:
+        refresh_registered_schools()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Drops the cached copy of a changed or deleted user.
+
+    Args:
+        sender: The model class (User).
+        instance: The actual instance being saved or deleted.
+    """
+    invalidate_cached_users([instance.pk])
+
+
+@receiver(user_logged_in)
+def cache_logged_in_user(sender, request, user, **kwargs):
+    """
+    Caches the user as they log in, so that their first request is served from the cache too.
+
+    Args:
+        sender: The user class.
+        request: The login request.
+        user: The user who logged in.
+    """
+    cache_user(user)
+
+
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_cached_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Drops the cached users whose permissions or groups changed, with their cached permissions.
+
+    Args:
+        sender: The intermediate model of the relation.
+        instance: The user, or the permission or group when changed from the reverse side.
+        action: The m2m_changed action.
+        reverse: Whether the relation was changed from the permission or group side.
+        pk_set: The primary keys of the added or removed objects.
+    """
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_cached_users([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        invalidate_cached_users(pk_set)
+    elif action == 'pre_clear':
+        # Cleared from the permission or group side, while its users are still known
+        invalidate_cached_users(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_group_members(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Drops the cached members of groups whose permissions changed.
+
+    Args:
+        sender: The intermediate model of the relation.
+        instance: The group, or the permission when changed from the permission side.
+        action: The m2m_changed action.
+        reverse: Whether the relation was changed from the permission side.
+        pk_set: The primary keys of the added or removed objects.
+    """
+    if action in ('post_add', 'post_remove', 'pre_clear'):
+        groups = [instance] if not reverse else pk_set if pk_set is not None else instance.group_set.all()
+        members = User.objects.filter(groups__in=groups).values_list('pk', flat=True).distinct()
+        invalidate_cached_users(members)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_role_permissions(sender, action=None, **kwargs):
+    """
+    Makes every process reload the role permissions once a group change is committed.
+
+    Args:
+        sender: The Group model or the intermediate model of its permissions.
+        action: The m2m_changed action, if any.
+    """
+    if action is None or action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(bump_role_permissions_version)
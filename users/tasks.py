@@ -0,0 +1,201 @@
+import time
+from datetime import timedelta
+from smtplib import SMTPServerDisconnected
+from celery import shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+from access_key_manager import metrics
+from users.models import EmailOutbox
+
+
+"""
+Celery tasks for delivering queued emails.
+"""
+
+logger = get_task_logger(__name__)
+
+MAX_RETRY_DELAY = 60 * 60  # seconds
+
+# Errors that mean the SMTP connection itself is gone, rather than one message being refused
+CONNECTION_ERRORS = (SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+def _retry_delay(attempts):
+    """
+    Returns the backoff before the next delivery attempt, doubling per failed attempt.
+    """
+    return timedelta(seconds=min(settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY))
+
+
+def _claim_due_emails(batch_size):
+    """
+    Claims up to `batch_size` due emails for this worker in a short transaction.
+
+    Claimed emails are marked as sending until EMAIL_OUTBOX_CLAIM_TIMEOUT seconds from now, so
+    other workers skip them while they are sent outside any transaction. Emails whose claim ran
+    out, e.g. because their worker died, are due again.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status__in=[EmailOutbox.PENDING, EmailOutbox.SENDING], next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'pk')[:batch_size]
+        )
+        if emails:
+            EmailOutbox.objects.filter(pk__in=[email.pk for email in emails]).update(
+                status=EmailOutbox.SENDING,
+                next_attempt_at=now + timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT),
+            )
+    return emails
+
+
+def _send(email, connection):
+    message = EmailMultiAlternatives(email.subject, email.body, email.from_email, [email.recipient], connection=connection)
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    message.send()
+
+
+def deliver_outbox(batch_size=None, connection=None, time_budget=None):
+    """
+    Delivers the due emails in the outbox over a single SMTP connection, in batches.
+
+    Each batch claims up to `batch_size` due emails (skipping rows another worker holds), sends
+    them outside any transaction, and records the outcomes with one bulk_update. The connection
+    is only opened once there is something to send. A failed email is rescheduled with
+    exponential backoff until EMAIL_OUTBOX_MAX_ATTEMPTS is reached, then marked as failed. If the
+    connection drops, the remaining emails of the batch are released untouched and the error is
+    raised. Once `time_budget` seconds have passed, no further email is sent and the rest of the
+    batch is released for the next run. If the task's soft time limit interrupts a send, the
+    outcomes so far are recorded before SoftTimeLimitExceeded propagates.
+
+    Args:
+        batch_size (int, optional): Emails per batch. Defaults to EMAIL_OUTBOX_BATCH_SIZE.
+        connection (optional): The email backend connection. Defaults to a new connection.
+        time_budget (float, optional): The seconds after which to stop. Defaults to no limit.
+
+    Returns:
+        dict: The number of sent, retried and failed emails, the number of batches, the elapsed
+            seconds, and whether the time budget ran out before the outbox was drained.
+
+    Raises:
+        OSError: If the SMTP connection cannot be opened or drops.
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    connection = connection or get_connection()
+    counts = {'sent': 0, 'retried': 0, 'failed': 0, 'batches': 0, 'out_of_time': False}
+
+    started = time.monotonic()
+    opened = False
+
+    def out_of_time():
+        return time_budget is not None and time.monotonic() - started >= time_budget
+
+    try:
+        while not counts['out_of_time']:
+            if out_of_time():
+                counts['out_of_time'] = True
+                break
+            emails = _claim_due_emails(batch_size)
+            if not emails:
+                break
+            if not opened:
+                try:
+                    connection.open()
+                except Exception:
+                    _record_outcomes(emails)
+                    raise
+                opened = True
+
+            attempted = []
+            try:
+                for email in emails:
+                    if out_of_time():
+                        counts['out_of_time'] = True
+                        break
+                    attempted.append(email)
+                    try:
+                        _send(email, connection)
+                    except SoftTimeLimitExceeded:
+                        # Whether this email went out is unknown; it is released and sent again
+                        attempted.pop()
+                        raise
+                    except Exception as e:
+                        email.attempts += 1
+                        email.last_error = str(e)
+                        if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+                            email.status = EmailOutbox.FAILED
+                            counts['failed'] += 1
+                            logger.error(f"Giving up on email {email.pk} to {email.recipient}: {str(e)}")
+                        else:
+                            email.status = EmailOutbox.PENDING
+                            email.next_attempt_at = timezone.now() + _retry_delay(email.attempts)
+                            counts['retried'] += 1
+                            logger.warning(f"Email {email.pk} to {email.recipient} failed, retrying at {email.next_attempt_at}: {str(e)}")
+                        if isinstance(e, CONNECTION_ERRORS):
+                            raise
+                    else:
+                        email.status = EmailOutbox.SENT
+                        email.sent_at = timezone.now()
+                        counts['sent'] += 1
+            finally:
+                _record_outcomes(emails, attempted)
+            counts['batches'] += 1
+    finally:
+        if opened:
+            connection.close()
+
+    counts['seconds'] = round(time.monotonic() - started, 3)
+    return counts
+
+
+def _record_outcomes(emails, attempted=()):
+    """
+    Saves the outcomes of the attempted emails and releases the rest of the claimed batch.
+    """
+    attempted = {email.pk for email in attempted}
+    now = timezone.now()
+    for email in emails:
+        if email.pk not in attempted:
+            email.status = EmailOutbox.PENDING
+            email.next_attempt_at = now
+    EmailOutbox.objects.bulk_update(emails, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
+
+
+@shared_task(bind=True, autoretry_for=(OSError,), retry_backoff=True, retry_backoff_max=600, max_retries=5)
+def send_outbox_emails(self):
+    """
+    Deliver the queued emails that are due, within the task's soft time limit.
+
+    Runs whenever an email is queued and every minute to pick up retries. Concurrent runs skip
+    each other's claimed rows, so each email is sent once. A run stops sending early enough to
+    finish before its soft time limit, even if a send then hits EMAIL_TIMEOUT, and enqueues the
+    next run straight away if due emails remain. The task is retried with backoff if the mail
+    server cannot be reached.
+
+    Returns:
+        dict: The delivery metrics from `deliver_outbox`.
+    """
+    time_budget = None
+    if self.soft_time_limit:
+        # A send makes several SMTP round trips, each of which may take up to EMAIL_TIMEOUT
+        time_budget = max(self.soft_time_limit - 3 * settings.EMAIL_TIMEOUT, 0)
+
+    result = deliver_outbox(time_budget=time_budget)
+    for outcome in ('sent', 'retried', 'failed'):
+        if result[outcome]:
+            metrics.inc('email_outbox_deliveries_total', result[outcome], outcome=outcome)
+    if result['batches']:
+        logger.info(
+            f"Outbox delivery: sent {result['sent']}, retried {result['retried']}, failed {result['failed']} "
+            f"in {result['batches']} batches ({result['seconds']}s)."
+        )
+    if result['out_of_time']:
+        logger.info("Outbox delivery ran out of time. Continuing in a new run.")
+        send_outbox_emails.delay()
+    return result
@@ -0,0 +1,104 @@
+from unittest.mock import patch
+from django.contrib.auth.models import Group, Permission
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from access_key_manager.db_router import use_primary
+from users.backends import CachedModelBackend, cache_user, user_cache_key
+from users.models import School, User
+
+
+class CachedModelBackendTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.backend = CachedModelBackend()
+        self.school = School.objects.create(name='Test School')
+        self.user = User.objects.create_user(
+            username='school_user', email='school@example.com', password='password',
+            is_school_personnel=True, school=self.school,
+        )
+        self.revoke = Permission.objects.get(codename='can_revoke_access_key')
+
+    def test_cached_user_and_permissions_need_no_queries(self):
+        # Caches the user, and loads the role permissions of this process
+        self.backend.get_user(self.user.pk).has_perm('users.can_purchase_access_key')
+        with self.assertNumQueries(0):
+            user = self.backend.get_user(self.user.pk)
+            self.assertTrue(user.is_school_personnel)
+            self.assertEqual(user.school_id, self.school.pk)
+            self.assertTrue(user.has_perm('users.can_purchase_access_key'))
+
+    def test_profile_changes_invalidate_the_cached_user(self):
+        self.backend.get_user(self.user.pk)
+        self.user.first_name = 'Changed'
+        self.user.save()
+        self.assertEqual(self.backend.get_user(self.user.pk).first_name, 'Changed')
+
+    def test_cached_user_is_dropped_again_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Changed'
+            self.user.save()
+            self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+            # A concurrent request re-caches the user before the change commits
+            cache_user(User.objects.get(pk=self.user.pk))
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'])
+    def test_uncached_user_is_loaded_from_the_primary(self):
+        with patch('users.backends.use_primary', wraps=use_primary) as primary:
+            self.backend.get_user(self.user.pk)
+            self.backend.get_user(self.user.pk)
+        primary.assert_called_once_with()
+
+    def test_deactivated_user_is_not_served(self):
+        self.backend.get_user(self.user.pk)
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    def test_password_hash_is_not_cached(self):
+        session_hash = self.user.get_session_auth_hash()
+        self.backend.get_user(self.user.pk)
+
+        user = cache.get(user_cache_key(self.user.pk))
+        self.assertNotIn('password', user.__dict__)
+        self.assertEqual(user.get_session_auth_hash(), session_hash)
+
+        user.first_name = 'Changed'
+        user.save()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('password'))
+
+    def test_permission_changes_invalidate_the_cached_user(self):
+        self.backend.get_user(self.user.pk)
+        self.user.user_permissions.add(self.revoke)
+        self.assertTrue(self.backend.get_user(self.user.pk).has_perm('users.can_revoke_access_key'))
+
+        self.revoke.user_set.clear()
+        self.assertFalse(self.backend.get_user(self.user.pk).has_perm('users.can_revoke_access_key'))
+
+    def test_group_permission_changes_invalidate_the_members(self):
+        group = Group.objects.create(name='Revokers')
+        self.user.groups.add(group)
+        self.backend.get_user(self.user.pk)
+
+        group.permissions.add(self.revoke)
+        self.assertTrue(self.backend.get_user(self.user.pk).has_perm('users.can_revoke_access_key'))
+
+
+class CachedSessionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', password='password', is_admin=True)
+
+    def test_sessions_are_not_stored_in_the_database(self):
+        self.client.login(username='admin', password='password')
+        self.assertFalse(Session.objects.exists())
+
+    def test_logged_in_user_is_loaded_without_queries(self):
+        self.client.login(username='admin', password='password')
+        response = self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            self.assertEqual(response.wsgi_request.user.pk, self.admin.pk)
+            self.assertTrue(response.wsgi_request.user.has_perm('users.can_revoke_access_key'))
@@ -0,0 +1,175 @@
+import time
+from smtplib import SMTPRecipientsRefused, SMTPServerDisconnected
+from unittest.mock import patch
+from celery.exceptions import SoftTimeLimitExceeded
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from users.emails import queue_email
+from users.models import EmailOutbox
+from users.tasks import deliver_outbox, send_outbox_emails
+
+
+class RefusingBackend(EmailBackend):
+    """
+    Refuses mail for addresses at refused.example.com.
+    """
+
+    def send_messages(self, messages):
+        for message in messages:
+            if any(to.endswith('@refused.example.com') for to in message.to):
+                raise SMTPRecipientsRefused({message.to[0]: (550, b'No such user')})
+        return super().send_messages(messages)
+
+
+class DroppingBackend(EmailBackend):
+    """
+    Records the outbox status of each email as it is sent, and drops the connection on the second.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.opened = False
+        self.statuses = []
+
+    def open(self):
+        self.opened = True
+
+    def send_messages(self, messages):
+        self.statuses.append(EmailOutbox.objects.get(recipient=messages[0].to[0]).status)
+        if len(self.statuses) == 2:
+            raise SMTPServerDisconnected('Connection unexpectedly closed')
+        return super().send_messages(messages)
+
+
+class InterruptingBackend(EmailBackend):
+    """
+    Takes `delay` seconds per email, and is interrupted by the soft time limit on the `interrupt_at`th.
+    """
+
+    def __init__(self, *args, delay=0, interrupt_at=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delay = delay
+        self.interrupt_at = interrupt_at
+        self.calls = 0
+
+    def send_messages(self, messages):
+        self.calls += 1
+        if self.calls == self.interrupt_at:
+            raise SoftTimeLimitExceeded()
+        time.sleep(self.delay)
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2, EMAIL_OUTBOX_RETRY_DELAY=60)
+class EmailOutboxTest(TestCase):
+    @patch('users.tasks.send_outbox_emails.delay')
+    def test_queue_email_kicks_delivery_on_commit(self, mock_delay):
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_email('Subject', 'Body', 'user@example.com')
+
+        self.assertEqual(EmailOutbox.objects.get().status, EmailOutbox.PENDING)
+        self.assertEqual(len(mail.outbox), 0)
+        mock_delay.assert_called_once_with()
+
+    def test_queue_email_dedupes_per_recipient(self):
+        queue_email('Subject', 'Body', 'user@example.com', dedupe_key='welcome')
+        queue_email('Subject', 'Body', 'user@example.com', dedupe_key='welcome')
+        queue_email('Subject', 'Body', 'other@example.com', dedupe_key='welcome')
+
+        self.assertEqual(EmailOutbox.objects.count(), 2)
+
+    def test_deliver_outbox_sends_in_batches(self):
+        for i in range(5):
+            queue_email(f'Subject {i}', 'Body', f'user{i}@example.com', html_body='<p>Body</p>')
+
+        result = deliver_outbox(batch_size=2)
+
+        self.assertEqual((result['sent'], result['batches']), (5, 3))
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].alternatives, [('<p>Body</p>', 'text/html')])
+        self.assertFalse(EmailOutbox.objects.exclude(status=EmailOutbox.SENT).exists())
+
+        # Sent emails are not delivered again
+        self.assertEqual(deliver_outbox()['sent'], 0)
+
+    def test_failed_email_is_retried_with_backoff_then_given_up(self):
+        queue_email('Subject', 'Body', 'user@refused.example.com')
+        queue_email('Subject', 'Body', 'user@example.com')
+        connection = RefusingBackend()
+
+        result = deliver_outbox(connection=connection)
+
+        self.assertEqual((result['sent'], result['retried']), (1, 1))
+        email = EmailOutbox.objects.get(recipient='user@refused.example.com')
+        self.assertEqual((email.status, email.attempts), (EmailOutbox.PENDING, 1))
+        self.assertGreater(email.next_attempt_at, timezone.now())
+
+        # Not due yet
+        self.assertEqual(deliver_outbox(connection=connection)['retried'], 0)
+
+        EmailOutbox.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(deliver_outbox(connection=connection)['failed'], 1)
+        email.refresh_from_db()
+        self.assertEqual(email.status, EmailOutbox.FAILED)
+        self.assertIn('No such user', email.last_error)
+
+    def test_idle_outbox_does_not_connect(self):
+        connection = DroppingBackend()
+
+        self.assertEqual(deliver_outbox(connection=connection)['batches'], 0)
+        self.assertFalse(connection.opened)
+
+    def test_dropped_connection_stops_the_batch(self):
+        for i in range(4):
+            queue_email(f'Subject {i}', 'Body', f'user{i}@example.com')
+        connection = DroppingBackend()
+
+        with self.assertRaises(SMTPServerDisconnected):
+            deliver_outbox(connection=connection)
+
+        # Emails are claimed while they are sent
+        self.assertEqual(connection.statuses, [EmailOutbox.SENDING] * 2)
+        outcomes = EmailOutbox.objects.order_by('pk').values_list('status', 'attempts')
+        self.assertEqual(list(outcomes), [
+            (EmailOutbox.SENT, 0), (EmailOutbox.PENDING, 1), (EmailOutbox.PENDING, 0), (EmailOutbox.PENDING, 0),
+        ])
+        self.assertEqual(EmailOutbox.objects.filter(status=EmailOutbox.PENDING, next_attempt_at__lte=timezone.now()).count(), 2)
+
+    def test_lapsed_claims_are_sent_again(self):
+        queue_email('Subject', 'Body', 'user@example.com')
+        EmailOutbox.objects.update(status=EmailOutbox.SENDING, next_attempt_at=timezone.now())
+
+        self.assertEqual(deliver_outbox()['sent'], 1)
+
+    def test_delivery_stops_when_the_time_budget_runs_out(self):
+        for i in range(3):
+            queue_email(f'Subject {i}', 'Body', f'user{i}@example.com')
+
+        result = deliver_outbox(connection=InterruptingBackend(delay=0.1), time_budget=0.05)
+
+        self.assertEqual(result['sent'], 1)
+        self.assertTrue(result['out_of_time'])
+        self.assertEqual(EmailOutbox.objects.filter(status=EmailOutbox.PENDING, attempts=0).count(), 2)
+
+    def test_soft_time_limit_propagates_after_recording_outcomes(self):
+        for i in range(3):
+            queue_email(f'Subject {i}', 'Body', f'user{i}@example.com')
+
+        with self.assertRaises(SoftTimeLimitExceeded):
+            deliver_outbox(connection=InterruptingBackend(interrupt_at=2))
+
+        outcomes = EmailOutbox.objects.order_by('pk').values_list('status', 'attempts')
+        self.assertEqual(list(outcomes), [(EmailOutbox.SENT, 0), (EmailOutbox.PENDING, 0), (EmailOutbox.PENDING, 0)])
+
+    @override_settings(EMAIL_TIMEOUT=10)
+    @patch('users.tasks.send_outbox_emails.delay')
+    def test_task_stops_before_its_soft_time_limit_and_continues(self, mock_delay):
+        drained = {'sent': 0, 'retried': 0, 'failed': 0, 'batches': 1, 'seconds': 90, 'out_of_time': True}
+        with patch.object(send_outbox_emails, 'soft_time_limit', 120), \
+                patch('users.tasks.deliver_outbox', return_value=drained) as mock_deliver:
+            send_outbox_emails.run()
+
+        mock_deliver.assert_called_once_with(time_budget=90)
+        mock_delay.assert_called_once_with()
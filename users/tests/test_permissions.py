@@ -1,6 +1,10 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
-from django.contrib.auth.models import Permission
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.db import connection
+from users.permissions import ROLE_GROUPS, RolePermissionResolver, resolver, user_roles
 
 class UserPermissionTest(TestCase):
     def setUp(self):
@@ -25,3 +29,47 @@ class UserPermissionTest(TestCase):
     def test_admin_permission(self):
         permission = Permission.objects.get(codename='can_revoke_access_key')
         self.assertTrue(self.admin.has_perm('users.can_revoke_access_key'))
+
+
+class RolePermissionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        resolver.invalidate()
+        self.addCleanup(resolver.invalidate)
+        self.User = get_user_model()
+
+    def test_registration_needs_no_permission_lookups(self):
+        with CaptureQueriesContext(connection) as queries:
+            user = self.User.objects.create_user(
+                username='new_personnel', password='password', is_school_personnel=True, email='new@example.com',
+            )
+        self.assertFalse(any('auth_permission' in query['sql'] for query in queries.captured_queries))
+        self.assertFalse(user.user_permissions.exists())
+        self.assertTrue(user.has_perm('users.can_purchase_access_key'))
+        self.assertFalse(user.has_perm('users.can_revoke_access_key'))
+
+    def test_permission_checks_need_no_queries(self):
+        admin = self.User.objects.create_user(username='admin', password='password', is_admin=True, email='admin@example.com')
+        admin.has_perm('users.can_revoke_access_key')
+        with self.assertNumQueries(0):
+            self.assertTrue(admin.has_perm('users.can_revoke_access_key'))
+
+    def test_role_group_changes_reach_every_process(self):
+        personnel = self.User.objects.create_user(
+            username='personnel', password='password', is_school_personnel=True, email='personnel@example.com',
+        )
+        group = Group.objects.get(name=ROLE_GROUPS['school_personnel'])
+        revoke = Permission.objects.get(codename='can_revoke_access_key')
+        self.assertFalse(resolver.permissions(['school_personnel']) & {'users.can_revoke_access_key'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            group.permissions.add(revoke)
+        self.assertIn('users.can_revoke_access_key', resolver.permissions(user_roles(personnel)))
+
+        # Another process notices the new version once its check interval has passed
+        other = RolePermissionResolver()
+        other.permissions(['school_personnel'])
+        with self.captureOnCommitCallbacks(execute=True):
+            group.permissions.remove(revoke)
+        with override_settings(ROLE_PERMISSIONS_CHECK_INTERVAL=0):
+            self.assertNotIn('users.can_revoke_access_key', other.permissions(['school_personnel']))
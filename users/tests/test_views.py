@@ -1,13 +1,16 @@
 from django.utils import timezone
-from django.test import TestCase, Client
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.core import mail
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 from users.tokens import account_activation_token
-from access_keys.models import School
+from access_keys.models import AccessKey, KeyLog, School
 from users.models import BillingInformation, User
+from users.tasks import deliver_outbox
 from unittest.mock import patch
 
 User = get_user_model()
@@ -89,6 +92,9 @@ class UserViewTests(TestCase):
         self.assertEqual(user_count, initial_user_count + 1)
         # self.assertEqual(User.objects.count(), 4) 
         self.assertFalse(User.objects.get(username='newuser').is_active)
+        # The verification email is queued, then delivered by the outbox worker
+        self.assertEqual(len(mail.outbox), 0)
+        deliver_outbox()
         self.assertEqual(len(mail.outbox), 1)
 
 
@@ -113,6 +119,9 @@ class UserViewTests(TestCase):
         self.assertTrue(User.objects.filter(username='newadmin').exists())
         self.assertRedirects(response, reverse('registration_pending'))
         self.assertFalse(User.objects.get(username='newadmin').is_active)
+        # The verification email is queued, then delivered by the outbox worker
+        self.assertEqual(len(mail.outbox), 0)
+        deliver_outbox()
         self.assertEqual(len(mail.outbox), 1)
 
     def tearDown(self):
@@ -255,4 +264,70 @@ class UserViewTests(TestCase):
         self.assertRedirects(response, reverse('profile'))
         self.school_personnel_user.refresh_from_db()
         self.assertEqual(self.school_personnel_user.first_name, 'New')
-        self.assertEqual(self.school_personnel_user.email, 'newname@example.com')
\ No newline at end of file
+        self.assertEqual(self.school_personnel_user.email, 'newname@example.com')
+
+
+@override_settings(ADMIN_DASHBOARD_PAGE_SIZE=5)
+class AdminDashboardPaginationTests(TestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username='adminuser',
+            email='admin@example.com',
+            password='password123',
+            is_admin=True,
+            first_name='Admin',
+            last_name='User',
+            staff_id='A001'
+        )
+        self.school = School.objects.create(name='Test School')
+        self.other_school = School.objects.create(name='Other School')
+        now = timezone.now()
+        keys = AccessKey.objects.bulk_create([
+            AccessKey(
+                key=f'KEY{i:02d}',
+                school=self.school if i % 2 else self.other_school,
+                status='expired' if i % 3 else 'revoked',
+                assigned_to=self.admin_user,
+                expiry_date=now,
+                price=100
+            )
+            for i in range(12)
+        ])
+        # procurement_date is auto_now_add, so spread the keys out after creation
+        for i, key in enumerate(keys):
+            AccessKey.objects.filter(pk=key.pk).update(procurement_date=now - timezone.timedelta(days=i))
+        KeyLog.objects.bulk_create([
+            KeyLog(action=f'Log {i}', user=self.admin_user, access_key=keys[i]) for i in range(12)
+        ])
+        self.client.login(username='adminuser', password='password123')
+
+    def test_keys_are_paginated_with_cursors(self):
+        response = self.client.get(reverse('admin_dashboard'))
+        page = response.context['access_keys']
+        self.assertEqual([key.key for key in page], ['KEY00', 'KEY01', 'KEY02', 'KEY03', 'KEY04'])
+        self.assertIsNone(response.context['keys_previous_url'])
+
+        response = self.client.get(reverse('admin_dashboard') + response.context['keys_next_url'])
+        page = response.context['access_keys']
+        self.assertEqual([key.key for key in page], ['KEY05', 'KEY06', 'KEY07', 'KEY08', 'KEY09'])
+
+        response = self.client.get(reverse('admin_dashboard') + response.context['keys_previous_url'])
+        self.assertEqual([key.key for key in response.context['access_keys']][0], 'KEY00')
+
+    def test_query_count_does_not_grow_with_rows(self):
+        with CaptureQueriesContext(connection) as small_page:
+            self.client.get(reverse('admin_dashboard'))
+        with override_settings(ADMIN_DASHBOARD_PAGE_SIZE=12):
+            with CaptureQueriesContext(connection) as large_page:
+                self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(len(small_page.captured_queries), len(large_page.captured_queries))
+
+    def test_filters_by_status_school_and_date(self):
+        response = self.client.get(reverse('admin_dashboard'), {
+            'status': 'expired',
+            'school': self.school.pk,
+            'date_from': (timezone.now() - timezone.timedelta(days=6)).date().isoformat(),
+        })
+        self.assertEqual([key.key for key in response.context['access_keys']], ['KEY01', 'KEY05'])
+        self.assertTrue(all(log.access_key.school_id == self.school.pk for log in response.context['key_logs']))
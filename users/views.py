@@ -1,22 +1,26 @@
 import logging
+from datetime import datetime, time, timedelta
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.contrib.auth.decorators import login_required
 from django.contrib.sites.shortcuts import get_current_site
 from django.utils.encoding import force_bytes, force_str
 from django.template.loader import render_to_string
 from .tokens import account_activation_token
-from django.core.mail import send_mail
+from django.db import transaction
 
 from django.shortcuts import render, redirect
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth import login as auth_login, logout
-from users.forms import ProfileUpdateForm, RegistrationForm, LoginForm, ProfileForm, UpdateBillingInformationForm
+from users.forms import AdminDashboardFilterForm, ProfileUpdateForm, RegistrationForm, LoginForm, ProfileForm, UpdateBillingInformationForm
 from users.helpers import user_passes_test_with_403, is_school_personnel, is_admin
 from users.contexts import common_context_data
+from users.emails import queue_email
+from users.pagination import keyset_paginate
 from users.models import BillingInformation, User
 from access_keys.models import AccessKey, KeyLog
 from django.contrib import messages
 from django.conf import settings
+from django.utils import timezone
 
 
 logger = logging.getLogger(__name__)
@@ -97,6 +101,9 @@ def admin_dashboard_view(request):
     """
     Renders the admin dashboard page for authenticated admin users.
 
+    Access keys and key logs are filtered by the query string (status, school and date range)
+    and paginated independently with keyset cursors, ADMIN_DASHBOARD_PAGE_SIZE rows at a time.
+
     Args:
         request: The HTTP request object.
 
@@ -109,18 +116,75 @@ def admin_dashboard_view(request):
         messages.error(request, 'Please complete your profile to access the admin dashboard.')
         return redirect('complete_profile')
 
-    access_keys = AccessKey.objects.order_by('-procurement_date')
-    key_logs = KeyLog.objects.order_by('-timestamp')
+    access_keys = AccessKey.objects.select_related('school')
+    key_logs = KeyLog.objects.select_related('user', 'school')
+
+    filter_form = AdminDashboardFilterForm(request.GET or None)
+    if filter_form.is_valid():
+        filters = filter_form.cleaned_data
+        if filters['status']:
+            access_keys = access_keys.filter(status=filters['status'])
+        if filters['school']:
+            access_keys = access_keys.filter(school=filters['school'])
+            key_logs = key_logs.filter(school=filters['school'])
+        if filters['date_from']:
+            start = timezone.make_aware(datetime.combine(filters['date_from'], time.min))
+            access_keys = access_keys.filter(procurement_date__gte=start)
+            key_logs = key_logs.filter(timestamp__gte=start)
+        if filters['date_to']:
+            end = timezone.make_aware(datetime.combine(filters['date_to'] + timedelta(days=1), time.min))
+            access_keys = access_keys.filter(procurement_date__lt=end)
+            key_logs = key_logs.filter(timestamp__lt=end)
+
+    page_size = settings.ADMIN_DASHBOARD_PAGE_SIZE
+    access_keys = keyset_paginate(
+        access_keys, 'procurement_date', page_size,
+        after=request.GET.get('keys_after'), before=request.GET.get('keys_before'),
+    )
+    key_logs = keyset_paginate(
+        key_logs, 'timestamp', page_size,
+        after=request.GET.get('logs_after'), before=request.GET.get('logs_before'),
+    )
     logger.info("User %s accessed admin dashboard.", user.username)
 
     context = common_context_data(request)
     context.update({
         'access_keys': access_keys,
         'key_logs': key_logs,
+        'filter_form': filter_form,
+        'keys_next_url': _page_url(request, 'keys', after=access_keys.next_cursor),
+        'keys_previous_url': _page_url(request, 'keys', before=access_keys.previous_cursor),
+        'logs_next_url': _page_url(request, 'logs', after=key_logs.next_cursor),
+        'logs_previous_url': _page_url(request, 'logs', before=key_logs.previous_cursor),
     })
     return render(request, 'users/admin_dashboard.html', context)
 
 
+def _page_url(request, table, after=None, before=None):
+    """
+    Builds the query string of an admin dashboard page, keeping the filters and the other table's cursor.
+
+    Args:
+        request: The HTTP request object.
+        table: The table being paginated ('keys' or 'logs').
+        after: The cursor of the older page, if any.
+        before: The cursor of the newer page, if any.
+
+    Returns:
+        str: The query string, or None if there is no such page.
+    """
+    if not after and not before:
+        return None
+    params = request.GET.copy()
+    params.pop(f'{table}_after', None)
+    params.pop(f'{table}_before', None)
+    if after:
+        params[f'{table}_after'] = after
+    else:
+        params[f'{table}_before'] = before
+    return f'?{params.urlencode()}'
+
+
 def registration_options_view(request):
     """
     Renders the registration options page, where users choose whether they are school personnel or admin.
@@ -161,9 +225,10 @@ def register_view(request, user_type):
                 user.is_school_personnel = True
             elif user_type == 'admin':
                 user.is_admin = True
-            user.save()
-            send_verification_email(request, user)
-            logger.info("Registration successful for user %s. Verification email sent.", user.username)
+            with transaction.atomic():
+                user.save()
+                send_verification_email(request, user)
+            logger.info("Registration successful for user %s. Verification email queued.", user.username)
             messages.success(request, 'Registration successful. Please confirm your email.')
             return redirect('registration_pending')
         else:
@@ -179,7 +244,7 @@ def register_view(request, user_type):
 
 def send_verification_email(request, user):
     """
-    This function sends a verification email to the newly registered user.
+    This function queues a verification email to the newly registered user in the email outbox.
 
     Args:
         request: The HTTP request object.
@@ -194,8 +259,8 @@ def send_verification_email(request, user):
         'token': account_activation_token.make_token(user),
     })
     to_email = user.email
-    send_mail(mail_subject, message, settings.DEFAULT_FROM_EMAIL, [to_email])
-    logger.info("Sent verification email to %s", to_email)
+    queue_email(mail_subject, message, to_email, dedupe_key=f'account-activation:{user.pk}')
+    logger.info("Queued verification email to %s", to_email)
 
 def activate(request, uidb64, token):
     """